@@ -6,8 +6,40 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 import ProcessInput
+import metrics
+import pipeline
+import tracing
 from credentials_helper import get_youtube_api_key
 
+try:
+    from config import YOUTUBE_API_URL
+except ImportError:
+    YOUTUBE_API_URL = None
+
+try:
+    from config import YOUTUBE_SEARCH_RESULTS, YOUTUBE_CANDIDATES
+except ImportError:
+    YOUTUBE_SEARCH_RESULTS = 10
+    YOUTUBE_CANDIDATES = 3
+
+def video_candidates(items, limit=YOUTUBE_CANDIDATES):
+    """
+    The videos of a search response to download from, in YouTube's relevance
+    order (channels and playlists in the results are skipped)
+
+    Args:
+        items (list): 'items' of a search.list response
+
+    Returns:
+        list: Up to limit (video_id, title) tuples, best first
+    """
+    videos = [
+        (item["id"]["videoId"], item["snippet"]["title"])
+        for item in items
+        if item["id"]["kind"] == "youtube#video" and item["id"].get("videoId")
+    ]
+    return videos[:limit]
+
 
 class CallYoutube:
 
@@ -25,50 +57,53 @@ class CallYoutube:
         if not api_key:
             raise ValueError("YouTube API key not available. Please check your credentials.")
         
+        # Alternative endpoint (e.g. the offline benchmark stub server)
+        api_url = os.getenv("YOUTUBE_API_URL") or YOUTUBE_API_URL
         self.youtube = build(
             self.YOUTUBE_API_SERVICE_NAME,
             self.YOUTUBE_API_VERSION,
             developerKey=api_key,
+            client_options={"api_endpoint": api_url} if api_url else None,
         )
 
     def search_youtube(self, artist, song) -> tuple:
-        """Search YouTube for a specific artist and song"""
-        url_list = []
+        """
+        Search YouTube for a specific artist and song
 
+        Returns:
+            tuple: (urls, artist, song) where urls are the ranked candidates, best first;
+                the downloader falls back to the next one if a video cannot be downloaded
+        """
         # Call the search.list method to retrieve results matching the specified query term.
-        search_response = (
-            self.youtube.search().list(q=f"{artist} - {song}", part="snippet").execute()
-        )
-        response_items = search_response.get("items", [])
-
-        for item in response_items:
-            if item["id"]["kind"] == "youtube#video":
-                # Print the title and video ID of each search result
-                title = item["snippet"]["title"]
-                video_id = item["id"].get("videoId")
-                if video_id:
-                    print(f"Title: {title}, Video ID: {video_id}")
-                    url = f"{self.YOUTUBE_URL_PREFIX}{video_id}"
-                    url_list.append(url)
-                    break
+        # A search costs the same quota however many results it returns
+        with metrics.timed("youtube_search"):
+            search_response = (
+                self.youtube.search().list(
+                    q=f"{artist} - {song}", part="snippet", maxResults=YOUTUBE_SEARCH_RESULTS
+                ).execute()
+            )
+        candidates = video_candidates(search_response.get("items", []))
+
+        if candidates:
+            # Print the title and video ID of the best result
+            title, video_id = candidates[0][1], candidates[0][0]
+            fallbacks = f" (+{len(candidates) - 1} fallback candidate(s))" if len(candidates) > 1 else ""
+            print(f"Title: {title}, Video ID: {video_id}{fallbacks}")
+        url_list = [f"{self.YOUTUBE_URL_PREFIX}{video_id}" for video_id, _ in candidates]
 
         return url_list, artist, song
     
-    def process_songs(self, download=True):
+    def confirm_songs(self):
         """
-        Process all songs in the search_dict and find YouTube URLs
+        List the songs in the search_dict and ask once for the entire batch
         
-        Args:
-            download (bool): Deprecated - downloading is now handled separately
-            
         Returns:
-            list: List of tuples (urls, artist, song_name, spotify_metadata)
+            bool: True if the user wants to go ahead
         """
         if not self.songs:
             print("No songs to process.")
-            return []
+            return False
         
-        # Ask once for the entire batch at the beginning
         print(f"\n📋 Ready to process {len(self.songs)} song(s):")
         for i, song_data in enumerate(self.songs, 1):
             if isinstance(song_data, str):
@@ -80,29 +115,36 @@ class CallYoutube:
         proceed = input(f"\nDo you want to download all {len(self.songs)} song(s)? (y/n): ").lower()
         if proceed != 'y' and proceed != 'yes':
             print("Download cancelled.")
-            return []
+            return False
         
         print(f"\n🚀 Starting batch download of {len(self.songs)} song(s)...")
+        return True
+    
+    def process_songs(self, download=True):
+        """
+        Process all songs in the search_dict and find YouTube URLs
+        
+        Args:
+            download (bool): Deprecated - downloading is now handled separately
+            
+        Returns:
+            list: List of tuples (urls, artist, song_name, spotify_metadata)
+        """
+        # Ask once for the entire batch at the beginning
+        if not self.confirm_songs():
+            return []
+        
         
         results = []
         print(f"\n🔍 Searching YouTube for {len(self.songs)} songs by {self.artist}...")
         
         for i, song_data in enumerate(self.songs, 1):
             # Handle both old string format and new metadata format
-            if isinstance(song_data, str):
-                song_name = song_data
-                spotify_metadata = {}
-            else:
-                song_name = song_data.get('name', song_data)
-                spotify_metadata = {
-                    'album': song_data.get('album'),
-                    'release_date': song_data.get('release_date'),
-                    'spotify_id': song_data.get('spotify_id'),
-                    'album_id': song_data.get('album_id')
-                }
+            _, song_name, spotify_metadata = pipeline.song_entry(song_data)
             
             print(f"\n📋 Processing song {i}/{len(self.songs)}: {song_name}")
-            urls, artist, _ = self.search_youtube(self.artist, song_name)
+            with tracing.track_context(f"{self.artist} - {song_name}", "track_search"):
+                urls, artist, _ = self.search_youtube(self.artist, song_name)
             results.append((urls, artist, song_name, spotify_metadata))
             
             if urls:
@@ -1,13 +1,81 @@
 from pprint import pprint
+import os
+import re
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 
 import InputHandler
+import cover_art
+import metrics
+import prefetch
+import title_normalizer
 from credentials_helper import get_spotify_credentials
 
+try:
+    from config import SPOTIFY_API_URL, SPOTIFY_TOKEN_URL
+except ImportError:
+    SPOTIFY_API_URL = None
+    SPOTIFY_TOKEN_URL = None
+
+
+# open.spotify.com/playlist/<id>, open.spotify.com/intl-de/album/<id>, spotify:playlist:<id>
+SPOTIFY_LINK_PATTERN = re.compile(r'(?:open\.spotify\.com/(?:intl-[\w-]+/)?|spotify:)(playlist|album)[/:]([0-9A-Za-z]{22})')
+
+# Maximum page sizes the Web API accepts
+PLAYLIST_PAGE_SIZE = 100
+ALBUM_PAGE_SIZE = 50
+
+# Fields of a playlist page that song_dict needs
+PLAYLIST_FIELDS = "items(track(id,name,type,duration_ms,is_local,artists(name),album(id,name,release_date,images))),next"
+
+
+def artist_search_strategies(artist_name):
+    """Spotify artist searches search_artists tries for a query, in order (stopping early on an exact match)"""
+    return [
+        f'artist:"{artist_name}"',  # Exact artist name match
+        f'artist:{artist_name}',    # Artist name match
+        f'"{artist_name}"',         # Quoted exact match
+        artist_name                 # Basic search as fallback
+    ]
+
+
+def song_dict(track, album, artist=None):
+    """
+    Song dict (the shape downloads take their metadata from) of a Spotify track
+    object and its album; artist is included when given
+    """
+    song = {'name': track['name']}
+    if artist:
+        song['artist'] = artist
+    song.update({
+        'album': album.get('name'),
+        'release_date': album.get('release_date', ''),
+        'album_id': album.get('id'),
+        'album_image': cover_art.pick_image(album.get('images')),
+        'spotify_id': track['id'],
+        'duration_ms': track.get('duration_ms')
+    })
+    return song
+
+
+def playlist_song(item):
+    """Song dict of a playlist item, or None for removed tracks, podcast episodes and local files"""
+    track = item.get("track")
+    # Nothing to search for without a track and an artist
+    if not track or track.get("type") != "track" or track.get("is_local") or not track.get("artists"):
+        return None
+    return song_dict(track, track.get("album") or {}, track['artists'][0]['name'])
+
+
+def album_song(track, album):
+    """Song dict of an album track (the track's own first artist, else the album's)"""
+    return song_dict(track, album, (track.get('artists') or album['artists'])[0]['name'])
+
 
 class CreateSongMenu:
     youtube_search_dict = {}
+    # Background lookups of the interactive menu (prefetch.Prefetcher); None = fetch when needed
+    prefetcher = None
     
     def __init__(self):
         # Initialize Spotify client safely
@@ -19,7 +87,14 @@ class CreateSongMenu:
             client_id=client_id,
             client_secret=client_secret
         )
+        # Alternative endpoints (e.g. the offline benchmark stub server)
+        token_url = os.getenv('SPOTIFY_TOKEN_URL') or SPOTIFY_TOKEN_URL
+        if token_url:
+            client_credentials_manager.OAUTH_TOKEN_URL = token_url
         self.sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+        api_url = os.getenv('SPOTIFY_API_URL') or SPOTIFY_API_URL
+        if api_url:
+            self.sp.prefix = api_url
 
     def call_spotify_api(self, artist_name, offset, limit):
         artist_results = self.sp.search(q="artist:" + artist_name, type="artist", limit=1)
@@ -82,14 +157,12 @@ class CreateSongMenu:
                     and album["artists"]
                     and album["artists"][0]["id"] == artist_id
                 ):
-                    # Create set of tracks for each record
-                    tracks = self.sp.album_tracks(album_id=album["id"])["items"]
-                    track_names = [track["name"] for track in tracks]
                     album_dict[album["id"]] = {
                         "id": album["id"],
                         "name": album["name"],
                         "release_date": album["release_date"],
-                        "tracks": track_names,
+                        "image": cover_art.pick_image(album.get("images")),
+                        "tracks": self._fetch_album_tracks(album["id"]),
                     }
             # pprint(album_dict)
 
@@ -125,19 +198,49 @@ class CreateSongMenu:
             return artist_data
             
         # If we have an ID, get albums directly
+        return {number: self.album_with_tracks(album) for number, album in self.get_album_list(artist_info).items()}
+
+    def get_album_list(self, artist_info):
+        """
+        Numbered albums of the artist for the album menu, oldest first, without
+        their tracks (album_with_tracks adds them to the albums picked)
+        """
+        return {number: album for number, album in enumerate(self.artist_album_list(artist_info["id"]), 1)}
+
+    def album_with_tracks(self, album):
+        """A get_album_list album with its tracks ({'id', 'name', 'duration_ms'}), as get_album_data returns it"""
+        return dict(album, tracks=self.album_track_list(album["id"]))
+
+    def artist_album_list(self, artist_id):
+        """Album dicts (without tracks) of the artist's albums, from the prefetcher when it has them"""
+        return self._lookup(("albums", artist_id), self._fetch_artist_albums, artist_id)
+
+    def album_track_list(self, album_id):
+        """Tracks of an album as {'id', 'name', 'duration_ms'} dicts, from the prefetcher when it has them"""
+        return self._lookup(("tracks", album_id), self._fetch_album_tracks, album_id)
+
+    def _fetch_artist_albums(self, artist_id):
+        """
+        Page through the artist's albums, keeping those the artist is the primary
+        artist of (compilations left out), sorted by release date
+        """
+        limit = 50
+        offset = 0
+        iteration = 1
         album_dict = {}
-        
+
         while True:
-            results = self.sp.artist_albums(
-                artist_id=artist_id,
-                limit=self.limit,
-                offset=self.offset,
-            )
+            with metrics.timed("spotify_album_list"):
+                results = self.sp.artist_albums(
+                    artist_id=artist_id,
+                    limit=limit,
+                    offset=offset,
+                )
 
             albums = results["items"]
             if not albums:
                 break
-                
+
             for album in albums:
                 # Ensure artist is the primary artist (first listed)
                 if (
@@ -145,48 +248,71 @@ class CreateSongMenu:
                     and album["artists"]
                     and album["artists"][0]["id"] == artist_id
                 ):
-                    # Create set of tracks for each record
-                    tracks = self.sp.album_tracks(album_id=album["id"])["items"]
-                    track_names = [track["name"] for track in tracks]
                     album_dict[album["id"]] = {
                         "id": album["id"],
                         "name": album["name"],
                         "release_date": album["release_date"],
-                        "tracks": track_names,
+                        "image": cover_art.pick_image(album.get("images")),
                     }
-            
+
             # If the api limit has been reached, call again with new offset
-            if (len(album_dict)) == (self.limit * self.iteration):
-                self.offset = self.limit * self.iteration
-                self.iteration += 1
+            if (len(album_dict)) == (limit * iteration):
+                offset = limit * iteration
+                iteration += 1
             else:
                 break
-                
-        sorted_dict = sorted(album_dict.items(), key=lambda x: x[1]["release_date"])
-        final_dict = {i + 1: value[1] for i, value in enumerate(sorted_dict)}
-        
-        return final_dict
-        
-    def select_artist(self, artist_name):
+
+        return sorted(album_dict.values(), key=lambda album: album["release_date"])
+
+    def _fetch_album_tracks(self, album_id):
+        with metrics.timed("spotify_album_tracks"):
+            tracks = self.sp.album_tracks(album_id=album_id)["items"]
+        # Only the fields the menus read (track objects also list every market they are available in)
+        return [{"id": track["id"], "name": track["name"], "duration_ms": track.get("duration_ms")} for track in tracks]
+
+    def _lookup(self, key, fetch, *args):
+        """fetch(*args), or its prefetched result when the interactive menu has a prefetcher"""
+        if self.prefetcher is None:
+            return fetch(*args)
+        return self.prefetcher.get(key, fetch, *args)
+
+    def prefetch_artists(self, artists):
+        """Start fetching the album lists of the top PREFETCH_ARTISTS artists of an artist menu"""
+        if self.prefetcher is None:
+            return
+        for artist in artists[:prefetch.PREFETCH_ARTISTS]:
+            self.prefetcher.submit(("albums", artist["id"]), self._fetch_artist_albums, artist["id"])
+
+    def prefetch_album_tracks(self, artist_info):
+        """Start fetching the artist's album list, then the albums' track lists in menu order"""
+        if self.prefetcher is None:
+            return
+        artist_id = artist_info["id"]
+        listing = self.prefetcher.submit(("albums", artist_id), self._fetch_artist_albums, artist_id)
+        self.prefetcher.then(listing, lambda albums: [
+            self.prefetcher.submit(("tracks", album["id"]), self._fetch_album_tracks, album["id"])
+            for album in albums
+        ])
+
+    def cancel_prefetch(self):
+        """Drop prefetches not started yet (the user moved on from the menu they were for)"""
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+
+    def search_artists(self, artist_name):
         """
-        Displays a list of artists matching the search query and lets the user select one.
-        Returns the selected artist name.
+        Search Spotify for artists matching the query.
+        Returns the relevant matches sorted by relevance score (best first).
         """
-        print(f"🔍 Searching for artist: {artist_name}")
-        
         # Try different search strategies for better relevance
         all_items = []
-        search_strategies = [
-            f'artist:"{artist_name}"',  # Exact artist name match
-            f'artist:{artist_name}',    # Artist name match
-            f'"{artist_name}"',         # Quoted exact match
-            artist_name                 # Basic search as fallback
-        ]
+        search_strategies = artist_search_strategies(artist_name)
         
         seen_ids = set()
         for strategy in search_strategies:
             try:
-                results = self.sp.search(q=strategy, type="artist", limit=10)
+                with metrics.timed("spotify_artist_search"):
+                    results = self.sp.search(q=strategy, type="artist", limit=10)
                 items = results["artists"]["items"]
                 
                 for item in items:
@@ -206,10 +332,27 @@ class CreateSongMenu:
                 continue
         
         # Sort by relevance score (combination of name similarity and popularity)
-        all_items = sorted(all_items, key=lambda x: self._calculate_relevance_score(x, artist_name), reverse=True)
+        return sorted(all_items, key=lambda x: self._calculate_relevance_score(x, artist_name), reverse=True)
+
+    def find_artist(self, artist_name):
+        """
+        Non-interactive artist lookup used by the job service.
+        Returns the most relevant artist as {"name", "id"} or None.
+        """
+        items = self.search_artists(artist_name)
+        if not items:
+            return None
+        return {"name": items[0]["name"], "id": items[0]["id"]}
+
+    def select_artist(self, artist_name):
+        """
+        Displays a list of artists matching the search query and lets the user select one.
+        Returns the selected artist name.
+        """
+        print(f"🔍 Searching for artist: {artist_name}")
         
         # Limit to top 10 most relevant results
-        items = all_items[:10]
+        items = self.search_artists(artist_name)[:10]
         
         if not items:
             print(f"No artist found for: {artist_name}")
@@ -219,6 +362,9 @@ class CreateSongMenu:
         for idx, artist in enumerate(items, 1):
             print(f"{idx}: {artist['name']} (Followers: {artist['followers']['total']}, Genres: {', '.join(artist['genres'])})")
 
+        # The likeliest picks' albums are fetched while the user reads the list
+        self.prefetch_artists(items)
+
         selection = InputHandler.InputHandler.select_from_list("Enter the number of the correct artist:", len(items))
         
         # If user wants to go back
@@ -253,12 +399,13 @@ class CreateSongMenu:
         limit = 50
         
         while True:
-            results = self.sp.artist_albums(
-                artist_id=artist_id,
-                album_type='album,single',
-                limit=limit,
-                offset=offset
-            )
+            with metrics.timed("spotify_album_list"):
+                results = self.sp.artist_albums(
+                    artist_id=artist_id,
+                    album_type='album,single',
+                    limit=limit,
+                    offset=offset
+                )
             
             albums = results['items']
             if not albums:
@@ -278,15 +425,17 @@ class CreateSongMenu:
         for album in all_albums:
             # Only include albums where this artist is the primary artist
             if album['artists'] and album['artists'][0]['id'] == artist_id:
-                album_tracks = self.sp.album_tracks(album['id'])
-                for track in album_tracks['items']:
+                for track in self.album_track_list(album['id']):
                     # Only add if we haven't seen this track ID before
                     if track['id'] not in track_ids:
                         all_tracks.append({
                             'name': track['name'],
                             'id': track['id'],
                             'album': album['name'],
-                            'release_date': album.get('release_date', '')
+                            'release_date': album.get('release_date', ''),
+                            'album_id': album['id'],
+                            'album_image': cover_art.pick_image(album.get('images')),
+                            'duration_ms': track.get('duration_ms')
                         })
                         track_ids.add(track['id'])
         
@@ -302,6 +451,160 @@ class CreateSongMenu:
         
         return songs_dict  # Return the songs dictionary for further processing
     
+    def iter_artist_releases(self, artist_id, group, page_size=ALBUM_PAGE_SIZE):
+        """
+        Yield the artist's releases of one album group ("album", "single", ...) in
+        the Web API's order (newest first), fetching a page only when it is reached
+
+        Yields:
+            dict: Spotify album objects, with 'album_group' set to group
+        """
+        offset = 0
+        while True:
+            with metrics.timed("spotify_album_list"):
+                page = self.sp.artist_albums(artist_id=artist_id, album_type=group, limit=page_size, offset=offset)
+            for album in page["items"]:
+                album.setdefault("album_group", group)
+                yield album
+            if not page["items"] or not page.get("next"):
+                return
+            offset += len(page["items"])
+
+    def find_album(self, artist_name, album_name):
+        """
+        Non-interactive album lookup.
+        Returns the best matching Spotify album object or None.
+        """
+        with metrics.timed("spotify_album_search"):
+            results = self.sp.search(q=f'album:"{album_name}" artist:"{artist_name}"', type="album", limit=5)
+        items = results["albums"]["items"]
+        if not items:
+            return None
+        # Prefer an exact (case-insensitive) title match over Spotify's ordering
+        for album in items:
+            if album["name"].lower() == album_name.lower():
+                return album
+        return items[0]
+
+    def get_album_songs(self, album):
+        """
+        Get the song list for a single album.
+
+        Args:
+            album (dict or str): Spotify album object or album ID
+
+        Returns:
+            list: Song dicts in the same shape ProcessInput builds for album downloads
+        """
+        with metrics.timed("spotify_album_tracks"):
+            if isinstance(album, str):
+                album = self.sp.album(album)
+            tracks = self.sp.album_tracks(album_id=album["id"])["items"]
+        return [song_dict(track, album) for track in tracks]
+
+    def find_track(self, artist_name, song_name):
+        """
+        Non-interactive track lookup.
+        Returns a song dict with Spotify metadata, or None if nothing matched.
+        """
+        with metrics.timed("spotify_track_search"):
+            results = self.sp.search(q=f'track:"{song_name}" artist:"{artist_name}"', type="track", limit=1)
+        items = results["tracks"]["items"]
+        if not items:
+            return None
+        return song_dict(items[0], items[0]['album'])
+
+    @staticmethod
+    def parse_spotify_link(text):
+        """
+        Recognize a Spotify playlist or album link/URI.
+
+        Returns:
+            tuple: (kind, spotify_id) with kind "playlist" or "album", or None
+        """
+        match = SPOTIFY_LINK_PATTERN.search(text.strip())
+        return (match.group(1), match.group(2)) if match else None
+
+    def get_collection_info(self, kind, spotify_id):
+        """
+        Name and track count of a playlist or album, without fetching its tracks.
+
+        Returns:
+            dict: {"kind", "id", "name", "total"}
+        """
+        with metrics.timed(f"spotify_{kind}_info"):
+            if kind == "playlist":
+                info = self.sp.playlist(spotify_id, fields="name,tracks.total")
+            else:
+                info = self.sp.album(spotify_id)
+        return {"kind": kind, "id": spotify_id, "name": info["name"], "total": info["tracks"]["total"]}
+
+    def iter_collection_songs(self, kind, spotify_id):
+        """Song dicts of a playlist or album, one API page at a time (see iter_playlist_songs)"""
+        if kind == "playlist":
+            return self.iter_playlist_songs(spotify_id)
+        return self.iter_album_songs(spotify_id)
+
+    def iter_playlist_songs(self, playlist_id):
+        """
+        Page through a playlist, yielding song dicts as each page arrives.
+        Only one page is held at a time, so memory does not grow with the playlist.
+        Unlike album songs, each dict carries its own 'artist'.
+        """
+        offset = 0
+        while True:
+            with metrics.timed("spotify_playlist_page"):
+                page = self.sp.playlist_items(
+                    playlist_id, limit=PLAYLIST_PAGE_SIZE, offset=offset, additional_types=("track",),
+                    fields=PLAYLIST_FIELDS,
+                )
+            for item in page["items"]:
+                song = playlist_song(item)
+                if song:
+                    yield song
+            if not page.get("next") or not page["items"]:
+                return
+            offset += len(page["items"])
+
+    def iter_album_songs(self, album_id):
+        """Page through an album's tracks, yielding song dicts (with 'artist') as each page arrives"""
+        with metrics.timed("spotify_album_info"):
+            album = self.sp.album(album_id)
+        offset = 0
+        while True:
+            with metrics.timed("spotify_album_tracks"):
+                page = self.sp.album_tracks(album_id=album_id, limit=ALBUM_PAGE_SIZE, offset=offset)
+            for track in page["items"]:
+                yield album_song(track, album)
+            if not page.get("next") or not page["items"]:
+                return
+            offset += len(page["items"])
+
+    @staticmethod
+    def songs_from_albums(albums):
+        """
+        Flatten album dicts (as returned by get_album_data) into a song list,
+        dropping duplicate song names across albums. Names that differ only in
+        case or punctuation count as duplicates since they map to the same file.
+        """
+        seen_songs = set()
+        songs = []
+        for album in albums:
+            for track in album["tracks"]:
+                key = title_normalizer.match_key(track["name"])
+                if key not in seen_songs:
+                    songs.append({
+                        'name': track["name"],
+                        'album': album['name'],
+                        'release_date': album['release_date'],
+                        'album_id': album['id'],
+                        'album_image': album.get('image'),
+                        'spotify_id': track.get('id'),
+                        'duration_ms': track.get('duration_ms')
+                    })
+                    seen_songs.add(key)
+        return songs
+
     def _is_relevant_match(self, artist_name, search_term):
         """
         Check if an artist name is relevant to the search term.
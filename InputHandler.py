@@ -1,6 +1,7 @@
 class InputHandler:
     def get_artist():
         print("\nAt any prompt, type 'back' or 'b' to return to the previous step.")
+        print("Paste a Spotify playlist or album link instead of an artist to download all of it.")
         return input("What artist would you like to search for? ")
 
     def album_or_song():
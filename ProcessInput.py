@@ -2,16 +2,47 @@ from pprint import pprint
 
 import CreateSongMenu
 import InputHandler
+import prefetch
 
 
 class process_input:
+    @staticmethod
+    def collection_search_dict(song_menu, kind, spotify_id):
+        """
+        Build a search_dict for a whole Spotify playlist or album. The songs are a
+        lazy iterator that fetches one API page at a time.
+        """
+        try:
+            collection = song_menu.get_collection_info(kind, spotify_id)
+        except Exception as e:
+            print(f"❌ Could not load Spotify {kind}: {e}")
+            return None
+        print(f"\n📀 {kind.capitalize()}: {collection['name']} ({collection['total']} tracks)")
+        return {
+            "artist": None,
+            "songs": song_menu.iter_collection_songs(kind, spotify_id),
+            "collection": collection,
+            "is_album_download": kind == "album"
+        }
+
     def start(self):
         try:
             song_menu = CreateSongMenu.CreateSongMenu()
         except ValueError as e:
             print(f"❌ Error initializing Spotify: {e}")
             return None
-        
+
+        # Spotify lookups for the next menu run while the user reads the current one
+        if prefetch.PREFETCH:
+            song_menu.prefetcher = prefetch.Prefetcher()
+        try:
+            return self.menu(song_menu)
+        finally:
+            if song_menu.prefetcher:
+                song_menu.prefetcher.close()
+
+    def menu(self, song_menu):
+        """The interactive menus, from the artist prompt to the search_dict of the selected songs"""
         while True:  # Main loop for the entire process
             # Get artist name input
             artist_input = InputHandler.InputHandler.get_artist()
@@ -21,14 +52,27 @@ class process_input:
                 print("Exiting program.")
                 return None
             
+            # A playlist or album link is downloaded as a whole, streamed page by page
+            link = song_menu.parse_spotify_link(artist_input)
+            if link:
+                search_dict = self.collection_search_dict(song_menu, *link)
+                if search_dict:
+                    return search_dict
+                continue
+            
             # Loop for artist selection
             while True:
                 # Select the correct artist from search results
                 artist_info = song_menu.select_artist(artist_input)
+                # The other candidates' prefetches are no longer needed
+                song_menu.cancel_prefetch()
                 
                 # If user selected "back", go back to artist input
                 if not artist_info:
                     break
+
+                # Its albums and their tracks are fetched while the user chooses
+                song_menu.prefetch_album_tracks(artist_info)
                 
                 # After artist is selected, ask for album or song preference
                 choice = InputHandler.InputHandler.album_or_song()
@@ -47,7 +91,7 @@ class process_input:
                     album_dict = {}
                     
                     # Add each item in the album data to the dictionary and print items
-                    for key, value in song_menu.get_album_data(artist_info).items():
+                    for key, value in song_menu.get_album_list(artist_info).items():
                         print(f"\t{key}: {value['name']}")
                         album_dict[key] = value
                     
@@ -71,26 +115,10 @@ class process_input:
                         print("No valid albums selected. Please try again.")
                         continue
                     
-                    # Create a list of selected songs with their album metadata
-                    selected_songs_with_metadata = []
-                    for value in album_dict.values():
-                        if value in album_list:
-                            for track_name in value["tracks"]:
-                                selected_songs_with_metadata.append({
-                                    'name': track_name,
-                                    'album': value['name'],
-                                    'release_date': value['release_date'],
-                                    'album_id': value['id']
-                                })
-                    
-                    # Remove duplicates based on song name
-                    seen_songs = set()
-                    unique_songs = []
-                    for song in selected_songs_with_metadata:
-                        if song['name'] not in seen_songs:
-                            unique_songs.append(song)
-                            seen_songs.add(song['name'])
-                    selected_songs_with_metadata = unique_songs
+                    # Create a list of selected songs with their album metadata (duplicates removed)
+                    selected_songs_with_metadata = song_menu.songs_from_albums(
+                        [song_menu.album_with_tracks(value) for value in album_dict.values() if value in album_list]
+                    )
                     
                     # Display the selected albums
                     print("Attempting to download the following albums:")
@@ -138,7 +166,10 @@ class process_input:
                                 'name': song_data['name'],
                                 'album': song_data['album'],
                                 'release_date': song_data['release_date'],
-                                'spotify_id': song_data['id']
+                                'album_id': song_data.get('album_id'),
+                                'album_image': song_data.get('album_image'),
+                                'spotify_id': song_data['id'],
+                                'duration_ms': song_data.get('duration_ms')
                             })
                     
                     if not selected_songs_with_metadata:
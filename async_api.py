@@ -0,0 +1,525 @@
+"""
+Asyncio API
+Async counterparts of the downloader, the YouTube search and the Spotify
+catalog iterators, for applications that run an event loop. Waiting on yt-dlp,
+ffmpeg and the web APIs takes no thread per track, so one loop can keep
+hundreds of tracks in flight. yt-dlp and ffmpeg run as asyncio subprocesses:
+cancelling a download's task kills them and removes its staging folder.
+HTTP goes through aiohttp (in requirements.txt), which is only needed here.
+
+Usage:
+    async with AsyncSpotify() as spotify, AsyncYouTube() as youtube:
+        downloader = AsyncDownloader()
+        async for song in spotify.iter_playlist_songs(playlist_id):
+            urls, artist, name = await youtube.search(song['artist'], song['name'])
+            ...
+            await downloader.download(urls, artist, name, song['album'], song)
+"""
+
+import asyncio
+import codecs
+import datetime
+import email.utils
+import os
+import subprocess
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import disk_space
+import metrics
+import staging
+from CallYoutube import CallYoutube, YOUTUBE_API_URL, YOUTUBE_SEARCH_RESULTS, video_candidates
+from CreateSongMenu import (ALBUM_PAGE_SIZE, PLAYLIST_FIELDS, PLAYLIST_PAGE_SIZE, SPOTIFY_API_URL,
+                            SPOTIFY_TOKEN_URL, album_song, playlist_song, song_dict)
+from credentials_helper import get_spotify_credentials, get_youtube_api_key
+from mp3_downloader import (RETRY_BACKOFF_SECONDS, DownloadCancelled, DownloadStalled, DownloadWatch, FallbackAttempts,
+                            MP3Downloader, RateChanged, StallClock, cancel_when, check_cancelled, folder_size,
+                            saved_summary, success_rate, ytdlp_restart)
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+try:
+    from config import ASYNC_MAX_DOWNLOADS, ASYNC_MAX_REQUESTS
+except ImportError:
+    ASYNC_MAX_DOWNLOADS = 100
+    ASYNC_MAX_REQUESTS = 20
+
+# Environment variables take precedence
+ASYNC_MAX_DOWNLOADS = int(os.getenv("ASYNC_MAX_DOWNLOADS", ASYNC_MAX_DOWNLOADS))
+ASYNC_MAX_REQUESTS = int(os.getenv("ASYNC_MAX_REQUESTS", ASYNC_MAX_REQUESTS))
+
+DEFAULT_SPOTIFY_API_URL = "https://api.spotify.com/v1/"
+DEFAULT_SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+DEFAULT_YOUTUBE_API_URL = "https://www.googleapis.com/"
+
+# Retries of a web API request answered with 429 or 5xx
+HTTP_RETRIES = 3
+
+
+class _AsyncClient:
+    """An aiohttp session (shared or owned) with at most max_requests requests in flight"""
+
+    def __init__(self, session=None, max_requests=ASYNC_MAX_REQUESTS):
+        if not AIOHTTP_AVAILABLE:
+            raise RuntimeError("The asyncio API needs aiohttp. Install with: pip install aiohttp")
+        self._session = session
+        self._owns_session = session is None
+        self._requests = asyncio.Semaphore(max_requests)
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _request_json(self, method, url, **kwargs):
+        """
+        Send a request and decode its JSON response. Rate limiting (429, honouring
+        Retry-After) and server errors are retried with backoff.
+
+        Raises:
+            aiohttp.ClientResponseError: For other error statuses, or when the retries run out
+        """
+        for attempt in range(HTTP_RETRIES + 1):
+            async with self._requests:
+                async with self.session.request(method, url, **kwargs) as response:
+                    retry = response.status == 429 or response.status >= 500
+                    if not retry or attempt == HTTP_RETRIES:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+                    delay = retry_after(response.headers.get("Retry-After"), RETRY_BACKOFF_SECONDS * 2 ** attempt)
+            metrics.RETRIES.inc(stage='http')
+            await asyncio.sleep(delay)
+
+
+class AsyncSpotify(_AsyncClient):
+    """
+    Spotify Web API client (client credentials flow) with async catalog
+    iterators yielding the same song dicts as CreateSongMenu's
+    """
+
+    def __init__(self, session=None, max_requests=ASYNC_MAX_REQUESTS):
+        super().__init__(session, max_requests)
+        self.client_id, self.client_secret = get_spotify_credentials()
+        if not self.client_id or not self.client_secret:
+            raise ValueError("Spotify credentials not available. Please check your credentials.")
+        # Alternative endpoints (e.g. the offline benchmark stub server)
+        self.api_url = os.getenv("SPOTIFY_API_URL") or SPOTIFY_API_URL or DEFAULT_SPOTIFY_API_URL
+        self.token_url = os.getenv("SPOTIFY_TOKEN_URL") or SPOTIFY_TOKEN_URL or DEFAULT_SPOTIFY_TOKEN_URL
+        self._token = None
+        self._token_expires = 0
+        self._token_lock = asyncio.Lock()
+
+    async def _access_token(self):
+        async with self._token_lock:
+            if self._token is None or time.monotonic() > self._token_expires:
+                token = await self._request_json(
+                    "POST", self.token_url, data={"grant_type": "client_credentials"},
+                    auth=aiohttp.BasicAuth(self.client_id, self.client_secret)
+                )
+                self._token = token["access_token"]
+                # Renewed a minute early, so no request is sent with an expiring token
+                self._token_expires = time.monotonic() + token.get("expires_in", 3600) - 60
+            return self._token
+
+    async def get(self, path, **params):
+        """GET an API path (relative to the API URL), e.g. get("albums/<id>")"""
+        headers = {"Authorization": f"Bearer {await self._access_token()}"}
+        return await self._request_json("GET", self.api_url.rstrip("/") + "/" + path, params=params,
+                                        headers=headers)
+
+    async def find_track(self, artist_name, song_name):
+        """Async CreateSongMenu.find_track: a song dict with Spotify metadata, or None"""
+        with metrics.timed("spotify_track_search"):
+            results = await self.get("search", q=f'track:"{song_name}" artist:"{artist_name}"', type="track", limit=1)
+        items = results["tracks"]["items"]
+        if not items:
+            return None
+        return song_dict(items[0], items[0]["album"])
+
+    async def get_collection_info(self, kind, spotify_id):
+        """Name and track count of a playlist or album: {"kind", "id", "name", "total"}"""
+        with metrics.timed(f"spotify_{kind}_info"):
+            if kind == "playlist":
+                info = await self.get(f"playlists/{spotify_id}", fields="name,tracks.total")
+            else:
+                info = await self.get(f"albums/{spotify_id}")
+        return {"kind": kind, "id": spotify_id, "name": info["name"], "total": info["tracks"]["total"]}
+
+    def iter_collection_songs(self, kind, spotify_id):
+        """Song dicts of a playlist or album as they arrive (async iterator)"""
+        if kind == "playlist":
+            return self.iter_playlist_songs(spotify_id)
+        return self.iter_album_songs(spotify_id)
+
+    async def iter_playlist_songs(self, playlist_id):
+        """
+        Page through a playlist, yielding song dicts (with 'artist'). The next page
+        is requested while the current one is consumed.
+        """
+        async for item in self._pages(f"playlists/{playlist_id}/tracks", PLAYLIST_PAGE_SIZE, "spotify_playlist_page",
+                                      fields=PLAYLIST_FIELDS, additional_types="track"):
+            song = playlist_song(item)
+            if song:
+                yield song
+
+    async def iter_album_songs(self, album_id):
+        """Page through an album's tracks, yielding song dicts (with 'artist')"""
+        with metrics.timed("spotify_album_info"):
+            album = await self.get(f"albums/{album_id}")
+        async for track in self._pages(f"albums/{album_id}/tracks", ALBUM_PAGE_SIZE, "spotify_album_tracks"):
+            yield album_song(track, album)
+
+    async def _pages(self, path, limit, stage, **params):
+        async def fetch(offset):
+            with metrics.timed(stage):
+                return await self.get(path, limit=limit, offset=offset, **params)
+
+        offset = 0
+        next_page = asyncio.ensure_future(fetch(offset))
+        try:
+            while next_page:
+                page = await next_page
+                offset += len(page["items"])
+                next_page = asyncio.ensure_future(fetch(offset)) if page.get("next") and page["items"] else None
+                for item in page["items"]:
+                    yield item
+        finally:
+            # The consumer stopped early (or was cancelled)
+            if next_page:
+                next_page.cancel()
+
+
+class AsyncYouTube(_AsyncClient):
+    """YouTube Data API search, with the candidates of CallYoutube.search_youtube"""
+
+    def __init__(self, session=None, max_requests=ASYNC_MAX_REQUESTS):
+        super().__init__(session, max_requests)
+        self.api_key = get_youtube_api_key()
+        if not self.api_key:
+            raise ValueError("YouTube API key not available. Please check your credentials.")
+        # Alternative endpoint (e.g. the offline benchmark stub server)
+        self.api_url = os.getenv("YOUTUBE_API_URL") or YOUTUBE_API_URL or DEFAULT_YOUTUBE_API_URL
+
+    async def search(self, artist, song):
+        """
+        Search YouTube for a specific artist and song
+
+        Returns:
+            tuple: (urls, artist, song) where urls are the ranked candidates, best first
+        """
+        with metrics.timed("youtube_search"):
+            response = await self._request_json(
+                "GET", self.api_url.rstrip("/") + "/youtube/v3/search",
+                params={"q": f"{artist} - {song}", "part": "snippet", "maxResults": YOUTUBE_SEARCH_RESULTS,
+                        "key": self.api_key}
+            )
+        candidates = video_candidates(response.get("items", []))
+        return [f"{CallYoutube.YOUTUBE_URL_PREFIX}{video_id}" for video_id, _ in candidates], artist, song
+
+
+class AsyncDownloader:
+    """
+    Runs an MP3Downloader's downloads on the event loop: same library, staging,
+    disk space gate, bandwidth budget, output profiles and tags, and the same
+    download steps (see mp3_downloader.TrackDownload), with yt-dlp and ffmpeg as
+    asyncio subprocesses. Other blocking work (tagging and moving finished files,
+    a chunked transfer's connections) runs in worker threads.
+
+    With the shared audio store enabled, downloads take its (thread and file)
+    locks, so they run through the downloader itself in a worker thread.
+    Cancelling a download kills its processes on either path.
+    """
+
+    def __init__(self, downloader=None, max_downloads=ASYNC_MAX_DOWNLOADS):
+        """
+        Args:
+            downloader (MP3Downloader, optional): Configured downloader (default: a new one)
+            max_downloads (int): yt-dlp/ffmpeg processes running at once; further downloads wait
+        """
+        self.downloader = downloader or MP3Downloader()
+        self._slots = asyncio.Semaphore(max_downloads)
+        # Each download's fixed rate is at most an even split of the budget between them
+        self.downloader.bandwidth.set_slots(max_downloads)
+
+    async def download(self, youtube_urls, artist_name=None, song_name=None, album_name=None,
+                       spotify_metadata=None, stats=None, connections=None):
+        """
+        Async download_with_fallback: download a track from the first of its ranked
+        candidates that works, retrying transient failures with backoff
+
+        Args:
+            youtube_urls (str or list): A URL or candidate URLs, best first
+            artist_name, song_name, album_name (str, optional): As for MP3Downloader.download_mp3
+            spotify_metadata (dict, optional): Cached Spotify metadata; None tags from YouTube instead
+            stats (dict, optional): Its "retries" and "fallbacks" counts, and the "disk_saved_bytes"
+                of auto quality, are increased
+            connections (int, optional): Connections for a large source (default: the downloader's)
+
+        Returns:
+            str: Path to the downloaded file or None if every candidate failed
+        """
+        youtube_urls = [youtube_urls] if isinstance(youtube_urls, str) else list(youtube_urls)
+        attempts = FallbackAttempts(self.downloader, youtube_urls, artist_name, song_name, album_name,
+                                    spotify_metadata, stats, connections)
+        for track in attempts:
+            await asyncio.sleep(attempts.delay)
+            file_path = await self.download_track(track)
+            if file_path:
+                return attempts.succeeded(track, file_path)
+        return None
+
+    async def download_many(self, items):
+        """
+        Download tracks concurrently (at most max_downloads at a time), then write album gain
+
+        Args:
+            items (list): Tuples (urls, artist, song, album, spotify_metadata) as for
+                MP3Downloader.download_multiple_with_metadata
+
+        Returns:
+            list: Downloaded file paths
+
+        Raises:
+            disk_space.BatchTooLarge: When the volumes cannot hold the batch
+        """
+        self.downloader.check_batch_space([disk_space.duration_of(item[4]) for item in items])
+        stats = {}
+        results = await asyncio.gather(*(self.download(*item, stats=stats) for item in items))
+        downloaded_files = [path for path in results if path]
+        await asyncio.to_thread(self.downloader.write_album_gain)
+        print(f"\n🎉 Download complete! {len(downloaded_files)}/{len(items)} files downloaded successfully "
+              f"({success_rate(len(downloaded_files), len(items))})")
+        if saved_summary(stats):
+            print(saved_summary(stats))
+        return downloaded_files
+
+    async def download_track(self, track):
+        """
+        Async MP3Downloader.download_track: one download attempt
+
+        Returns:
+            str: Path to the downloaded file or None if it failed (track.reason says why)
+        """
+        async with self._slots:
+            if track.uses_store:
+                return await self._in_thread(self.downloader.download_track, track)
+            try:
+                if not track.start():
+                    return None
+                async with self._staged_download(track) as staging_folder:
+                    return await self._run_steps(track.steps(staging_folder))
+            except DownloadCancelled:
+                raise
+            except Exception as e:
+                return track.error(e)
+
+    async def _run_steps(self, steps):
+        """
+        Async MP3Downloader.run_steps: yt-dlp and ffmpeg run as asyncio subprocesses,
+        any other step in a worker thread
+        """
+        d = self.downloader
+        on_loop = {d.run_ytdlp: self._run_ytdlp, d.run_encode: self._run_encode, d.run_extraction: self._run_extraction}
+        result = None
+        try:
+            while True:
+                try:
+                    function, *args = steps.send(result)
+                except StopIteration as done:
+                    return done.value
+                if function in on_loop:
+                    result = await on_loop[function](*args)
+                else:
+                    result = await self._in_thread(function, *args)
+        finally:
+            steps.close()
+
+    async def _in_thread(self, function, *args):
+        """
+        function(*args) in a worker thread. Cancelling the task stops the downloads
+        it runs (their processes are killed, see cancel_when) and waits for it to
+        return, so it has let go of its staging folder before the task ends.
+        """
+        cancelled = threading.Event()
+
+        def run():
+            with cancel_when(cancelled.is_set):
+                return function(*args)
+
+        call = asyncio.ensure_future(asyncio.to_thread(run))
+        try:
+            return await asyncio.shield(call)
+        except asyncio.CancelledError:
+            cancelled.set()
+            await asyncio.wait({call})
+            if not call.cancelled():
+                # Retrieved, so it is not logged as never retrieved (DownloadCancelled, most likely)
+                call.exception()
+            raise
+
+    @asynccontextmanager
+    async def _staged_download(self, track):
+        """A private staging folder for a track's download, once the disks have room for it"""
+        gate = self.downloader.disk_space
+        needs = gate.needs(*disk_space.estimate_track(track.duration_seconds, gate.quality))
+        paused_at = None
+        # Polled rather than waited on, so waiting for space blocks no thread
+        while True:
+            short = gate.try_reserve(needs)
+            if short is None:
+                break
+            if paused_at is None:
+                paused_at = time.monotonic()
+                print(gate.pause_message(short, track.label))
+            await asyncio.sleep(gate.poll_seconds)
+        if paused_at is not None:
+            print(f"▶️  Disk space available, resuming after {time.monotonic() - paused_at:.0f}s")
+        try:
+            with staging.staging_dir(self.downloader.staging_root) as staging_folder:
+                yield staging_folder
+        finally:
+            gate.release(needs)
+
+    async def _run_ytdlp(self, cmd, label=None, watch_folder=None):
+        """Async MP3Downloader.run_ytdlp"""
+        d = self.downloader
+        with d.bandwidth.fixed_download() as reservation:
+            attempt = 1
+            while True:
+                try:
+                    # Progress is listed in active_downloads under this task
+                    with DownloadWatch(d, label, reservation.rate, id(asyncio.current_task())) as watch:
+                        result = await self._monitor(d.limit_rate(cmd, watch.rate_limit), watch.on_line, watch_folder,
+                                                     interrupt=watch.rerate_check(reservation))
+                        watch.finish(result.returncode)
+                        return result
+                except (RateChanged, DownloadStalled) as e:
+                    attempt = ytdlp_restart(e, attempt, reservation)
+
+    async def _run_encode(self, cmd, watch_folder):
+        """Async MP3Downloader.run_encode"""
+        with metrics.timed('transcode') as stage:
+            result = await self._monitor(cmd, lambda stream, line: False, watch_folder)
+            if result.returncode != 0:
+                stage.mark_failed()
+        return result
+
+    async def _run_extraction(self, cmd):
+        """Async MP3Downloader.run_extraction"""
+        return await self._monitor(cmd, lambda stream, line: True)
+
+    async def _monitor(self, cmd, on_line, watch_folder=None, interrupt=None):
+        """
+        Async MP3Downloader._monitor: run cmd as a subprocess, handing each output
+        line to on_line(stream_name, line), which returns True when it shows progress
+        (interrupt, if given, is called about once a second and may raise to stop it)
+
+        The process is killed if this is cancelled or raises.
+
+        Raises:
+            DownloadStalled: After STALL_TIMEOUT_SECONDS without progress
+            DownloadCancelled: When the download's cancel check fires (see mp3_downloader.cancel_when)
+        """
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE)
+        lines = asyncio.Queue()
+        readers = [
+            asyncio.ensure_future(_read_lines(process.stdout, 'stdout', lines)),
+            asyncio.ensure_future(_read_lines(process.stderr, 'stderr', lines)),
+        ]
+        stdout_lines, stderr_lines = [], []
+        open_streams = 2
+        # The watch folder is scanned in a thread: os.scandir would block the event loop
+        stall = StallClock(watch_folder, initial_size=await asyncio.to_thread(folder_size, watch_folder))
+        try:
+            while open_streams:
+                try:
+                    name, line = await asyncio.wait_for(lines.get(), 1)
+                except asyncio.TimeoutError:
+                    name = line = None
+                if name and line is None:
+                    open_streams -= 1
+                elif line is not None:
+                    (stderr_lines if name == 'stderr' else stdout_lines).append(line)
+                    if on_line(name, line):
+                        stall.progress()
+                if stall.scan_due():
+                    stall.observe(await asyncio.to_thread(folder_size, watch_folder))
+                stall.check()
+                check_cancelled()
+                if interrupt:
+                    interrupt()
+            returncode = await process.wait()
+        except BaseException:
+            if process.returncode is None:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+            # Reaped even when cancelled, so no zombie is left behind
+            await asyncio.shield(process.wait())
+            raise
+        finally:
+            for reader in readers:
+                reader.cancel()
+
+        return subprocess.CompletedProcess(cmd, returncode, ''.join(stdout_lines), ''.join(stderr_lines))
+
+
+def retry_after(value, default):
+    """
+    Seconds to wait from a Retry-After header: delay-seconds or an HTTP-date
+    (RFC 9110), or default when it is missing or cannot be parsed
+    """
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+
+async def _read_lines(stream, name, lines):
+    """
+    Queue (name, line) for each line of a subprocess stream, then (name, None).
+    Like the text mode pipes of the sync monitor, \\r also ends a line (ffmpeg's
+    progress), so a single line never grows without bound.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    while True:
+        chunk = await stream.read(65536)
+        text = pending + decoder.decode(chunk, final=not chunk)
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        *complete, pending = text.split('\n')
+        for line in complete:
+            await lines.put((name, line + '\n'))
+        if not chunk:
+            break
+    if pending:
+        await lines.put((name, pending))
+    await lines.put((name, None))
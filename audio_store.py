@@ -0,0 +1,242 @@
+"""
+Content-addressed audio store shared between libraries
+Each encoded file is stored once under a key of YouTube video ID + format +
+quality. A library's <Artist>/<Artist> - <Song>.mp3 is a hardlink into the store
+(a reflink or copy when hardlinks are not possible), so users and containers that
+download the same track share one download, one encode and one copy on disk.
+
+Tags are applied per view: every distinct set of ID3 tags for an object is
+stored once as a tagged variant, and each view links to the variant with its
+tags. Views with the same tags (the usual case, since they come from the same
+Spotify metadata) share one file.
+
+Layout:
+    <store>/<key[:2]>/<key>/audio.mp3       untagged download (moved in from staging when
+                                            finished), until the first variant exists
+    <store>/<key[:2]>/<key>/<digest>.mp3    tagged variants, digest = hash of the ID3 frames
+"""
+
+import errno
+import hashlib
+import os
+import re
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+
+from staging import move_into_place
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, threads are still serialized
+    fcntl = None
+
+try:
+    from mutagen.id3 import ID3, ID3NoHeaderError
+    from mutagen.id3 import delete as delete_id3
+    ID3_AVAILABLE = True
+except ImportError:
+    ID3_AVAILABLE = False
+
+try:
+    from config import AUDIO_STORE_DIR
+except ImportError:
+    AUDIO_STORE_DIR = None
+
+# Environment variable takes precedence (e.g. a shared volume in each container)
+AUDIO_STORE_DIR = os.getenv("AUDIO_STORE_DIR") or AUDIO_STORE_DIR
+
+# Linux FICLONE ioctl: copy-on-write clone on btrfs, XFS and other reflink filesystems
+FICLONE = 0x40049409
+
+DOWNLOAD_NAME = "audio"
+
+# Errors from os.link that mean "hardlinks are not possible here", not "something broke"
+_NO_HARDLINK_ERRORS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def clone_file(source, destination):
+    """Copy a file as a reflink when the filesystem supports it, otherwise as a normal copy"""
+    if fcntl is not None and hasattr(fcntl, "ioctl"):
+        try:
+            with open(source, "rb") as src, open(destination, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return "reflink"
+        except OSError:
+            pass
+    shutil.copyfile(source, destination)
+    return "copy"
+
+
+def tag_digest(file_path):
+    """Short hash of a file's ID3 frames; files whose tags hash alike differ in nothing else"""
+    digest = hashlib.sha1()
+    if ID3_AVAILABLE:
+        try:
+            tags = ID3(file_path)
+        except ID3NoHeaderError:
+            tags = {}
+        for frame in sorted(tags.values(), key=lambda frame: frame.HashKey):
+            digest.update(frame.HashKey.encode("utf-8"))
+            digest.update(frame.pprint().encode("utf-8"))
+            # pprint() only gives the size of binary frames such as APIC cover art
+            if isinstance(getattr(frame, "data", None), bytes):
+                digest.update(frame.data)
+    return digest.hexdigest()[:16]
+
+
+class AudioStore:
+    """
+    Shared, content-addressed store of encoded audio.
+
+    Safe to use from several threads and, where fcntl is available, from several
+    processes or containers sharing the store volume.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._thread_locks = {}
+        self._thread_locks_lock = threading.Lock()
+        self._warned_no_hardlinks = False
+
+    @staticmethod
+    def key(video_id, audio_format, quality):
+        """Store key: video ID + output format + quality, e.g. dQw4w9WgXcQ-mp3-192K"""
+        return re.sub(r'[^0-9A-Za-z_-]', '', f"{video_id}-{audio_format}-{quality}")
+
+    def object_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def add(self, key, staged_file):
+        """Move a finished download into the store (call with the key locked)"""
+        folder = self.object_dir(key)
+        os.makedirs(folder, exist_ok=True)
+        return move_into_place(staged_file, os.path.join(folder, f"{DOWNLOAD_NAME}.mp3"))
+
+    def source(self, key):
+        """Any complete file of the object (variants and the download share their audio), or None"""
+        folder = self.object_dir(key)
+        try:
+            names = sorted(name for name in os.listdir(folder) if name.endswith(".mp3") and not name.startswith("."))
+        except FileNotFoundError:
+            return None
+        return os.path.join(folder, names[0]) if names else None
+
+    def has(self, key):
+        return self.source(key) is not None
+
+    @contextmanager
+    def locked(self, key):
+        """Exclusive lock on one object, across threads and (with fcntl) processes"""
+        with self._thread_locks_lock:
+            thread_lock = self._thread_locks.setdefault(key, threading.Lock())
+        with thread_lock:
+            folder = self.object_dir(key)
+            os.makedirs(folder, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(folder, ".lock"), "a+") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def link_view(self, key, view_path, tag=None):
+        """
+        Create (or replace) a library file as a view of a stored object
+
+        Args:
+            key (str): Store key of an object that exists
+            view_path (str): Library path, e.g. <Artist>/<Artist> - <Song>.mp3
+            tag (callable, optional): Applies this view's ID3 tags to the file path it is given
+
+        Returns:
+            str: view_path
+        """
+        with self.locked(key):
+            source = self.source(key)
+            if source is None:
+                raise FileNotFoundError(f"{key} is not in the audio store")
+            folder = self.object_dir(key)
+
+            # Tag a private copy, then keep it only if no variant has these tags yet
+            scratch = os.path.join(folder, f".view-{uuid.uuid4().hex}.mp3")
+            try:
+                clone_file(source, scratch)
+                if ID3_AVAILABLE:
+                    delete_id3(scratch)
+                if tag:
+                    tag(scratch)
+                variant = os.path.join(folder, f"{tag_digest(scratch)}.mp3")
+                if os.path.exists(variant):
+                    os.remove(scratch)
+                else:
+                    os.replace(scratch, variant)
+            finally:
+                if os.path.exists(scratch):
+                    os.remove(scratch)
+
+            # The untagged download is not needed once a tagged variant holds its audio
+            download = os.path.join(folder, f"{DOWNLOAD_NAME}.mp3")
+            if os.path.exists(download) and download != variant:
+                os.remove(download)
+
+            previous = self._linked_variant(folder, view_path)
+            self._link(variant, view_path)
+            # A variant no view links to any more (the view was re-tagged) is dropped
+            if previous and previous != variant and os.stat(previous).st_nlink == 1:
+                os.remove(previous)
+        return view_path
+
+    @staticmethod
+    def _linked_variant(folder, view_path):
+        """The variant in folder that view_path is a hardlink of, or None"""
+        try:
+            view = os.stat(view_path)
+        except FileNotFoundError:
+            return None
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if name.endswith(".mp3") and os.path.samestat(view, os.stat(path)):
+                return path
+        return None
+
+    def _link(self, variant, view_path):
+        # Link under a temporary name, then rename over any previous view atomically
+        temporary = f"{view_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.link(variant, temporary)
+        except OSError as e:
+            if e.errno not in _NO_HARDLINK_ERRORS:
+                raise
+            if not self._warned_no_hardlinks:
+                self._warned_no_hardlinks = True
+                print("⚠️  Audio store and library are on different filesystems (or hardlinks are not "
+                      "supported); library files will be copies")
+            clone_file(variant, temporary)
+        os.replace(temporary, view_path)
+
+    def usage(self):
+        """
+        Returns:
+            dict: objects, files and bytes actually used by the store
+        """
+        objects = files = size = 0
+        for folder, dirs, names in os.walk(self.root):
+            mp3s = [name for name in names if name.endswith(".mp3") and not name.startswith(".")]
+            if mp3s:
+                objects += 1
+            for name in mp3s:
+                files += 1
+                size += os.path.getsize(os.path.join(folder, name))
+        return {"objects": objects, "files": files, "bytes": size}
+
+
+def open_store(store_dir=None):
+    """The configured AudioStore, or None when the store is disabled"""
+    store_dir = store_dir or AUDIO_STORE_DIR
+    return AudioStore(os.path.expanduser(store_dir)) if store_dir else None
@@ -0,0 +1,175 @@
+"""
+Global bandwidth budget
+One budget (bytes/second) is shared by every download in flight, and their
+rates never add up to more than it. The budget can be changed while the job
+service runs (PUT /bandwidth).
+
+A yt-dlp process runs at the --limit-rate it was started with, so it reserves
+a fixed rate: an even split of the budget between the download slots (or the
+downloads in flight, if there are more), limited to what other fixed rates
+leave. When the budget changes, every reservation is re-rated and the
+downloader restarts those yt-dlp processes at their new rate (they resume
+their partial download). Chunked transfers adapt instead: they read their
+share of what the fixed rates leave before every range.
+"""
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    from config import BANDWIDTH_LIMIT
+except ImportError:
+    BANDWIDTH_LIMIT = None
+
+# Environment variable takes precedence (e.g. per container)
+BANDWIDTH_LIMIT = os.getenv("BANDWIDTH_LIMIT") or BANDWIDTH_LIMIT
+
+# yt-dlp rejects rates below this, and slower downloads would stall anyway
+MIN_RATE = 1024
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(value):
+    """
+    Bytes per second from a number or a yt-dlp style rate ("500K", "2.5M")
+
+    Returns:
+        int: Bytes per second, or None for no limit (None, 0, "" or "none")
+
+    Raises:
+        ValueError: If the value is not a rate
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) or None
+    text = str(value).strip()
+    if text.lower() in ("0", "none", "off", "unlimited"):
+        return None
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMGkmg]?)(?:i?B)?(?:/s)?', text)
+    if not match:
+        raise ValueError(f"Not a bandwidth rate: {value!r} (use bytes/second, or e.g. 500K, 2M)")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()]) or None
+
+
+def format_rate(bytes_per_second):
+    """Human readable rate, e.g. 1.50 MiB/s"""
+    if not bytes_per_second:
+        return "unlimited"
+    if bytes_per_second >= 1024 ** 2:
+        return f"{bytes_per_second / 1024 ** 2:.2f} MiB/s"
+    return f"{bytes_per_second / 1024:.0f} KiB/s"
+
+
+class Reservation:
+    """
+    Rate of a fixed-rate download (see BandwidthBudget.fixed_download). rate is
+    changed by the budget when its limit changes (None = unlimited).
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+
+
+class BandwidthBudget:
+    """
+    Shares one bandwidth limit between concurrent downloads (thread-safe)
+    """
+
+    def __init__(self, limit=None, slots=1):
+        """
+        Args:
+            limit: Bytes/second or a rate string (see parse_rate). If None, uses BANDWIDTH_LIMIT
+            slots (int): Downloads that may run at once (e.g. the job service's workers)
+        """
+        self._lock = threading.Lock()
+        self._limit = parse_rate(BANDWIDTH_LIMIT if limit is None else limit)
+        self._slots = max(1, slots)
+        self._adaptive = 0
+        self._fixed = []
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def set_limit(self, limit):
+        """
+        Change the budget: fixed-rate downloads are re-rated to an even split of it,
+        chunked transfers apply their new share from their next range
+        """
+        limit = parse_rate(limit)
+        with self._lock:
+            self._limit = limit
+            for reservation in self._fixed:
+                reservation.rate = self._even_share()
+        return limit
+
+    def set_slots(self, slots):
+        """Downloads that may run at once; each fixed-rate download gets at most limit / slots"""
+        with self._lock:
+            self._slots = max(1, slots)
+
+    def _even_share(self):
+        # Called with _lock held
+        if not self._limit:
+            return None
+        return max(MIN_RATE, self._limit // max(self._slots, self._adaptive + len(self._fixed)))
+
+    def _reserved(self):
+        # Called with _lock held
+        return sum(reservation.rate for reservation in self._fixed if reservation.rate)
+
+    def share(self):
+        """Rate each chunked transfer in flight may use now: what fixed rates leave, split evenly (None = unlimited)"""
+        with self._lock:
+            if not self._limit:
+                return None
+            return max(MIN_RATE, (self._limit - self._reserved()) // max(self._adaptive, 1))
+
+    @contextmanager
+    def download(self):
+        """
+        Count a download that adapts to its share (a chunked transfer) as in flight while it runs
+
+        Yields:
+            int: Its share when it starts in bytes/second, or None for no limit
+                (call share() again for the current one)
+        """
+        with self._lock:
+            self._adaptive += 1
+        try:
+            yield self.share()
+        finally:
+            with self._lock:
+                self._adaptive -= 1
+
+    @contextmanager
+    def fixed_download(self):
+        """
+        Reserve a rate for a download that cannot change it while it runs (a yt-dlp
+        process): an even split of the budget, at most what other reservations leave
+
+        Yields:
+            Reservation: Its rate; when set_limit changes it, the download should be
+                restarted at the new rate
+        """
+        with self._lock:
+            reservation = Reservation(None)
+            # Counted in the even split before its rate is reserved
+            self._fixed.append(reservation)
+            if self._limit:
+                reservation.rate = max(MIN_RATE, min(self._even_share(), self._limit - self._reserved()))
+        try:
+            yield reservation
+        finally:
+            with self._lock:
+                self._fixed.remove(reservation)
+
+    def status(self):
+        with self._lock:
+            return {"limit_bytes_per_second": self._limit, "slots": self._slots,
+                    "active": self._adaptive + len(self._fixed),
+                    "reserved_bytes_per_second": self._reserved() if self._limit else None}
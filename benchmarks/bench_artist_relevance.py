@@ -0,0 +1,235 @@
+"""
+Artist relevance benchmark
+Replays Spotify artist search responses for labelled queries through
+CreateSongMenu.search_artists (the same searches, _is_relevant_match filter and
+_calculate_relevance_score ranking as the interactive menu and the job service)
+and reports how often the intended artist comes first (top-1) or among the
+first three (top-3), per kind of query, with the scoring latency per query.
+Ranking decides how often users have to search again, so changes to it can be
+checked here for quality and speed before they ship.
+
+fixtures/artist_search_queries.json holds the labelled queries (short names,
+diacritics, "The ..." band names, collaborations, everyday names in any case)
+and the artist search response of each of the query's searches. The bundled
+responses were generated offline in the shape of Web API responses (trimmed to
+the fields the ranking reads) from a catalog of artists and look-alikes; with
+Spotify credentials, --record replaces them with live responses for the same
+queries.
+
+Usage:
+    python benchmarks/bench_artist_relevance.py
+    python benchmarks/bench_artist_relevance.py --misses --baseline benchmarks/results/<earlier>.json
+    python benchmarks/bench_artist_relevance.py --record    # needs Spotify credentials
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from CreateSongMenu import CreateSongMenu, artist_search_strategies  # noqa: E402
+
+FIXTURE = os.path.join(BENCH_DIR, "fixtures", "artist_search_queries.json")
+
+# Fields of a Spotify artist object the ranking (and the selection menu) reads
+ARTIST_FIELDS = ("name", "popularity", "followers", "genres")
+
+
+class ReplaySpotify:
+    """Stands in for the spotipy client: answers sp.search from recorded responses"""
+
+    def __init__(self, artists, responses):
+        self.artists = artists
+        self.responses = responses
+
+    def search(self, q, type="artist", limit=10):
+        items = [dict(self.artists[artist_id], id=artist_id) for artist_id in self.responses.get(q, [])[:limit]]
+        return {"artists": {"items": items}}
+
+
+def replay_menu(fixture, case):
+    # No credentials needed: the client only replays recorded responses
+    menu = CreateSongMenu.__new__(CreateSongMenu)
+    menu.sp = ReplaySpotify(fixture["artists"], case["responses"])
+    return menu
+
+
+def rank(menu, query):
+    """search_artists for one query, its output (failed searches) kept out of the report"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return menu.search_artists(query)
+
+
+def scoring_seconds(menu, fixture, case, repeat):
+    """Best time to filter and rank every artist the query's searches returned"""
+    seen = dict.fromkeys(artist_id for ids in case["responses"].values() for artist_id in ids)
+    candidates = [dict(fixture["artists"][artist_id], id=artist_id) for artist_id in seen]
+    query = case["query"]
+    best = None
+    for _ in range(repeat):
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            relevant = [artist for artist in candidates if menu._is_relevant_match(artist["name"], query)]
+            sorted(relevant, key=lambda artist: menu._calculate_relevance_score(artist, query), reverse=True)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def evaluate(fixture, repeat, show_misses=False):
+    categories = {}
+    latencies = []
+    misses = []
+    for case in fixture["queries"]:
+        menu = replay_menu(fixture, case)
+        ranked = [artist["id"] for artist in rank(menu, case["query"])]
+        latencies.append(scoring_seconds(menu, fixture, case, repeat))
+        position = ranked.index(case["expected"]) + 1 if case["expected"] in ranked else None
+
+        for category in (case["category"], "all"):
+            counts = categories.setdefault(category, {"queries": 0, "top1": 0, "top3": 0, "filtered_out": 0})
+            counts["queries"] += 1
+            counts["top1"] += position == 1
+            counts["top3"] += position is not None and position <= 3
+            counts["filtered_out"] += position is None
+        if position != 1:
+            misses.append({
+                "query": case["query"], "category": case["category"],
+                "expected": fixture["artists"][case["expected"]]["name"], "position": position,
+                "ranked": [fixture["artists"][artist_id]["name"] for artist_id in ranked[:3]],
+            })
+
+    print(f"🎯 {len(fixture['queries'])} labelled queries")
+    print(f"   {'category':<14} {'queries':>7} {'top-1':>7} {'top-3':>7} {'filtered':>9}")
+    for category in sorted(categories, key=lambda name: (name == "all", name)):
+        counts = categories[category]
+        counts["top1_accuracy"] = round(counts["top1"] / counts["queries"], 4)
+        counts["top3_accuracy"] = round(counts["top3"] / counts["queries"], 4)
+        print(f"   {category:<14} {counts['queries']:>7} {100 * counts['top1_accuracy']:6.1f}% "
+              f"{100 * counts['top3_accuracy']:6.1f}% {counts['filtered_out']:>9}")
+
+    latency = {
+        "p50_us": round(1e6 * statistics.median(latencies), 2),
+        "p95_us": round(1e6 * percentile(latencies, 0.95), 2),
+        "max_us": round(1e6 * max(latencies), 2),
+        "total_ms": round(1e3 * sum(latencies), 3),
+    }
+    print(f"⏱️  Scoring per query: p50 {latency['p50_us']:.1f} µs, p95 {latency['p95_us']:.1f} µs, "
+          f"max {latency['max_us']:.1f} µs ({latency['total_ms']:.2f} ms for all queries)")
+
+    if show_misses and misses:
+        print(f"\n❌ {len(misses)} queries without the expected artist first:")
+        for miss in misses:
+            where = f"#{miss['position']}" if miss["position"] else "filtered out"
+            print(f"   [{miss['category']}] {miss['query']!r}: {miss['expected']} {where}; "
+                  f"got {', '.join(miss['ranked']) or 'nothing'}")
+    return {"categories": categories, "latency": latency, "misses": misses}
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n📊 Compared with {baseline_path}:")
+    for category, counts in results["categories"].items():
+        old = baseline["categories"].get(category)
+        if not old:
+            continue
+        for key in ("top1_accuracy", "top3_accuracy"):
+            change = 100 * (counts[key] - old[key])
+            marker = "⚠️ " if change < 0 else "  "
+            print(f" {marker} {category:<14} {key:<14} {100 * old[key]:6.1f}% -> {100 * counts[key]:6.1f}% "
+                  f"({change:+.1f} points)")
+    for key in ("p50_us", "p95_us"):
+        old, new = baseline["latency"][key], results["latency"][key]
+        change = 100.0 * (new - old) / old if old else 0.0
+        print(f"   latency {key:<10} {old:8.1f} -> {new:8.1f} µs ({change:+.1f}%)")
+
+
+def record(fixture):
+    """Replace the responses of every labelled query with live Spotify search results"""
+    menu = CreateSongMenu()
+    artists = {}
+    for case in fixture["queries"]:
+        responses = {}
+        for strategy in artist_search_strategies(case["query"]):
+            items = menu.sp.search(q=strategy, type="artist", limit=10)["artists"]["items"]
+            for item in items:
+                artists[item["id"]] = {field: item.get(field) for field in ARTIST_FIELDS}
+            responses[strategy] = [item["id"] for item in items]
+        case["responses"] = responses
+        if case["expected"] not in artists:
+            # The label names an artist of the generated catalog: match it by name among the live results
+            name = fixture["artists"][case["expected"]]["name"]
+            live = [artist_id for ids in responses.values() for artist_id in ids if artists[artist_id]["name"] == name]
+            if live:
+                case["expected"] = max(live, key=lambda artist_id: artists[artist_id]["followers"]["total"])
+            else:
+                print(f"⚠️  {name} not found for {case['query']!r}; label kept")
+                artists[case["expected"]] = fixture["artists"][case["expected"]]
+    fixture["artists"] = artists
+    return fixture
+
+
+def save_fixture(fixture, path):
+    """One artist and one query per line, so re-recordings diff cleanly"""
+    lines = ['{', '  "artists": {']
+    items = list(fixture["artists"].items())
+    lines += [f'    {json.dumps(artist_id)}: {json.dumps(artist, ensure_ascii=False)}{"," if i < len(items) - 1 else ""}'
+              for i, (artist_id, artist) in enumerate(items)]
+    lines += ['  },', '  "queries": [']
+    queries = fixture["queries"]
+    lines += [f'    {json.dumps(case, ensure_ascii=False)}{"," if i < len(queries) - 1 else ""}'
+              for i, case in enumerate(queries)]
+    lines += ['  ]', '}']
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark artist relevance ranking on labelled queries")
+    parser.add_argument("--fixture", default=FIXTURE, help="Labelled queries with their search responses")
+    parser.add_argument("--repeat", type=int, default=20, help="Scoring runs per query (best is reported)")
+    parser.add_argument("--misses", action="store_true", help="List the queries ranked wrong")
+    parser.add_argument("--record", action="store_true",
+                        help="Re-record the fixture's responses from the live Spotify API first")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    with open(args.fixture, encoding="utf-8") as f:
+        fixture = json.load(f)
+    if args.record:
+        save_fixture(record(fixture), args.fixture)
+        print(f"💾 Recorded {len(fixture['queries'])} queries into {args.fixture}")
+
+    results = dict({"benchmark": "artist_relevance", "python": platform.python_version(),
+                    "queries": len(fixture["queries"])}, **evaluate(fixture, args.repeat, args.misses))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"💾 Results saved to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Shared audio store benchmark
+Several users (each with their own download folder) download the same tracks
+through one shared audio store, using the yt-dlp stand-in. Reports yt-dlp runs,
+time and actual disk usage (distinct inodes) as users are added, with and
+without the store.
+
+Usage:
+    python benchmarks/bench_audio_store.py --users 1 2 4 8 --tracks 20
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+STANDIN = os.path.join(BENCH_DIR, "standins", "yt_dlp_standin.py")
+
+
+def disk_usage(root):
+    """Bytes used by the MP3s under root, counting hardlinked files once"""
+    seen = set()
+    total = 0
+    for folder, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(".mp3"):
+                st = os.stat(os.path.join(folder, name))
+                if (st.st_dev, st.st_ino) not in seen:
+                    seen.add((st.st_dev, st.st_ino))
+                    total += st.st_blocks * 512
+    return total
+
+
+def run(users, tracks, use_store, workdir):
+    import metrics
+    from audio_store import AudioStore
+    from mp3_downloader import MP3Downloader
+
+    store = AudioStore(os.path.join(workdir, "store")) if use_store else None
+    runs_before = metrics.STAGE_TOTAL.value(stage="download")
+    start = time.perf_counter()
+    for user in range(users):
+        with contextlib.redirect_stdout(io.StringIO()):
+            downloader = MP3Downloader(download_folder=os.path.join(workdir, f"user{user}"))
+            downloader.store = store
+            for t in range(tracks):
+                video_id = f"vid{t:08d}"
+                downloader.download_mp3_with_metadata(
+                    f"https://www.youtube.com/watch?v={video_id}", "Bench Artist", f"Bench Song {t}",
+                    "Bench Album", {"album": "Bench Album", "release_date": "2020-01-01"}
+                )
+    return {
+        "users": users,
+        "store": use_store,
+        "ytdlp_runs": metrics.STAGE_TOTAL.value(stage="download") - runs_before,
+        "seconds": round(time.perf_counter() - start, 3),
+        "disk_mb": round(disk_usage(workdir) / 1024 / 1024, 2),
+        "library_files": sum(1 for user in range(users)
+                             for _, _, names in os.walk(os.path.join(workdir, f"user{user}"))
+                             for name in names if name.endswith(".mp3")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared audio store")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--tracks", type=int, default=20)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "YTDLP_COMMAND": f"{sys.executable} {STANDIN}",
+        "DOWNLOAD_DELAY_SECONDS": "0",
+        "STANDIN_DOWNLOAD_SECONDS": "0.02",
+        "STANDIN_TRANSCODE_SECONDS": "0.01",
+    })
+    sys.path.insert(0, REPO_DIR)
+
+    results = []
+    for use_store in (False, True):
+        for users in args.users:
+            workdir = tempfile.mkdtemp(prefix="mp3bench-store-")
+            try:
+                result = run(users, args.tracks, use_store, workdir)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            results.append(result)
+            print(f"   {'store' if use_store else 'no store':<9} {users:>3} user(s): {result['ytdlp_runs']:>4} yt-dlp runs, "
+                  f"{result['seconds']:7.2f}s, {result['disk_mb']:8.2f} MB on disk for {result['library_files']} library files")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "audio_store", "tracks": args.tracks, "runs": results}, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
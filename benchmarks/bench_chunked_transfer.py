@@ -0,0 +1,215 @@
+"""
+Chunked transfer benchmark
+Serves large generated media files from a local HTTP server that behaves like
+a distant one: every request waits a round trip before answering, and each
+connection sends one window of data per round trip (so a single stream tops
+out at window / RTT, as over a long-haul TCP link), within a total link
+capacity shared by all connections. Each file is downloaded as one stream
+(by yt-dlp, the downloader's single-stream path, when it is installed, and
+by a plain HTTP read), then by chunked_transfer.fetch over a growing number of
+connections. Every download is checked against the served bytes.
+
+Usage:
+    python benchmarks/bench_chunked_transfer.py --sizes 32 96 --latency-ms 50 --connections 2 4 8
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+MB = 1024 * 1024
+
+
+class Link:
+    """Capacity shared by every connection of the server; None = unlimited"""
+
+    def __init__(self, bytes_per_second=None):
+        self.rate = bytes_per_second
+        self.lock = threading.Lock()
+        self.free_at = time.monotonic()
+
+    def send(self, count):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.free_at = max(self.free_at, now) + count / self.rate
+            wait = self.free_at - now
+        time.sleep(wait)
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """GET /media/<name>: the file registered under name, with Range support and the injected latency"""
+
+    protocol_version = "HTTP/1.1"
+    files = {}
+    latency = 0.05
+    window = 256 * 1024
+    link = Link()
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        data = self.files.get(self.path.rsplit("/", 1)[-1])
+        time.sleep(self.latency)
+        if data is None:
+            self.send_error(404)
+            return
+        start, end = 0, len(data) - 1
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "audio/webm")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        body = memoryview(data)[start:end + 1]
+        try:
+            for offset in range(0, len(body), self.window):
+                block = body[offset:offset + self.window]
+                self.link.send(len(block))
+                self.wfile.write(block)
+                if offset + self.window < len(body):
+                    # The sender waits for the acknowledgements before the next window
+                    time.sleep(self.latency)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_media_server(latency, window, link_rate):
+    MediaHandler.latency = latency
+    MediaHandler.window = window
+    MediaHandler.link = Link(link_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MediaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def single_stream(url, path):
+    """One GET of the whole file"""
+    with urllib.request.urlopen(url) as response, open(path, "wb") as f:
+        shutil.copyfileobj(response, f, 64 * 1024)
+
+
+def ytdlp_stream(url, path):
+    """The downloader's single-stream path: yt-dlp fetching the direct URL"""
+    result = subprocess.run(
+        [sys.executable, "-m", "yt_dlp", "--quiet", "--no-progress", "--no-part", "--force-generic-extractor",
+         "--output", path, url],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+
+
+def ytdlp_available():
+    try:
+        return subprocess.run([sys.executable, "-m", "yt_dlp", "--version"], capture_output=True).returncode == 0
+    except OSError:
+        return False
+
+
+def timed(name, size, digest, download, path, baseline=None):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+    start = time.perf_counter()
+    download(path)
+    seconds = time.perf_counter() - start
+    with open(path, "rb") as f:
+        intact = hashlib.sha256(f.read()).hexdigest() == digest
+    result = {"run": name, "size_mb": size / MB, "seconds": round(seconds, 3),
+              "throughput_mib_s": round(size / MB / seconds, 2), "intact": intact}
+    if baseline:
+        result["speedup"] = round(baseline / seconds, 2)
+    speedup = f"  x{result['speedup']:.2f}" if baseline else ""
+    print(f"   {name:<24} {seconds:7.2f}s  {result['throughput_mib_s']:7.2f} MiB/s{speedup}"
+          f"{'' if intact else '  CORRUPT'}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel chunked transfer against a single stream")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 96], help="File sizes in MiB")
+    parser.add_argument("--connections", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument("--latency-ms", type=float, default=50, help="Injected round trip time")
+    parser.add_argument("--window-kb", type=int, default=256, help="Data each connection sends per round trip")
+    parser.add_argument("--link-mib", type=float, default=64, help="Total link capacity in MiB/s (0 = unlimited)")
+    parser.add_argument("--chunk-mb", type=float, default=4, help="Range size of the chunked transfer")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_DIR)
+    import chunked_transfer
+
+    latency = args.latency_ms / 1000
+    window = args.window_kb * 1024
+    server, base_url = start_media_server(latency, window, args.link_mib * MB or None)
+    use_ytdlp = ytdlp_available()
+    print(f"🌐 Media server with {args.latency_ms:g} ms RTT, {args.window_kb} KiB per round trip per connection "
+          f"(~{window / latency / MB:.1f} MiB/s per stream), link "
+          f"{f'{args.link_mib:g} MiB/s' if args.link_mib else 'unlimited'}")
+
+    workdir = tempfile.mkdtemp(prefix="mp3bench-chunked-")
+    results = []
+    try:
+        for size_mb in args.sizes:
+            size = size_mb * MB
+            data = random.Random(size_mb).randbytes(size)
+            MediaHandler.files[f"{size_mb}.webm"] = data
+            digest = hashlib.sha256(data).hexdigest()
+            url = f"{base_url}/media/{size_mb}.webm"
+            path = os.path.join(workdir, f"{size_mb}.webm")
+            print(f"📦 {size_mb} MiB")
+
+            runs = []
+            if use_ytdlp:
+                runs.append(timed("yt-dlp (single stream)", size, digest, lambda p: ytdlp_stream(url, p), path))
+            runs.append(timed("single stream", size, digest, lambda p: single_stream(url, p), path))
+            baseline = runs[0]["seconds"]
+            for connections in args.connections:
+                MediaHandler.requests = 0
+                runs.append(timed(
+                    f"chunked, {connections} connections", size, digest,
+                    lambda p: chunked_transfer.fetch(url, p, connections=connections,
+                                                     chunk_size=int(args.chunk_mb * MB)),
+                    path, baseline
+                ))
+                runs[-1]["requests"] = MediaHandler.requests
+            results += runs
+            del MediaHandler.files[f"{size_mb}.webm"]
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "chunked_transfer", "latency_ms": args.latency_ms, "window_kb": args.window_kb,
+                       "link_mib_s": args.link_mib, "chunk_mb": args.chunk_mb, "runs": results}, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Cover art benchmark
+Downloads every album of the stub catalog (songs listed through CreateSongMenu
+against the stub Spotify API, audio from the yt-dlp stand-in) and counts image
+requests: once fetching the cover for every track, then with the per-album
+cache, then again in a fresh library sharing the cache from the previous run.
+
+Usage:
+    python benchmarks/bench_cover_art.py --tracks 100
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from stub_server import StubCatalog, start_stub_server, stub_environment
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+STANDIN = os.path.join(BENCH_DIR, "standins", "yt_dlp_standin.py")
+
+
+class UncachedCoverArt:
+    """What embedding without the cache costs: one fetch (and resize) per track"""
+
+    def get(self, album_id, image_url):
+        import cover_art
+        return cover_art.shrink(cover_art.CoverArtCache._fetch(image_url)) if image_url else None
+
+
+def run(name, handler, songs, library, covers):
+    import cover_art
+    from mp3_downloader import MP3Downloader
+
+    requests_before = handler.image_requests
+    with contextlib.redirect_stdout(io.StringIO()):
+        downloader = MP3Downloader(download_folder=library)
+        downloader.cover_art = UncachedCoverArt() if covers is None else cover_art.CoverArtCache(covers)
+        start = time.perf_counter()
+        for song in songs:
+            downloader.download_mp3_with_metadata(
+                f"https://www.youtube.com/watch?v={song['spotify_id'][-11:]}", song['artist'], song['name'],
+                song['album'], song
+            )
+        seconds = time.perf_counter() - start
+    with_cover = sum(1 for song in songs if _has_cover(library, song))
+    result = {"run": name, "tracks": len(songs), "image_requests": handler.image_requests - requests_before,
+              "seconds": round(seconds, 3), "tracks_with_cover": with_cover}
+    print(f"   {name:<22} {result['image_requests']:>5} image requests, {seconds:7.2f}s, "
+          f"{with_cover}/{len(songs)} tracks with cover art")
+    return result
+
+
+def _has_cover(library, song):
+    from mutagen.id3 import ID3
+    from title_normalizer import clean_filename
+    artist = clean_filename(song['artist'])
+    path = os.path.join(library, artist, f"{artist} - {clean_filename(song['name'])}.mp3")
+    return os.path.exists(path) and bool(ID3(path).getall("APIC"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-album cover art caching")
+    parser.add_argument("--tracks", type=int, default=100)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    catalog = StubCatalog(args.tracks)
+    server, base_url = start_stub_server(catalog)
+    os.environ.update(stub_environment(base_url))
+    os.environ.update({
+        "YTDLP_COMMAND": f"{sys.executable} {STANDIN}",
+        "DOWNLOAD_DELAY_SECONDS": "0",
+        "STANDIN_DOWNLOAD_SECONDS": "0",
+        "STANDIN_TRANSCODE_SECONDS": "0",
+    })
+    sys.path.insert(0, REPO_DIR)
+    from CreateSongMenu import CreateSongMenu
+
+    workdir = tempfile.mkdtemp(prefix="mp3bench-covers-")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            song_menu = CreateSongMenu()
+            songs = [song for album in catalog.albums for song in song_menu.iter_album_songs(album["id"])]
+        handler = server.RequestHandlerClass
+        covers = os.path.join(workdir, "covers")
+        print(f"🖼️  {len(songs)} tracks on {len(catalog.albums)} albums")
+        results = [
+            run("fetch per track", handler, songs, os.path.join(workdir, "uncached"), None),
+            run("per-album cache", handler, songs, os.path.join(workdir, "first"), covers),
+            run("cache from last run", handler, songs, os.path.join(workdir, "second"), covers),
+        ]
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "cover_art", "albums": len(catalog.albums), "runs": results}, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
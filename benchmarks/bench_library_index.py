@@ -0,0 +1,122 @@
+"""
+Benchmark for the library index (library_index.py)
+Builds a synthetic library laid out like the downloader's (<Artist>/<Artist> - <Song>.mp3),
+then times the initial index build, a refresh with nothing changed, a refresh
+after a few downloads, a full rescan, and lookups for existing and missing songs.
+
+Usage:
+    python benchmarks/bench_library_index.py                    # 100k files
+    python benchmarks/bench_library_index.py --files 20000 --tags
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR := os.path.dirname(BENCH_DIR))
+sys.path.insert(0, os.path.join(BENCH_DIR, "standins"))
+
+from library_index import LibraryIndex  # noqa: E402
+from yt_dlp_standin import synthetic_mp3  # noqa: E402
+
+SONGS_PER_ARTIST = 20
+
+
+def build_library(root, file_count, tags):
+    """Write file_count single-frame MP3s, SONGS_PER_ARTIST per artist folder"""
+    frame = synthetic_mp3(1 / 38)
+    if tags:
+        from mutagen.id3 import ID3, TIT2, TPE1
+    for i in range(file_count):
+        artist = f"Artist {i // SONGS_PER_ARTIST:05d}"
+        folder = os.path.join(root, artist)
+        if i % SONGS_PER_ARTIST == 0:
+            os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{artist} - Song {i:06d}.mp3")
+        with open(path, "wb") as f:
+            f.write(frame)
+        if tags:
+            id3 = ID3()
+            id3.add(TPE1(encoding=3, text=artist))
+            id3.add(TIT2(encoding=3, text=f"Song {i:06d}"))
+            id3.save(path)
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def lookup_rate(index, pairs):
+    start = time.perf_counter()
+    hits = sum(1 for artist, song in pairs if index.lookup(artist, song))
+    elapsed = time.perf_counter() - start
+    return elapsed / len(pairs) * 1e6, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the library index")
+    parser.add_argument("--files", type=int, default=100000, help="Number of MP3s in the synthetic library")
+    parser.add_argument("--tags", action="store_true", help="Write ID3 artist/title tags (slower to build)")
+    parser.add_argument("--lookups", type=int, default=10000, help="Lookups per measurement")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="mp3bench-library-")
+    try:
+        print(f"🏗️  Writing {args.files} files...", flush=True)
+        build_library(root, args.files, args.tags)
+        index = LibraryIndex(root)
+
+        results = {"benchmark": "library_index", "python": platform.python_version(),
+                   "files": args.files, "tags": args.tags, "runs": {}}
+
+        def record(name, seconds, stats=None):
+            results["runs"][name] = {"seconds": round(seconds, 4), **(stats or {})}
+            detail = f"  {stats}" if stats else ""
+            print(f"   {name:<22} {seconds * 1000:10.1f} ms{detail}")
+
+        seconds, stats = timed(index.refresh)
+        record("initial_build", seconds, stats)
+        seconds, stats = timed(index.refresh)
+        record("refresh_unchanged", seconds, stats)
+
+        # A few new downloads into existing artist folders
+        for i in range(10):
+            artist = f"Artist {i * 7:05d}"
+            with open(os.path.join(root, artist, f"{artist} - New Song {i}.mp3"), "wb") as f:
+                f.write(b"\xff\xfb\x90\x00" + bytes(413))
+        seconds, stats = timed(index.refresh)
+        record("refresh_10_new_files", seconds, stats)
+        seconds, stats = timed(lambda: index.refresh(full=True))
+        record("full_rescan", seconds, stats)
+
+        count = min(args.lookups, args.files)
+        step = max(1, args.files // count)
+        present = [(f"Artist {i // SONGS_PER_ARTIST:05d}", f"Song {i:06d}") for i in range(0, args.files, step)][:count]
+        missing = [(artist, song + " (Live)") for artist, song in present]
+        micros, hits = lookup_rate(index, present)
+        results["runs"]["lookup_hit"] = {"microseconds": round(micros, 2), "hits": hits}
+        print(f"   {'lookup_hit':<22} {micros:10.1f} µs/lookup  ({hits}/{len(present)} found)")
+        micros, hits = lookup_rate(index, missing)
+        results["runs"]["lookup_miss"] = {"microseconds": round(micros, 2), "hits": hits}
+        print(f"   {'lookup_miss':<22} {micros:10.1f} µs/lookup  ({hits}/{len(missing)} found)")
+        index.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Microbenchmark for title_normalizer
+Compares the original inline re.sub implementations of _clean_video_title_for_song
+and _clean_filename with the precompiled, memoized versions over a corpus of
+YouTube titles, and checks both produce identical output.
+
+The default corpus is 100k titles generated from the sample in
+fixtures/youtube_titles.txt (varied artists, songs and decorations, with the
+repetition a real search/download run has). Pass --corpus with a file of real
+titles, one per line, to benchmark against a dump instead.
+
+Usage:
+    python benchmarks/bench_normalize.py
+    python benchmarks/bench_normalize.py --corpus titles.txt --repeat 5
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import title_normalizer  # noqa: E402
+
+SAMPLE = os.path.join(BENCH_DIR, "fixtures", "youtube_titles.txt")
+
+
+def legacy_clean_video_title(title):
+    """MP3Downloader._clean_video_title_for_song before title_normalizer"""
+    title = re.sub(r'\[.*?\]', '', title)
+    title = re.sub(r'\(.*?[Oo]fficial.*?\)', '', title)
+    title = re.sub(r'\(.*?[Vv]ideo.*?\)', '', title)
+    title = re.sub(r'\(.*?[Ll]yrics.*?\)', '', title)
+    title = re.sub(r'\(.*?[Aa]udio.*?\)', '', title)
+    title = re.sub(r'\|.*', '', title)
+    title = re.sub(r'-.*[Yy]ou[Tt]ube.*', '', title)
+    title = re.sub(r'HD$|4K$', '', title)
+    title = re.sub(r'\s+', ' ', title)
+    title = title.strip(' -')
+    return title if title else "Unknown Title"
+
+
+def legacy_clean_filename(filename):
+    """MP3Downloader._clean_filename before title_normalizer"""
+    filename = re.sub(r'[<>:"/\\|?*]', '', filename)
+    filename = re.sub(r'[^\w\s\-_\.]', '', filename)
+    return filename.strip()
+
+
+def generate_corpus(size, unique_fraction, seed=0):
+    """
+    Build a corpus by recombining the artists, songs and decorations of the sample
+    titles. unique_fraction of the corpus is distinct titles, the rest repeats them.
+    """
+    with open(SAMPLE, encoding="utf-8") as f:
+        sample = [line.strip() for line in f if line.strip()]
+    rng = random.Random(seed)
+    artists, songs = [], []
+    for title in sample:
+        artist, _, rest = title.partition(" - ")
+        artists.append(artist)
+        songs.append(re.split(r'\s[\(\[\|]', rest or title)[0])
+    decorations = ["", " (Official Video)", " (Official Audio)", " [Official Music Video]", " (Lyrics)",
+                   " (Lyric Video)", " [HD]", " HD", " 4K", " | Live", " - YouTube", " (Remastered 2011)",
+                   " (feat. Guest)", " [Explicit] (Official Video)", " (Audio) | Topic"]
+
+    distinct = max(1, int(size * unique_fraction))
+    titles = list(sample)
+    while len(titles) < distinct:
+        titles.append(f"{rng.choice(artists)} - {rng.choice(songs)}{rng.choice(decorations)}"
+                      f"{rng.choice(decorations)} {len(titles)}")
+    titles = titles[:distinct]
+    return [titles[i] if i < distinct else rng.choice(titles) for i in range(size)]
+
+
+def time_call(function, repeat):
+    # Collector off while timing, like timeit, so cache growth does not trigger GC passes
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def clear_caches():
+    title_normalizer.clean_video_title.cache_clear()
+    title_normalizer.clean_filename.cache_clear()
+    title_normalizer.match_key.cache_clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark title/filename normalization")
+    parser.add_argument("--corpus", help="File with one YouTube title per line (default: generated)")
+    parser.add_argument("--size", type=int, default=100000, help="Generated corpus size")
+    parser.add_argument("--unique", type=float, default=0.5, help="Fraction of distinct titles in the generated corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            titles = [line.rstrip("\n") for line in f if line.strip()]
+    else:
+        titles = generate_corpus(args.size, args.unique)
+    print(f"⏱️  {len(titles)} titles ({len(set(titles))} distinct)")
+
+    # Same output as before, for every title in the corpus
+    mismatches = [t for t in titles if legacy_clean_video_title(t) != title_normalizer.clean_video_title(t)
+                  or legacy_clean_filename(t) != title_normalizer.clean_filename(t)]
+    if mismatches:
+        print(f"❌ {len(mismatches)} titles normalize differently, e.g. {mismatches[0]!r}")
+        sys.exit(1)
+
+    def legacy():
+        for title in titles:
+            legacy_clean_filename(legacy_clean_video_title(title))
+
+    def cold():
+        clear_caches()
+        for title in titles:
+            title_normalizer.clean_filename(title_normalizer.clean_video_title(title))
+
+    def warm():
+        for title in titles:
+            title_normalizer.clean_filename(title_normalizer.clean_video_title(title))
+
+    def batch():
+        clear_caches()
+        title_normalizer.clean_filenames(title_normalizer.clean_video_titles(titles))
+
+    timings = {"legacy": time_call(legacy, args.repeat), "cold_cache": time_call(cold, args.repeat)}
+    timings["warm_cache"] = time_call(warm, args.repeat)
+    timings["batch"] = time_call(batch, args.repeat)
+
+    results = {
+        "benchmark": "normalize",
+        "python": platform.python_version(),
+        "titles": len(titles),
+        "distinct_titles": len(set(titles)),
+        "runs": {},
+    }
+    for name, seconds in timings.items():
+        rate = len(titles) / seconds if seconds else 0
+        results["runs"][name] = {"seconds": round(seconds, 4), "titles_per_second": round(rate)}
+        speedup = timings["legacy"] / seconds if seconds else 0
+        print(f"   {name:<11} {seconds * 1000:9.1f} ms  {rate:12,.0f} titles/s  {speedup:5.1f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Offline end-to-end benchmark of the full main.py pipeline
+Runs main.py against the stub Spotify/YouTube server and the yt-dlp stand-in,
+answering the interactive prompts from a script, and measures tracks/minute,
+p50/p95 per-track latency (from the --trace spans), time from the first search to
+the first finished MP3, peak RSS and startup time.
+
+Usage:
+    python benchmarks/bench_pipeline.py                       # 1, 50 and 1000 tracks
+    python benchmarks/bench_pipeline.py --sizes 50 --baseline benchmarks/results/previous.json
+    python benchmarks/bench_pipeline.py --playlist --sizes 5000   # stream one big playlist
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from stub_server import StubCatalog, start_stub_server, stub_environment
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+STANDIN = os.path.join(BENCH_DIR, "standins", "yt_dlp_standin.py")
+TRACKS_PER_ALBUM = 10
+
+# Printed by InputHandler.get_artist once startup is done
+READY_PROMPT = b"What artist would you like to search for?"
+# Printed by main.run_collection instead when --playlist is used
+PLAYLIST_READY_PROMPT = b"Do you want to download all"
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def scripted_answers(track_count):
+    """Answers to main.py's prompts for an album download of every album in the catalog"""
+    album_count = max(1, -(-track_count // TRACKS_PER_ALBUM))
+    answers = [
+        "Bench Artist",                                       # artist search
+        "1",                                                  # pick the artist
+        "1",                                                  # albums
+        ",".join(str(i) for i in range(1, album_count + 1)),  # every album
+        "y",                                                  # download all
+    ]
+    if track_count > 1:
+        answers.append("n")                                   # same album? (Spotify metadata has it)
+    return "\n".join(answers) + "\n"
+
+
+def track_latencies(trace_path):
+    """
+    Per-track latency (search span + download span for each track), and the time
+    from the start of the first search to the end of the first download
+    """
+    with open(trace_path, encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    per_track = {}
+    first_search = first_mp3 = None
+    for event in events:
+        if event.get("ph") == "X" and event["name"] in ("track_search", "track_download"):
+            track = event["args"].get("track")
+            per_track[track] = per_track.get(track, 0) + event["dur"] / 1e6
+            if event["name"] == "track_search":
+                first_search = min(first_search or event["ts"], event["ts"])
+            else:
+                end = event["ts"] + event["dur"]
+                first_mp3 = min(first_mp3 or end, end)
+    first_mp3_seconds = (first_mp3 - first_search) / 1e6 if first_search is not None and first_mp3 else None
+    return list(per_track.values()), first_mp3_seconds
+
+
+def run_size(track_count, args):
+    catalog = StubCatalog(track_count, TRACKS_PER_ALBUM)
+    server, base_url = start_stub_server(catalog, latency_ms=args.latency_ms)
+    workdir = tempfile.mkdtemp(prefix=f"mp3bench-{track_count}-")
+    trace_path = os.path.join(workdir, "trace.json")
+
+    env = dict(os.environ)
+    env.update(stub_environment(base_url))
+    env.update({
+        "YTDLP_COMMAND": f"{sys.executable} {STANDIN}",
+        "DOWNLOAD_PATH": os.path.join(workdir, "library"),
+        "DOWNLOAD_DELAY_SECONDS": "0",
+        "PYTHONUNBUFFERED": "1",
+        "STANDIN_DOWNLOAD_SECONDS": str(args.download_seconds),
+        "STANDIN_TRANSCODE_SECONDS": str(args.transcode_seconds),
+    })
+
+    command = [sys.executable, "main.py", "--trace", trace_path]
+    answers = scripted_answers(track_count)
+    if args.playlist:
+        command += ["--playlist", f"spotify:playlist:{catalog.playlist_id}"]
+        answers = "y\n"
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=REPO_DIR, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+    )
+    ready_at = []
+    output = []
+
+    def read_output():
+        buffer = b""
+        while True:
+            chunk = process.stdout.read1(65536)
+            if not chunk:
+                break
+            output.append(chunk)
+            if not ready_at:
+                buffer = (buffer + chunk)[-4096:]
+                if READY_PROMPT in buffer or PLAYLIST_READY_PROMPT in buffer:
+                    ready_at.append(time.perf_counter())
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    process.stdin.write(answers.encode("utf-8"))
+    process.stdin.close()
+
+    # wait4 gives the resource usage of this run only (peak RSS in KiB on Linux)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    reader.join()
+    server.shutdown()
+
+    if process.returncode != 0 or not os.path.exists(trace_path):
+        sys.stdout.write(b"".join(output).decode("utf-8", "replace")[-4000:])
+        raise RuntimeError(f"main.py failed for {track_count} tracks (exit code {process.returncode})")
+
+    library = os.path.join(workdir, "library")
+    files = sum(len([f for f in names if f.endswith(".mp3")]) for _, _, names in os.walk(library))
+    latencies, first_mp3_seconds = track_latencies(trace_path)
+    peak_rss_kb = usage.ru_maxrss if sys.platform != "darwin" else usage.ru_maxrss / 1024
+    if args.keep:
+        print(f"   Kept library and trace in {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "tracks": track_count,
+        "files_written": files,
+        "wall_seconds": round(wall, 3),
+        "startup_seconds": round(ready_at[0] - start, 3) if ready_at else None,
+        "tracks_per_minute": round(files / wall * 60, 1) if wall else None,
+        "latency_p50_seconds": round(percentile(latencies, 0.50), 4) if latencies else None,
+        "latency_p95_seconds": round(percentile(latencies, 0.95), 4) if latencies else None,
+        "first_mp3_seconds": round(first_mp3_seconds, 3) if first_mp3_seconds is not None else None,
+        "peak_rss_mb": round(peak_rss_kb / 1024, 1),
+        "api_requests": server.RequestHandlerClass.request_count,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {run["tracks"]: run for run in json.load(f)["runs"]}
+    print(f"\n📊 Compared with {baseline_path}:")
+    for run in results["runs"]:
+        old = baseline.get(run["tracks"])
+        if not old:
+            continue
+        for key in ("tracks_per_minute", "latency_p50_seconds", "latency_p95_seconds", "first_mp3_seconds",
+                    "peak_rss_mb", "startup_seconds"):
+            if run.get(key) is not None and old.get(key):
+                change = 100.0 * (run[key] - old[key]) / old[key]
+                print(f"  {run['tracks']:>5} tracks  {key:<22} {old[key]:>10} -> {run[key]:<10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of main.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 50, 1000], help="Track counts to benchmark")
+    parser.add_argument("--download-seconds", type=float, default=0.05, help="Stand-in download time per track")
+    parser.add_argument("--transcode-seconds", type=float, default=0.02, help="Stand-in transcode time per track")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency injected into every stub API request")
+    parser.add_argument("--output", help="Results file (default benchmarks/results/pipeline-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--playlist", action="store_true",
+                        help="Download the catalog as one Spotify playlist (main.py --playlist) instead of by album")
+    parser.add_argument("--keep", action="store_true", help="Keep each run's library and trace for inspection")
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": "pipeline",
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "download_seconds": args.download_seconds,
+            "transcode_seconds": args.transcode_seconds,
+            "latency_ms": args.latency_ms,
+            "mode": "playlist" if args.playlist else "albums",
+        },
+        "runs": [],
+    }
+
+    for size in args.sizes:
+        print(f"⏱️  Benchmarking {size} track(s)...", flush=True)
+        run = run_size(size, args)
+        results["runs"].append(run)
+        print(f"   {run['tracks_per_minute']} tracks/min, p50 {run['latency_p50_seconds']}s, "
+              f"p95 {run['latency_p95_seconds']}s, first MP3 {run['first_mp3_seconds']}s, peak RSS {run['peak_rss_mb']} MB, startup {run['startup_seconds']}s")
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results saved to {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Output profile fan-out benchmark
+Produces a 320K archive copy and a 128K mobile copy of every track with the
+yt-dlp and ffmpeg stand-ins: once the old way, running the whole download per
+profile, then with both profiles encoded from a single download and decode.
+Reports yt-dlp downloads, decodes and time for each.
+
+Usage:
+    python benchmarks/bench_profiles.py --tracks 20 --download-seconds 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+STANDINS = os.path.join(BENCH_DIR, "standins")
+
+PROFILES = [
+    {"name": "archive", "format": "mp3", "quality": "320K"},
+    {"name": "mobile", "format": "mp3", "quality": "128K"},
+]
+
+
+def download_all(downloader, tracks):
+    for t in range(tracks):
+        downloader.download_mp3_with_metadata(
+            f"https://www.youtube.com/watch?v=vid{t:08d}", "Bench Artist", f"Bench Song {t}",
+            "Bench Album", {"album": "Bench Album", "release_date": "2020-01-01"}
+        )
+
+
+def run(name, tracks, workdir, fan_out):
+    import metrics
+    import transcode
+    from mp3_downloader import MP3Downloader
+
+    downloads_before = metrics.STAGE_TOTAL.value(stage="download")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if fan_out:
+            transcode.OUTPUT_PROFILES = [PROFILES[0], dict(PROFILES[1], root=os.path.join(workdir, "mobile"))]
+            download_all(MP3Downloader(download_folder=os.path.join(workdir, "archive")), tracks)
+        else:
+            # One pipeline run per profile, as with two AUDIO_QUALITY settings
+            for profile in PROFILES:
+                transcode.OUTPUT_PROFILES = [profile]
+                download_all(MP3Downloader(download_folder=os.path.join(workdir, profile["name"])), tracks)
+    seconds = time.perf_counter() - start
+    transcode.OUTPUT_PROFILES = None
+    downloads = metrics.STAGE_TOTAL.value(stage="download") - downloads_before
+    files = sum(1 for folder, _, names in os.walk(workdir) if ".mp3_downloader" not in folder
+                for name in names if name.endswith(".mp3"))
+    result = {"run": name, "tracks": tracks, "downloads": downloads, "decodes": downloads if not fan_out else tracks,
+              "files": files, "seconds": round(seconds, 3)}
+    print(f"   {name:<20} {downloads:>4} downloads, {result['decodes']:>4} decodes, {files:>4} files, {seconds:7.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark encoding several output profiles from one download")
+    parser.add_argument("--tracks", type=int, default=20)
+    parser.add_argument("--download-seconds", type=float, default=0.2,
+                        help="Stand-in download time per track")
+    parser.add_argument("--decode-seconds", type=float, default=0.02, help="Stand-in decode time per track")
+    parser.add_argument("--encode-seconds", type=float, default=0.05, help="Stand-in encode time per output")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "YTDLP_COMMAND": f"{sys.executable} {os.path.join(STANDINS, 'yt_dlp_standin.py')}",
+        "FFMPEG_COMMAND": f"{sys.executable} {os.path.join(STANDINS, 'ffmpeg_standin.py')}",
+        "DOWNLOAD_DELAY_SECONDS": "0",
+        "STANDIN_DOWNLOAD_SECONDS": str(args.download_seconds),
+        # yt-dlp's own conversion decodes and encodes once per run
+        "STANDIN_TRANSCODE_SECONDS": str(args.decode_seconds + args.encode_seconds),
+        "STANDIN_DECODE_SECONDS": str(args.decode_seconds),
+        "STANDIN_ENCODE_SECONDS": str(args.encode_seconds),
+    })
+    sys.path.insert(0, REPO_DIR)
+
+    workdir = tempfile.mkdtemp(prefix="mp3bench-profiles-")
+    try:
+        print(f"🎚️  {args.tracks} tracks x {len(PROFILES)} profiles")
+        results = [
+            run("pipeline per profile", args.tracks, os.path.join(workdir, "separate"), fan_out=False),
+            run("single-decode fan-out", args.tracks, os.path.join(workdir, "fan-out"), fan_out=True),
+        ]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "profiles", "runs": results}, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for ffmpeg
+Understands the one-input, many-outputs command line of transcode.encode_command:
+"decodes" the input once and writes a synthetic but valid MP3 for every output
+(at its -b:a bitrate), taking a controllable amount of time. With an ebur128 filter it logs a loudness
+measurement the way ffmpeg does (a block every 100 ms, then the summary).
+
+Speed is controlled with environment variables:
+    STANDIN_DECODE_SECONDS   time spent decoding the input (default 0.01)
+    STANDIN_ENCODE_SECONDS   time spent encoding each output (default 0.01)
+    STANDIN_TRACK_SECONDS    duration of the synthetic audio (default 180)
+    STANDIN_LOUDNESS_LUFS    loudness of the synthetic audio (default -14); each
+                             input varies around it by up to 3 LU
+
+Point the downloader at it with:
+    FFMPEG_COMMAND="python benchmarks/standins/ffmpeg_standin.py"
+"""
+
+import os
+import sys
+import time
+import zlib
+
+from yt_dlp_standin import synthetic_mp3
+
+# Options without a value; every other option takes one
+FLAGS = {"-hide_banner", "-nostdin", "-y", "-n", "-vn"}
+
+
+def main(args):
+    if "-version" in args:
+        print("ffmpeg version 9.9 (stand-in)")
+        return 0
+
+    source, outputs = None, []
+    kbps = 128
+    i = 0
+    while i < len(args):
+        if args[i] in FLAGS:
+            i += 1
+        elif args[i] == "-i":
+            source = args[i + 1]
+            i += 2
+        elif args[i] == "-b:a":
+            kbps = int(args[i + 1].rstrip("kK"))
+            i += 2
+        elif args[i].startswith("-"):
+            i += 2
+        else:
+            outputs.append((args[i], kbps))
+            kbps = 128
+            i += 1
+    if not source or not os.path.exists(source):
+        print(f"{source}: No such file or directory", file=sys.stderr)
+        return 1
+
+    track_seconds = float(os.getenv("STANDIN_TRACK_SECONDS", "180"))
+    print(f"Input #0, from '{source}':", file=sys.stderr)
+    time.sleep(float(os.getenv("STANDIN_DECODE_SECONDS", "0.01")))
+    for output, kbps in outputs:
+        print(f"Output to '{output}':", file=sys.stderr)
+        time.sleep(float(os.getenv("STANDIN_ENCODE_SECONDS", "0.01")))
+        if output == "-":
+            continue
+        with open(output, "wb") as f:
+            f.write(synthetic_mp3(track_seconds, kbps))
+    if any("ebur128" in arg for arg in args):
+        log_ebur128(source, track_seconds)
+    return 0
+
+
+def log_ebur128(source, track_seconds):
+    # Deterministic per input, louder and quieter passages alternating
+    loudness = float(os.getenv("STANDIN_LOUDNESS_LUFS", "-14")) + (zlib.crc32(source.encode()) % 61 - 30) / 10
+    for block in range(4, int(track_seconds * 10) + 1):
+        momentary = loudness + (2.0 if block // 50 % 2 else -2.0)
+        print(f"[Parsed_ebur128_0 @ 0x5600] t: {block / 10:<10.6g} TARGET:-23 LUFS    M:{momentary:6.1f} "
+              f"S:{momentary:6.1f}     I:{loudness:6.1f} LUFS       LRA:   4.0 LU", file=sys.stderr)
+    print("[Parsed_ebur128_0 @ 0x5600] Summary:\n\n  Integrated loudness:\n"
+          f"    I:         {loudness:5.1f} LUFS\n    Threshold: {loudness - 10:5.1f} LUFS\n\n"
+          "  Loudness range:\n    LRA:         4.0 LU\n\n"
+          "  Sample peak:\n    Peak:       -0.5 dBFS", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
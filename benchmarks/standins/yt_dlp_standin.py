@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for yt-dlp (and the ffmpeg transcode it drives)
+Understands the subset of the yt-dlp command line the downloader uses, prints
+yt-dlp style progress lines and writes a synthetic but valid MP3, taking a
+controllable amount of time for each phase.
+
+Speed is controlled with environment variables:
+    STANDIN_DOWNLOAD_SECONDS   time spent "downloading" (default 0.05)
+    STANDIN_TRANSCODE_SECONDS  time spent "transcoding" (default 0.02)
+    STANDIN_TRACK_SECONDS      duration of the synthetic audio (default 180)
+    STANDIN_SOURCE_KBPS        bitrate of the pretend source stream (default 128)
+    STANDIN_STALL_SECONDS      hang silently this long halfway through the first
+                               download into each output folder (default 0)
+    STANDIN_FAIL_VIDEOS        comma-separated video IDs that are unavailable
+    STANDIN_FLAKY_VIDEOS       comma-separated video IDs whose first download fails
+                               with HTTP Error 503 (once per staging root)
+    STANDIN_MEDIA_URL          direct URL of the source stream, reported by --dump-json
+                               ({id} is replaced with the video ID), e.g. the media
+                               server of benchmarks/bench_chunked_transfer.py
+
+--limit-rate is honoured: the download phase takes at least source size / rate.
+Without --extract-audio only the source is written (for the ffmpeg stand-in to encode).
+--print-to-file writes the source's %(abr)s and %(acodec)s (opus).
+--load-info-json takes the video from a --dump-json output instead of a URL.
+
+Point the downloader at it with:
+    YTDLP_COMMAND="python benchmarks/standins/yt_dlp_standin.py"
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+# MPEG-1 Layer III, 44.1 kHz, stereo, no CRC/padding; the bitrate index goes in the third byte
+MP3_BITRATES_KBPS = (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MP3_FRAMES_PER_SECOND = 44100 / 1152
+
+
+def synthetic_mp3(seconds, kbps=128):
+    """Silent frames at the nearest MPEG-1 Layer III bitrate not below kbps (128 kbps: 417-byte frames)"""
+    kbps = next((rate for rate in MP3_BITRATES_KBPS if rate >= kbps), MP3_BITRATES_KBPS[-1])
+    header = bytes([0xFF, 0xFB, (MP3_BITRATES_KBPS.index(kbps) + 1) << 4, 0x00])
+    frame = header + bytes(144 * kbps * 1000 // 44100 - len(header))
+    return frame * int(seconds * MP3_FRAMES_PER_SECOND)
+
+
+def video_id(url):
+    match = re.search(r'(?:v=|youtu\.be/|embed/|/v/)([0-9A-Za-z_-]{11})', url)
+    return match.group(1) if match else "standin0000"
+
+
+def option(args, name, default=None):
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return default
+
+
+def main(args):
+    if "--version" in args:
+        print("2099.01.01 (stand-in)")
+        return 0
+
+    url = args[-1] if args else ""
+    vid = video_id(url)
+    if "--load-info-json" in args:
+        with open(option(args, "--load-info-json"), encoding="utf-8") as f:
+            vid = json.load(f)["id"]
+        url = f"https://www.youtube.com/watch?v={vid}"
+    track_seconds = float(os.getenv("STANDIN_TRACK_SECONDS", "180"))
+    title = f"Stand-in Video {vid}"
+
+    if "--dump-json" in args:
+        info = {
+            "id": vid, "title": title, "uploader": "Stand-in Uploader",
+            "duration": int(track_seconds), "view_count": 0, "upload_date": "20190517",
+            "abr": float(os.getenv("STANDIN_SOURCE_KBPS", "128")), "acodec": "opus",
+            "ext": "webm", "protocol": "https",
+        }
+        media_url = os.getenv("STANDIN_MEDIA_URL")
+        if media_url:
+            info.update(url=media_url.replace("{id}", vid), protocol=media_url.split(":", 1)[0])
+        print(json.dumps(info))
+        return 0
+
+    template = option(args, "--output", "%(title)s.%(ext)s")
+    download_seconds = float(os.getenv("STANDIN_DOWNLOAD_SECONDS", "0.05"))
+    transcode_seconds = float(os.getenv("STANDIN_TRANSCODE_SECONDS", "0.02"))
+    source_mib = track_seconds * float(os.getenv("STANDIN_SOURCE_KBPS", "128")) * 1000 / 8 / 1024 / 1024
+    rate_limit = option(args, "--limit-rate")
+    if rate_limit:
+        download_seconds = max(download_seconds, source_mib * 1024 * 1024 / float(rate_limit))
+    speed_mib = source_mib / download_seconds if download_seconds else 1.0
+
+    print(f"[youtube] Extracting URL: {url}")
+    print(f"[youtube] {vid}: Downloading webpage")
+    if vid in os.getenv("STANDIN_FAIL_VIDEOS", "").split(","):
+        print(f"ERROR: [youtube] {vid}: Video unavailable. This video has been removed by the uploader",
+              file=sys.stderr)
+        return 1
+    # Downloads are staged in a fresh folder per attempt; the marker sits in their common parent
+    flaky_marker = os.path.join(os.path.dirname(os.path.dirname(template)) or ".", f".standin-flaky-{vid}")
+    if vid in os.getenv("STANDIN_FLAKY_VIDEOS", "").split(",") and not os.path.exists(flaky_marker):
+        open(flaky_marker, "w").close()
+        print(f"ERROR: [youtube] {vid}: Unable to download webpage: HTTP Error 503: Service Unavailable",
+              file=sys.stderr)
+        return 1
+    source_path = template.replace("%(title)s", title).replace("%(ext)s", "webm")
+    if "--print-to-file" in args:
+        index = args.index("--print-to-file")
+        text = args[index + 1].replace("%(abr)s", os.getenv("STANDIN_SOURCE_KBPS", "128")).replace("%(acodec)s", "opus")
+        with open(args[index + 2], "a", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(f"[download] Destination: {source_path}")
+    stall_seconds = float(os.getenv("STANDIN_STALL_SECONDS", "0"))
+    stall_marker = os.path.join(os.path.dirname(template) or ".", ".standin-stalled")
+    steps = 4
+    for step in range(1, steps + 1):
+        if step == steps // 2 + 1 and stall_seconds and not os.path.exists(stall_marker):
+            # A connection that hangs once; the retry resumes normally
+            open(stall_marker, "w").close()
+            time.sleep(stall_seconds)
+        time.sleep(download_seconds / steps)
+        eta = int(download_seconds * (steps - step) / steps)
+        print(f"[download] {100.0 * step / steps:5.1f}% of {source_mib:.2f}MiB at {speed_mib:.2f}MiB/s "
+              f"ETA {eta // 60:02d}:{eta % 60:02d}", flush=True)
+
+    folder = os.path.dirname(template)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if "--extract-audio" not in args:
+        with open(source_path, "wb") as f:
+            f.write(synthetic_mp3(track_seconds))
+        return 0
+
+    output_path = template.replace("%(title)s", title).replace("%(ext)s", "mp3")
+    print(f'[ExtractAudio] Destination: {output_path}', flush=True)
+    time.sleep(transcode_seconds)
+    with open(output_path, "wb") as f:
+        f.write(synthetic_mp3(track_seconds))
+    print(f"Deleting original file {source_path} (pass -k to keep)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
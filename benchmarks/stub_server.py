@@ -0,0 +1,267 @@
+"""
+Local stub for the Spotify Web API and the YouTube Data API
+Replays the recorded responses in benchmarks/fixtures, cloned into a synthetic
+catalog of any size (one artist, N tracks spread over albums of ten tracks, and
+one playlist holding all of them), with optional injected latency per request.
+Album images point at /images/ on the stub itself, which serves a small JPEG
+per album and rendition.
+
+Usage:
+    python benchmarks/stub_server.py --tracks 50 --port 9000 --latency-ms 40
+"""
+
+import argparse
+import base64
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _spotify_id(prefix, index):
+    # Spotify IDs are 22 base62 characters
+    return f"{prefix}{index:0{22 - len(prefix)}d}"
+
+
+# Smallest valid baseline JPEG (1x1 pixel); stub covers pad it to a realistic size
+_JPEG_1X1 = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQEASABIAAD/2wBDAP//////////////////////////////////////////////////////////////////"
+    "////////////////////wgALCAABAAEBAREA/8QAFBABAAAAAAAAAAAAAAAAAAAAAP/aAAgBAQABPxA="
+)
+
+# Spotify's album image renditions
+IMAGE_WIDTHS = (640, 300, 64)
+
+
+def stub_jpeg(name, width):
+    """A valid JPEG of about the size Spotify serves at this width, unique per name"""
+    comment = (name.encode("utf-8") + b" ") * (width * width // 8 // (len(name) + 1) + 1)
+    comment = comment[:65533]
+    # SOI, then a COM segment carrying the padding, then the rest of the 1x1 image
+    return _JPEG_1X1[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + _JPEG_1X1[2:]
+
+
+def _video_id(query):
+    # Deterministic 11-character YouTube video ID per search query
+    return hashlib.sha1(query.encode("utf-8")).hexdigest()[:11]
+
+
+class StubCatalog:
+    """Synthetic catalog built from the recorded fixtures"""
+
+    def __init__(self, track_count, tracks_per_album=10):
+        self.artist_search = load_fixture("spotify_search_artist.json")
+        self.artist = self.artist_search["artists"]["items"][0]
+        album_template = load_fixture("spotify_artist_album.json")
+        track_template = load_fixture("spotify_album_track.json")
+        self.youtube_search = load_fixture("youtube_search.json")
+
+        self.albums = []
+        self.album_tracks = {}
+        album_count = max(1, -(-track_count // tracks_per_album))
+        for a in range(album_count):
+            album = copy.deepcopy(album_template)
+            album["id"] = _spotify_id("alb", a)
+            album["name"] = f"Bench Album {a + 1}"
+            # Spread release dates so sorting by date is meaningful
+            album["release_date"] = f"{2000 + a // 12:04d}-{a % 12 + 1:02d}-01"
+            count = min(tracks_per_album, track_count - a * tracks_per_album)
+            album["total_tracks"] = count
+            tracks = []
+            for t in range(count):
+                track = copy.deepcopy(track_template)
+                track["id"] = _spotify_id("trk", a * tracks_per_album + t)
+                track["name"] = f"Bench Song {a * tracks_per_album + t + 1}"
+                track["track_number"] = t + 1
+                track["duration_ms"] = 150000 + (a * tracks_per_album + t) * 7919 % 120000
+                tracks.append(track)
+            self.albums.append(album)
+            self.album_tracks[album["id"]] = tracks
+        self.albums_by_id = {album["id"]: album for album in self.albums}
+        self.playlist_id = _spotify_id("pls", 0)
+        self.playlist_items = [
+            {"track": dict(track, album=album)}
+            for album in self.albums for track in self.album_tracks[album["id"]]
+        ]
+
+    def set_base_url(self, base_url):
+        """Point every album's images at this server's /images/ route"""
+        for album in self.albums:
+            album["images"] = [
+                {"url": f"{base_url}/images/{album['id']}-{width}.jpg", "width": width, "height": width}
+                for width in IMAGE_WIDTHS
+            ]
+
+    def image(self, path):
+        """Serve /images/<album id>-<width>.jpg; returns (status, body bytes)"""
+        name = path.rsplit("/", 1)[-1]
+        album_id, _, width = name[:-len(".jpg")].rpartition("-")
+        if album_id not in self.albums_by_id or not width.isdigit():
+            return 404, b""
+        return 200, stub_jpeg(album_id, int(width))
+
+    def spotify(self, path, query):
+        """Route a Spotify Web API GET; returns (status, body)"""
+        parts = path.strip("/").split("/")
+        limit = int(query.get("limit", ["20"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+
+        if parts == ["v1", "search"]:
+            kind = query.get("type", ["artist"])[0]
+            if kind == "artist":
+                return 200, self.artist_search
+            if kind == "album":
+                return 200, {"albums": self._page(self.albums[:1], 0, limit)}
+            if kind == "track":
+                album = self.albums[0]
+                track = dict(self.album_tracks[album["id"]][0], album=album)
+                return 200, {"tracks": self._page([track], 0, limit)}
+
+        if len(parts) >= 3 and parts[:3] == ["v1", "playlists", self.playlist_id]:
+            if parts[3:] in (["tracks"], ["items"]):
+                return 200, self._page(self.playlist_items, offset, min(limit, 100))
+            if not parts[3:]:
+                return 200, {"id": self.playlist_id, "name": "Bench Playlist",
+                             "tracks": {"total": len(self.playlist_items)}}
+
+        if len(parts) == 4 and parts[:2] == ["v1", "artists"] and parts[3] == "albums":
+            return 200, self._page(self.albums, offset, limit)
+
+        if len(parts) == 4 and parts[:2] == ["v1", "albums"] and parts[3] == "tracks":
+            tracks = self.album_tracks.get(parts[2])
+            if tracks is not None:
+                return 200, self._page(tracks, offset, limit)
+
+        if len(parts) == 3 and parts[:2] == ["v1", "albums"] and parts[2] in self.albums_by_id:
+            album = dict(self.albums_by_id[parts[2]])
+            album["tracks"] = self._page(self.album_tracks[parts[2]], 0, 50)
+            return 200, album
+
+        return 404, {"error": {"status": 404, "message": "Not found"}}
+
+    def youtube(self, query):
+        """Replay the recorded search response with video IDs derived from the query"""
+        body = copy.deepcopy(self.youtube_search)
+        q = query.get("q", [""])[0]
+        for i, item in enumerate(body["items"]):
+            item["id"]["videoId"] = _video_id(f"{q}#{i}")
+        return 200, body
+
+    def _page(self, items, offset, limit):
+        return {
+            "items": items[offset:offset + limit],
+            "limit": limit,
+            "offset": offset,
+            "total": len(items),
+            # Only a marker: clients page with offset/limit
+            "next": "more" if offset + limit < len(items) else None,
+            "previous": None,
+        }
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    catalog = None
+    latency = 0.0
+    request_count = 0
+    image_requests = 0
+    _count_lock = threading.Lock()
+
+    def do_POST(self):
+        self._count()
+        if self.path.startswith("/api/token"):
+            return self._send(200, {"access_token": "stub-token", "token_type": "Bearer", "expires_in": 3600})
+        self._send(404, {"error": "Not found"})
+
+    def do_GET(self):
+        self._count()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith("/youtube/v3/search"):
+            return self._send(*self.catalog.youtube(query))
+        if url.path.startswith("/v1/"):
+            return self._send(*self.catalog.spotify(url.path, query))
+        if url.path.startswith("/images/"):
+            with self._count_lock:
+                type(self).image_requests += 1
+            return self._send_bytes(*self.catalog.image(url.path), "image/jpeg")
+        self._send(404, {"error": "Not found"})
+
+    def _count(self):
+        with self._count_lock:
+            type(self).request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _send(self, status, body):
+        self._send_bytes(status, json.dumps(body).encode("utf-8"), "application/json")
+
+    def _send_bytes(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(catalog, host="127.0.0.1", port=0, latency_ms=0):
+    """
+    Start the stub server on a background thread
+
+    Returns:
+        tuple: (server, base_url) - call server.shutdown() when done
+    """
+    handler = type("BoundStubRequestHandler", (StubRequestHandler,), {
+        "catalog": catalog,
+        "latency": latency_ms / 1000.0,
+        "request_count": 0,
+        "image_requests": 0,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    base_url = f"http://{host}:{server.server_address[1]}"
+    catalog.set_base_url(base_url)
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    return server, base_url
+
+
+def stub_environment(base_url):
+    """Environment variables that point the app at the stub server"""
+    return {
+        "SPOTIFY_API_URL": f"{base_url}/v1/",
+        "SPOTIFY_TOKEN_URL": f"{base_url}/api/token",
+        "YOUTUBE_API_URL": f"{base_url}/",
+        "SPOTIFY_CLIENT_ID": "stub-client-id",
+        "SPOTIFY_CLIENT_SECRET": "stub-client-secret",
+        "YOUTUBE_API_KEY": "stub-api-key",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded Spotify/YouTube API responses locally")
+    parser.add_argument("--tracks", type=int, default=50, help="Number of tracks in the synthetic catalog")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency injected into every request")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(StubCatalog(args.tracks), port=args.port, latency_ms=args.latency_ms)
+    print(f"🧪 Stub API on {base_url} ({args.tracks} tracks)")
+    for name, value in stub_environment(base_url).items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,250 @@
+"""
+Parallel chunked transfer
+A single HTTP stream can't go faster than its window per round trip, so on
+high-latency links one stream per track uses a fraction of the bandwidth, and
+long tracks, DJ mixes and live sets take minutes. For large media the source
+is instead fetched as CHUNK_SIZE_MB ranges over several connections at once.
+Each range is written at its own offset of a preallocated file (through its
+own file handle, so it works the same on every platform), so the file is
+reassembled in order as the pieces arrive, and a range that fails resumes
+from where it stopped instead of starting over.
+"""
+
+import http.client
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from config import CHUNKED_CONNECTIONS, CHUNKED_MIN_MB, CHUNK_SIZE_MB
+except ImportError:
+    CHUNKED_CONNECTIONS = 1
+    CHUNKED_MIN_MB = 20
+    CHUNK_SIZE_MB = 4
+
+try:
+    from config import STALL_TIMEOUT_SECONDS, STALL_RETRIES
+except ImportError:
+    STALL_TIMEOUT_SECONDS = 60
+    STALL_RETRIES = 2
+
+# Environment variables take precedence (e.g. per container)
+CHUNKED_CONNECTIONS = int(os.getenv("CHUNKED_CONNECTIONS", CHUNKED_CONNECTIONS))
+CHUNKED_MIN_MB = float(os.getenv("CHUNKED_MIN_MB", CHUNKED_MIN_MB))
+STALL_TIMEOUT_SECONDS = float(os.getenv("STALL_TIMEOUT_SECONDS", STALL_TIMEOUT_SECONDS))
+
+MB = 1024 * 1024
+READ_SIZE = 64 * 1024
+# How often on_progress is called at most
+PROGRESS_SECONDS = 0.5
+
+
+class TransferError(OSError):
+    """A range could not be fetched, even after retrying"""
+
+
+# What a failed transfer can raise: TransferError for the failures fetch recognises,
+# otherwise what urllib and http.client raise for a broken or malformed response
+TRANSFER_ERRORS = (OSError, ValueError, http.client.HTTPException)
+
+
+class TransferCancelled(Exception):
+    """The transfer's cancel event was set"""
+
+
+def probe(url, headers=None, timeout=STALL_TIMEOUT_SECONDS):
+    """
+    Size of url and whether its server serves byte ranges, from a one-byte range request
+
+    Returns:
+        tuple: (size in bytes or None, accepts_ranges)
+    """
+    request = urllib.request.Request(url, headers=dict(headers or {}, Range="bytes=0-0"))
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        content_range = response.headers.get("Content-Range", "")
+        if response.status == 206 and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            return (int(total) if total.isdigit() else None), True
+        length = response.headers.get("Content-Length")
+        return (int(length) if length and length.isdigit() else None), False
+
+
+def plan_chunks(size, chunk_size=int(CHUNK_SIZE_MB * MB)):
+    """(start, end) byte ranges, end inclusive, covering size bytes in order"""
+    return [(start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size)]
+
+
+def eligible(info, connections, min_bytes=int(CHUNKED_MIN_MB * MB)):
+    """
+    Whether a source is worth a chunked transfer: a plain HTTP(S) file (not
+    fragmented, which yt-dlp downloads with concurrent fragments instead) of at
+    least min_bytes, with more than one connection to use
+
+    Args:
+        info (dict): yt-dlp extraction info of the selected format
+    """
+    size = info.get("filesize") or info.get("filesize_approx")
+    return (connections > 1 and bool(info.get("url")) and info.get("protocol") in ("http", "https")
+            and (size is None or size >= min_bytes))
+
+
+def fetch(url, path, size=None, headers=None, connections=CHUNKED_CONNECTIONS, chunk_size=int(CHUNK_SIZE_MB * MB),
+          rate_limit=None, on_progress=None, cancel=None, timeout=STALL_TIMEOUT_SECONDS, retries=STALL_RETRIES):
+    """
+    Download url into path over up to connections concurrent range requests
+
+    Falls back to a single stream when the server does not serve ranges.
+
+    Args:
+        size (int, optional): File size, if known (otherwise probed)
+        headers (dict, optional): Request headers (yt-dlp's http_headers for the format)
+        rate_limit (int or callable, optional): Bytes/second for the whole transfer, shared by its
+            connections; a callable (e.g. BandwidthBudget.share) is asked again before every range
+        on_progress (callable, optional): Called with (downloaded_bytes, total_bytes) as data arrives
+        cancel (threading.Event, optional): Stops the transfer when set
+        timeout (float): Seconds without data before a connection counts as stalled
+        retries (int): Times each range is resumed after an error
+
+    Returns:
+        int: Bytes downloaded
+
+    Raises:
+        TransferError: When the probe fails, or a range fails after its retries (the message says why)
+        TransferCancelled: When cancel was set
+    """
+    headers = dict(headers or {})
+    accepts_ranges = True
+    if size is None:
+        try:
+            size, accepts_ranges = probe(url, headers, timeout)
+        except TRANSFER_ERRORS as e:
+            raise TransferError(f"Probe failed: {e!r}") from e
+    ranged = bool(size) and accepts_ranges
+    if not ranged:
+        connections, chunks = 1, [(0, None)]
+    else:
+        chunks = plan_chunks(size, chunk_size)
+        connections = max(1, min(connections, len(chunks)))
+
+    progress = _Progress(size, on_progress)
+
+    def per_connection_rate():
+        rate = rate_limit() if callable(rate_limit) else rate_limit
+        return rate / connections if rate else None
+
+    with open(path, "wb") as f:
+        if size:
+            f.truncate(size)
+
+    # A failed range stops the others instead of letting them finish for nothing
+    failed = threading.Event()
+    stop = _AnyEvent(cancel, failed)
+
+    def fetch_chunk(chunk):
+        start, end = chunk
+        # Bytes of the range already written, kept across retries
+        position = [start]
+        for attempt in range(retries + 1):
+            try:
+                _fetch_range(url, headers, path, position, end, ranged, timeout, per_connection_rate(), progress, stop)
+                return
+            except (OSError, http.client.HTTPException) as e:
+                if isinstance(e, urllib.error.HTTPError) and e.code < 500 and e.code != 429:
+                    raise TransferError(f"HTTP Error {e.code} for bytes {position[0]}-{end}") from e
+                if attempt == retries:
+                    raise TransferError(f"Range {position[0]}-{end} failed: {e}") from e
+                if not ranged:
+                    # Without ranges a broken stream can only start over
+                    position[0] = 0
+                    progress.reset()
+
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="chunk") as pool:
+        futures = [pool.submit(fetch_chunk, chunk) for chunk in chunks]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except BaseException as e:
+                failed.set()
+                errors.append(e)
+        if errors:
+            # The failure itself rather than the ranges it stopped
+            raise next((e for e in errors if not isinstance(e, TransferCancelled)), errors[0])
+    progress.finish()
+    if size and progress.downloaded != size:
+        raise TransferError(f"Transfer incomplete: {progress.downloaded} of {size} bytes")
+    return progress.downloaded
+
+
+def _fetch_range(url, headers, path, position, end, ranged, timeout, rate, progress, stop):
+    """Fetch bytes position[0]..end (None = to the end) into path at their offsets, advancing position[0]"""
+    offset = position[0]
+    request_headers = dict(headers)
+    if ranged:
+        request_headers["Range"] = f"bytes={offset}-{'' if end is None else end}"
+    request = urllib.request.Request(url, headers=request_headers)
+    started, received = time.monotonic(), 0
+    with urllib.request.urlopen(request, timeout=timeout) as response, open(path, "r+b") as f:
+        if ranged and response.status != 206:
+            raise TransferError(f"Server ignored the range request for bytes {offset}-{end}")
+        while end is None or offset <= end:
+            if stop.is_set():
+                raise TransferCancelled()
+            data = response.read(READ_SIZE if end is None else min(READ_SIZE, end - offset + 1))
+            if not data:
+                break
+            f.seek(offset)
+            f.write(data)
+            offset += len(data)
+            position[0] = offset
+            received += len(data)
+            progress.add(len(data))
+            if rate:
+                # Stay at this connection's share of the budget
+                ahead = received / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    if end is not None and offset <= end:
+        raise TransferError(f"Connection closed at byte {offset} of range ending {end}")
+
+
+class _Progress:
+    """Bytes downloaded by all connections, reported at most every PROGRESS_SECONDS"""
+
+    def __init__(self, total, on_progress):
+        self.total = total
+        self.on_progress = on_progress
+        self.downloaded = 0
+        self._lock = threading.Lock()
+        self._last_report = 0.0
+
+    def add(self, count):
+        with self._lock:
+            self.downloaded += count
+            now = time.monotonic()
+            if not self.on_progress or now - self._last_report < PROGRESS_SECONDS:
+                return
+            self._last_report = now
+            downloaded = self.downloaded
+        self.on_progress(downloaded, self.total)
+
+    def reset(self):
+        with self._lock:
+            self.downloaded = 0
+
+    def finish(self):
+        if self.on_progress:
+            self.on_progress(self.downloaded, self.total or self.downloaded)
+
+
+class _AnyEvent:
+    """Set when any of the given events (None ignored) is set"""
+
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
@@ -12,8 +12,11 @@ PARENT_FOLDER_NAME = "Audio Downloads"
 # PARENT_FOLDER_NAME = "YouTube Audio"   # Source-specific
 # PARENT_FOLDER_NAME = "Downloaded Music" # Clear purpose
 
-# Audio quality for downloads (in kbps)
+# Audio quality for downloads (in kbps), or "auto" to pick the bitrate per download from the
+# source stream: the lowest one that keeps the source's quality, within the bounds below
 AUDIO_QUALITY = "192K"
+AUTO_QUALITY_FLOOR = "128K"
+AUTO_QUALITY_CEILING = "320K"
 
 # Whether to create artist subfolders (True/False)
 USE_ARTIST_FOLDERS = True
@@ -22,3 +25,119 @@ USE_ARTIST_FOLDERS = True
 USE_SPOTIFY_METADATA = True   # Use cached Spotify metadata from user selections (no additional API calls)
 FALLBACK_GENRE = None         # Default genre if not found (None = leave blank)
 FALLBACK_YEAR = None          # Default year if not found (None = leave blank)
+
+# Delay between downloads in a batch, to be respectful to YouTube (seconds)
+DOWNLOAD_DELAY_SECONDS = 2
+
+# External services and tools. None = the real ones; point these at stubs for offline
+# testing and benchmarks (each can also be set with an environment variable of the same name)
+SPOTIFY_API_URL = None        # e.g. "http://127.0.0.1:9000/v1/"
+SPOTIFY_TOKEN_URL = None      # e.g. "http://127.0.0.1:9000/api/token"
+YOUTUBE_API_URL = None        # e.g. "http://127.0.0.1:9000/"
+YTDLP_COMMAND = None          # e.g. "/usr/local/bin/yt-dlp" (None = python -m yt_dlp)
+FFMPEG_COMMAND = None         # e.g. "/usr/local/bin/ffmpeg" (None = ffmpeg on PATH; used with several output profiles)
+
+# Job service (daemon mode: python main.py --serve)
+SERVICE_HOST = "127.0.0.1"    # Address the HTTP API listens on
+SERVICE_PORT = 8765           # Port the HTTP API listens on
+SERVICE_SOCKET = None         # Unix socket path to listen on instead of TCP (None = use host/port)
+SERVICE_WORKERS = 2           # Number of download workers kept alive
+JOB_QUEUE_PATH = None         # SQLite file for the persistent job queue (None = <download folder>/.mp3_downloader/jobs.db)
+JOB_LEASE_SECONDS = 60        # How long a node's claim on a job/track lasts without a heartbeat before others reclaim it
+
+# Metrics (Prometheus text format). The job service always serves them at /metrics;
+# batch runs write them to this file for the node_exporter textfile collector (None = don't write)
+METRICS_TEXTFILE = None       # e.g. "/var/lib/node_exporter/textfile_collector/mp3_downloader.prom"
+
+# Streaming pipeline (playlist/album links): how far each stage may run ahead of the next
+PIPELINE_QUEUE_SIZE = 8       # Searched songs waiting for a download
+PLAYLIST_PREFETCH_SONGS = 200 # Songs read from Spotify ahead of the searches (two playlist pages)
+
+# Library index: songs already in the download folder are not searched for or downloaded again
+SKIP_EXISTING = True          # Check the index before spending YouTube search quota
+LIBRARY_INDEX_PATH = None     # SQLite file (None = <download folder>/.mp3_downloader/library.db)
+
+# Shared audio store: each encoded file is kept once (by YouTube video ID + format + quality)
+# and library files are hardlinks into it. Put it on the same filesystem as the download
+# folders of every user/container sharing it (None = disabled)
+AUDIO_STORE_DIR = None        # e.g. "/downloads/.audio-store"
+
+# Staging: downloads run in a private folder per track and only the finished, tagged MP3
+# is moved into the library (atomically), so the library never holds partial files
+STAGING_DIR = None            # e.g. "/tmp/mp3-staging" on a tmpfs (None = <download folder>/.mp3_downloader/staging)
+STAGING_MAX_AGE_HOURS = 24    # Staging folders older than this are removed at startup, whoever left them
+
+# Disk space: each download's size is estimated from the track duration (MP3 at AUDIO_QUALITY
+# plus the source it is converted from); downloads wait, rather than fail, until the staging
+# and library volumes have room for them on top of the reserve
+DISK_RESERVE_MB = 500         # Free space always left on the staging and library volumes
+DISK_SPACE_POLL_SECONDS = 30  # How often free space is re-checked while downloads are paused
+SOURCE_AUDIO_KBPS = 160       # Assumed bitrate of the audio yt-dlp downloads before converting
+ESTIMATE_TRACK_SECONDS = 300  # Assumed length of tracks without Spotify duration
+
+# Cover art: the Spotify album image is embedded as the front cover (APIC). Each album's
+# image is fetched and resized once and cached on disk by album ID for all its tracks
+COVER_ART = True              # Embed album covers in tracks with Spotify metadata
+COVER_ART_DIR = None          # Cache folder (None = <download folder>/.mp3_downloader/covers)
+COVER_ART_SIZE = 500          # Maximum width/height in pixels (resizing needs Pillow)
+COVER_ART_QUALITY = 85        # JPEG quality when recompressing
+
+# Bandwidth budget shared by all downloads in flight: each yt-dlp download gets an even split
+# between the download slots, chunked transfers what is left; change it at runtime with
+# PUT /bandwidth (running yt-dlp downloads are restarted at their new rate)
+BANDWIDTH_LIMIT = None        # Bytes/second or e.g. "2M", "500K" (None = unlimited)
+
+# Stall detection: yt-dlp runs as long as it keeps making progress (no fixed timeout);
+# a download without progress for this long is killed and restarted where it left off
+STALL_TIMEOUT_SECONDS = 60    # Seconds without new bytes (or growing files) before a download counts as stalled
+STALL_RETRIES = 2             # Restarts of a stalled download before giving up on the track
+PROGRESS_INTERVAL_SECONDS = 10 # How often progress is printed when output is not a terminal
+
+# Trace profiling (--trace): spans beyond this many are flushed from memory to a temporary
+# file and copied into the trace when it is written
+TRACE_BUFFER_EVENTS = 10000
+
+# Parallel chunked transfer: a large source (long tracks, DJ mixes, live sets) is fetched as
+# byte ranges over several connections at once, for links where one stream is latency bound
+CHUNKED_CONNECTIONS = 1       # Connections per download (1 = a single stream, as before)
+CHUNKED_MIN_MB = 20           # Smaller sources are downloaded as one stream
+CHUNK_SIZE_MB = 4             # Size of each range request
+
+# Followed artists (python main.py --follow "Artist", then --sync): each sync downloads only
+# the releases that are new since the last one
+FOLLOW_LIST_PATH = None       # SQLite file (None = <download folder>/.mp3_downloader/follows.db)
+SYNC_PAGE_SIZE = 10           # Releases per album list page while looking for new ones
+
+# Interactive menu prefetching: while a menu is shown, the Spotify lookups the next menu
+# needs run in the background (album lists of the top artist candidates, then track lists)
+PREFETCH = True               # Prefetch in the background (False = fetch when a menu needs it)
+PREFETCH_ARTISTS = 3          # Top artist candidates whose album lists are fetched ahead
+PREFETCH_WORKERS = 4          # Lookups running at once
+PREFETCH_MAX_ENTRIES = 256    # Album and track lists kept (least recently used are dropped)
+
+# Output profiles: encode each download into several formats/qualities, each under its own root.
+# The source is downloaded and decoded once, and one ffmpeg run encodes every profile. The first
+# profile is the library (always mp3, written to the download folder). None = a single mp3 at AUDIO_QUALITY
+OUTPUT_PROFILES = None
+# OUTPUT_PROFILES = [
+#     {"name": "archive", "format": "mp3", "quality": "320K"},
+#     {"name": "mobile", "format": "mp3", "quality": "128K", "root": "~/Music/Mobile"},
+# ]
+
+# ReplayGain: EBU R128 loudness is measured by the same ffmpeg run that encodes each download
+# (downloads are then converted by ffmpeg directly rather than by yt-dlp), and written as
+# REPLAYGAIN_TRACK_* tags. Album gain is written to all of an album's tracks after each batch
+REPLAYGAIN = False
+REPLAYGAIN_REFERENCE_LUFS = -18.0 # ReplayGain 2.0 reference level
+
+# YouTube candidates: each search keeps its first few videos, and a download that fails
+# moves on to the next one. Transient errors (network, HTTP 5xx/429, stalls) are first
+# retried on the same video with exponential backoff
+YOUTUBE_SEARCH_RESULTS = 10   # Results requested per search (same quota cost as one)
+YOUTUBE_CANDIDATES = 3        # Videos kept per track, in YouTube's relevance order
+DOWNLOAD_RETRIES = 2          # Retries of a transient failure before trying the next candidate
+RETRY_BACKOFF_SECONDS = 2     # First retry delay, doubled for each further retry
+
+# Asyncio API (async_api.py, needs aiohttp): limits for one event loop
+ASYNC_MAX_DOWNLOADS = 100     # yt-dlp/ffmpeg processes running at once
+ASYNC_MAX_REQUESTS = 20       # Spotify/YouTube API requests in flight per client
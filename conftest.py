@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+import mp3_downloader
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "standins", "yt_dlp_standin.py")
+
+
+@pytest.fixture
+def downloader(monkeypatch, tmp_path):
+    """MP3Downloader writing into tmp_path, running the offline yt-dlp stand-in"""
+    monkeypatch.setattr(mp3_downloader, "YTDLP_COMMAND", f'"{sys.executable}" "{STANDIN}"')
+    monkeypatch.setenv("STANDIN_DOWNLOAD_SECONDS", "0.05")
+    downloader = mp3_downloader.MP3Downloader(str(tmp_path / "library"))
+    yield downloader
+    if downloader._library is not None:
+        downloader._library.close()
@@ -0,0 +1,141 @@
+"""
+Album cover art
+Covers come from the images of the Spotify album objects the song lists are
+built from. Each album's image is fetched, resized and recompressed once, then
+cached on disk by album ID, so every track of the album embeds the same bytes
+without another request, in this run and later ones.
+"""
+
+import io
+import os
+import re
+import threading
+import urllib.request
+import uuid
+
+import metrics
+
+# Pillow is optional: without it covers are embedded as Spotify serves them
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    from config import COVER_ART, COVER_ART_DIR, COVER_ART_SIZE, COVER_ART_QUALITY
+except ImportError:
+    COVER_ART = True
+    COVER_ART_DIR = None
+    COVER_ART_SIZE = 500
+    COVER_ART_QUALITY = 85
+
+# Environment variable takes precedence (e.g. a cache shared between containers)
+COVER_ART_DIR = os.getenv("COVER_ART_DIR") or COVER_ART_DIR
+
+FETCH_TIMEOUT_SECONDS = 15
+
+
+def pick_image(images, size=COVER_ART_SIZE):
+    """
+    URL of the smallest of Spotify's renditions (640, 300 and 64 px) at least size
+    pixels wide, or of the largest one if none is
+
+    Args:
+        images (list): 'images' of a Spotify album object
+    """
+    if not images:
+        return None
+    by_width = sorted(images, key=lambda image: image.get("width") or 0)
+    for image in by_width:
+        if (image.get("width") or 0) >= size:
+            return image["url"]
+    return by_width[-1]["url"]
+
+
+def shrink(data, size=COVER_ART_SIZE, quality=COVER_ART_QUALITY):
+    """Downscale an image to at most size pixels and recompress it as JPEG (unchanged without Pillow)"""
+    if not PIL_AVAILABLE:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format == "JPEG" and max(image.size) <= size:
+                return data
+            image = image.convert("RGB")
+            image.thumbnail((size, size))
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=quality, optimize=True)
+            return output.getvalue()
+    except OSError:
+        # Not an image Pillow can read; embed it as it is
+        return data
+
+
+class CoverArtCache:
+    """
+    On-disk cache of album covers keyed by Spotify album ID.
+    Safe to use from several threads; concurrent tracks of one album wait for a
+    single fetch.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # Albums whose image could not be fetched, not retried for every track in this run
+        self._failed = set()
+
+    def path(self, album_id):
+        return os.path.join(self.root, re.sub(r'[^0-9A-Za-z_-]', '', album_id) + ".jpg")
+
+    def get(self, album_id, image_url):
+        """
+        Cover image of an album, fetching and caching it on first use
+
+        Args:
+            album_id (str): Spotify album ID
+            image_url (str): Image URL (see pick_image)
+
+        Returns:
+            bytes: JPEG data, or None if the album has no usable image
+        """
+        if not album_id or not image_url:
+            return None
+        with self._locks_lock:
+            lock = self._locks.setdefault(album_id, threading.Lock())
+        with lock:
+            if album_id in self._failed:
+                return None
+            path = self.path(album_id)
+            try:
+                with open(path, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+            try:
+                data = shrink(self._fetch(image_url))
+            except (OSError, ValueError) as e:
+                self._failed.add(album_id)
+                print(f"⚠️  Could not fetch cover art for album {album_id}: {e}")
+                return None
+            # Write under a temporary name so other processes never read a partial image
+            temporary = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+            return data
+
+    @staticmethod
+    def _fetch(image_url):
+        with metrics.timed("cover_art_fetch"):
+            with urllib.request.urlopen(image_url, timeout=FETCH_TIMEOUT_SECONDS) as response:
+                return response.read()
+
+
+def open_cache(download_folder):
+    """The cover art cache for a library, or None when COVER_ART is off"""
+    if not COVER_ART:
+        return None
+    root = COVER_ART_DIR or os.path.join(download_folder, ".mp3_downloader", "covers")
+    return CoverArtCache(os.path.expanduser(root))
@@ -0,0 +1,254 @@
+"""
+Disk space admission control
+Before a download starts, its size is estimated from the track duration: the
+MP3 at AUDIO_QUALITY plus the source audio yt-dlp downloads and converts from.
+The download is admitted only when the staging and library volumes both have
+room for it on top of DISK_RESERVE_MB and of the downloads already running.
+Otherwise it waits, and resumes as soon as space is freed, so a large batch
+pauses on a full disk instead of failing partway through.
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from config import AUDIO_QUALITY
+except ImportError:
+    AUDIO_QUALITY = "192K"
+
+try:
+    from config import AUTO_QUALITY_CEILING
+except ImportError:
+    AUTO_QUALITY_CEILING = "320K"
+
+try:
+    from config import DISK_RESERVE_MB, DISK_SPACE_POLL_SECONDS, SOURCE_AUDIO_KBPS, ESTIMATE_TRACK_SECONDS
+except ImportError:
+    DISK_RESERVE_MB = 500
+    DISK_SPACE_POLL_SECONDS = 30
+    SOURCE_AUDIO_KBPS = 160
+    ESTIMATE_TRACK_SECONDS = 300
+
+# Average bitrates of LAME's VBR levels, for --audio-quality 0 (best) .. 9 (worst)
+VBR_KBPS = (245, 225, 190, 175, 165, 130, 115, 100, 85, 65)
+
+# ID3 tags and container overhead per file
+TAG_OVERHEAD_BYTES = 64 * 1024
+
+MB = 1024 * 1024
+
+
+def quality_kbps(quality=AUDIO_QUALITY):
+    """
+    Bitrate in kbit/s of an --audio-quality value: "192K", "320" or a VBR level 0-9;
+    "auto" is estimated at AUTO_QUALITY_CEILING, the most it can choose
+    """
+    if str(quality).strip().lower() == "auto":
+        quality = AUTO_QUALITY_CEILING
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*[kK]?\s*', str(quality))
+    if not match:
+        return VBR_KBPS[0]
+    value = float(match.group(1))
+    if value <= 9 and "k" not in str(quality).lower():
+        return VBR_KBPS[int(value)]
+    return value
+
+
+def estimate_track(duration_seconds=None, quality=AUDIO_QUALITY):
+    """
+    Estimate the disk space one download needs.
+
+    Args:
+        duration_seconds (float, optional): Track length (default: ESTIMATE_TRACK_SECONDS)
+        quality (str): Output --audio-quality, or a list of them for one file per output profile
+
+    Returns:
+        tuple: (staging_bytes, output_bytes). Staging holds the source and the outputs
+            at once during conversion; the libraries receive only the outputs.
+    """
+    seconds = duration_seconds or ESTIMATE_TRACK_SECONDS
+    qualities = quality if isinstance(quality, (list, tuple)) else [quality]
+    output_bytes = sum(int(seconds * quality_kbps(each) * 1000 / 8) + TAG_OVERHEAD_BYTES for each in qualities)
+    source_bytes = int(seconds * SOURCE_AUDIO_KBPS * 1000 / 8)
+    return source_bytes + output_bytes, output_bytes
+
+
+def duration_of(spotify_metadata):
+    """Track length in seconds from cached Spotify metadata, or None"""
+    duration_ms = (spotify_metadata or {}).get('duration_ms')
+    return duration_ms / 1000 if duration_ms else None
+
+
+class BatchTooLarge(Exception):
+    """A batch needs more space than a volume can hold above the reserve, however much is freed"""
+
+
+class DiskSpaceGate:
+    """
+    Admits downloads against free space on the staging and library volumes.
+    Shared by all download threads of a downloader: space reserved by running
+    downloads is not offered to new ones.
+    """
+
+    def __init__(self, staging_dir, library_dirs, reserve_mb=DISK_RESERVE_MB, poll_seconds=DISK_SPACE_POLL_SECONDS,
+                 quality=AUDIO_QUALITY):
+        """
+        Args:
+            staging_dir (str): Where downloads are converted and tagged
+            library_dirs (list): Where finished files end up (library, audio store)
+            reserve_mb (float): Free space always left untouched on every volume
+            poll_seconds (float): How often free space is re-checked while waiting
+            quality: Output quality (or list of them, see estimate_track) of the downloads
+        """
+        self.staging_dir = staging_dir
+        self.library_dirs = [path for path in library_dirs if path]
+        self.reserve_bytes = int(reserve_mb * MB)
+        self.poll_seconds = poll_seconds
+        self.quality = quality
+        self._reserved = {}
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def _device(path):
+        return os.stat(path).st_dev
+
+    def needs(self, staging_bytes, output_bytes, stored_bytes=0):
+        """
+        Space a download needs per volume.
+
+        Args:
+            staging_bytes, output_bytes (int): As returned by estimate_track
+            stored_bytes (int): Finished files of earlier downloads that will be on the
+                library volumes by then (for checking a whole batch)
+
+        Returns:
+            dict: {device: (path, bytes)}
+        """
+        staging_device = self._device(self.staging_dir)
+        needs = {staging_device: (self.staging_dir, staging_bytes)}
+        library_devices = set()
+        for path in self.library_dirs:
+            device = self._device(path)
+            if device in library_devices:
+                continue
+            library_devices.add(device)
+            # On the staging volume the finished file is renamed, not copied
+            extra = stored_bytes + (0 if device == staging_device else output_bytes)
+            previous_path, previous = needs.get(device, (path, 0))
+            needs[device] = (previous_path, previous + extra)
+        return needs
+
+    def shortfall(self, needs):
+        """
+        The first volume without room for needs, or None when everything fits
+
+        Returns:
+            tuple: (path, needed_bytes, available_bytes) or None
+        """
+        for device, (path, needed) in needs.items():
+            available = shutil.disk_usage(path).free - self._reserved.get(device, 0) - self.reserve_bytes
+            if needed > available:
+                return path, needed, max(0, available)
+        return None
+
+    def try_reserve(self, needs):
+        """
+        Reserve needs (see needs()) if the volumes have room for them now, without waiting
+
+        Returns:
+            tuple: None when reserved (release it with release()), else the shortfall
+        """
+        with self._condition:
+            short = self.shortfall(needs)
+            if short is None:
+                for device, (_, needed) in needs.items():
+                    self._reserved[device] = self._reserved.get(device, 0) + needed
+            return short
+
+    def release(self, needs):
+        """Give back space reserved by try_reserve"""
+        with self._condition:
+            for device, (_, needed) in needs.items():
+                self._reserved[device] -= needed
+            self._condition.notify_all()
+
+    def pause_message(self, short, label=None):
+        path, needed, available = short
+        return (f"⏸️  Low disk space on {path}: {label or 'download'} needs ~{needed / MB:.0f} MB, "
+                f"{available / MB:.0f} MB available above the {self.reserve_bytes / MB:.0f} MB reserve. "
+                f"Waiting for space to be freed...")
+
+    @contextmanager
+    def admit(self, staging_bytes, output_bytes, label=None, cancel=None):
+        """
+        Hold space for one download, waiting until it is available.
+
+        Args:
+            staging_bytes, output_bytes (int): As returned by estimate_track
+            label (str, optional): Download name for the pause message
+            cancel (callable, optional): Called at least once a second while waiting;
+                an exception it raises stops the wait
+        """
+        needs = self.needs(staging_bytes, output_bytes)
+        paused_at = None
+        with self._condition:
+            while True:
+                short = self.try_reserve(needs)
+                if short is None:
+                    break
+                if paused_at is None:
+                    paused_at = time.monotonic()
+                    print(self.pause_message(short, label))
+                # Woken early when another download finishes and releases its reservation
+                self._condition.wait(min(self.poll_seconds, 1) if cancel else self.poll_seconds)
+                if cancel:
+                    cancel()
+        if paused_at is not None:
+            print(f"▶️  Disk space available, resuming after {time.monotonic() - paused_at:.0f}s")
+        try:
+            yield
+        finally:
+            self.release(needs)
+
+    def check_batch(self, durations):
+        """
+        Compare the space a batch needs with what is free now, and with what the
+        volumes could ever offer it.
+
+        Args:
+            durations (list): Track lengths in seconds (None where unknown)
+
+        Returns:
+            dict: {"tracks", "needed_bytes", "fits_now", "shortfall", "exceeds_volume"}, where
+                fits_now is how many tracks (in order) the volumes have room for, shortfall
+                the (path, needed, available) of the first volume that runs out, if any, and
+                exceeds_volume the (path, needed, capacity) of a volume too small for the whole
+                batch even when empty above the reserve (None if the batch can fit once space is freed)
+        """
+        stored_bytes = 0
+        largest_staging = 0
+        fits_now = 0
+        short = None
+        with self._condition:
+            for duration in durations:
+                staging_bytes, output_bytes = estimate_track(duration, self.quality)
+                if short is None:
+                    short = self.shortfall(self.needs(staging_bytes, output_bytes, stored_bytes))
+                    if short is None:
+                        fits_now += 1
+                stored_bytes += output_bytes
+                largest_staging = max(largest_staging, staging_bytes)
+        exceeds = None
+        if durations:
+            # Every finished file on the library volumes, plus the largest download in staging
+            for device, (path, needed) in self.needs(largest_staging, 0, stored_bytes).items():
+                capacity = shutil.disk_usage(path).total - self.reserve_bytes
+                if needed > capacity:
+                    exceeds = (path, needed, max(0, capacity))
+                    break
+        return {"tracks": len(durations), "needed_bytes": stored_bytes, "fits_now": fits_now, "shortfall": short,
+                "exceeds_volume": exceeds}
@@ -0,0 +1,237 @@
+"""
+Followed artists and new-release sync
+Following an artist stores a snapshot of its releases (album and single IDs
+with their release dates) in SQLite. A sync then lists each artist's releases
+newest first, one small page at a time, and stops at the first release older
+than the newest one of its group in the snapshot, so an artist without new
+releases costs one page per album group however large its catalog is. Only the
+tracks of the new releases are searched for and downloaded. A release with a
+song that failed to download stays pending and is read again by the next sync.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import title_normalizer
+
+try:
+    from config import FOLLOW_LIST_PATH, SYNC_PAGE_SIZE
+except ImportError:
+    FOLLOW_LIST_PATH = None
+    SYNC_PAGE_SIZE = 10
+
+# Album groups that are followed; the Web API lists each group's releases newest first
+SYNC_GROUPS = ("album", "single")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artists (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    followed_at REAL NOT NULL,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS releases (
+    artist_id TEXT NOT NULL REFERENCES artists(id),
+    album_id TEXT NOT NULL,
+    album_group TEXT,
+    release_date TEXT,
+    complete INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (artist_id, album_id)
+);
+"""
+
+
+def default_follow_path(download_folder):
+    return FOLLOW_LIST_PATH or os.path.join(download_folder, ".mp3_downloader", "follows.db")
+
+
+def older(release_date, cutoff):
+    """
+    Whether release_date is before cutoff, comparing only the precision both have
+    (Spotify dates are "2019", "2019-05" or "2019-05-03")
+    """
+    if not release_date or not cutoff:
+        return False
+    length = min(len(release_date), len(cutoff))
+    return release_date[:length] < cutoff[:length]
+
+
+def is_own_release(album, artist_id):
+    """Whether the artist is the primary artist of a release (as in the album menu)"""
+    return album.get("album_type") != "compilation" and bool(album.get("artists")) \
+        and album["artists"][0]["id"] == artist_id
+
+
+class FollowList:
+    """SQLite-backed list of followed artists and the releases known of each"""
+
+    def __init__(self, db_path):
+        """
+        Open (or create) the follow list
+
+        Args:
+            db_path (str): Path to the SQLite file
+        """
+        folder = os.path.dirname(db_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def follow(self, artist_info, releases):
+        """
+        Follow an artist, with its current releases as the snapshot later syncs start from
+
+        Args:
+            artist_info (dict): {"name", "id"}
+            releases (list): Spotify album objects of the artist's catalog
+
+        Returns:
+            bool: False if the artist was already followed (its snapshot is kept)
+        """
+        now = time.time()
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO artists (id, name, followed_at, synced_at) VALUES (?, ?, ?, ?)",
+                (artist_info["id"], artist_info["name"], now, now),
+            ).rowcount
+        if inserted:
+            self.record(artist_info["id"], releases)
+        return bool(inserted)
+
+    def unfollow(self, artist):
+        """
+        Stop following an artist, by Spotify ID or (case-insensitive) name
+
+        Returns:
+            str: Name of the artist unfollowed, or None if it was not followed
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, name FROM artists WHERE id = ? OR lower(name) = lower(?)", (artist, artist)
+            ).fetchone()
+            if not row:
+                return None
+            self._conn.execute("DELETE FROM releases WHERE artist_id = ?", (row["id"],))
+            self._conn.execute("DELETE FROM artists WHERE id = ?", (row["id"],))
+        return row["name"]
+
+    def artists(self):
+        """Followed artists by name, each with 'id', 'name', 'synced_at', 'releases' (count) and 'latest'"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT artists.id, artists.name, artists.synced_at, COUNT(releases.album_id) AS releases, "
+                "MAX(releases.release_date) AS latest FROM artists "
+                "LEFT JOIN releases ON releases.artist_id = artists.id "
+                "GROUP BY artists.id ORDER BY lower(artists.name)"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def known_releases(self, artist_id):
+        """
+        Returns:
+            set: Album IDs of the artist's releases that are complete (not pending a retry)
+        """
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                "SELECT album_id FROM releases WHERE artist_id = ? AND complete", (artist_id,)
+            )}
+
+    def resume_dates(self, artist_id):
+        """
+        Release date from which a sync reads each album group again: the newest
+        complete release's, or the oldest pending release's if that is earlier
+
+        Returns:
+            dict: Release date by album group
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT album_group, MAX(CASE WHEN complete THEN release_date END), "
+                "MIN(CASE WHEN NOT complete THEN release_date END) FROM releases WHERE artist_id = ? "
+                "GROUP BY album_group",
+                (artist_id,),
+            ).fetchall()
+        return {group: min(date for date in (latest, pending) if date) if latest or pending else None
+                for group, latest, pending in rows}
+
+    def record(self, artist_id, releases, pending=()):
+        """
+        Add releases (Spotify album objects) to the artist's snapshot and mark it synced
+
+        Args:
+            pending (iterable): Album IDs among releases whose songs did not all download
+        """
+        pending = set(pending)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO releases (artist_id, album_id, album_group, release_date, complete) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT(artist_id, album_id) DO UPDATE SET complete = excluded.complete",
+                    [(artist_id, album["id"], album.get("album_group"), album.get("release_date"),
+                      album["id"] not in pending)
+                     for album in releases],
+                )
+                self._conn.execute("UPDATE artists SET synced_at = ? WHERE id = ?", (time.time(), artist_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+def catalog(song_menu, artist_id):
+    """Every release of the artist in SYNC_GROUPS (the snapshot taken when following)"""
+    return [album for group in SYNC_GROUPS for album in song_menu.iter_artist_releases(artist_id, group)]
+
+
+def new_releases(song_menu, artist_id, known, resume_dates, page_size=SYNC_PAGE_SIZE):
+    """
+    Releases of the artist missing from its snapshot (or pending), reading each
+    group's pages only until releases are older than the group's resume date
+
+    Args:
+        known (set): FollowList.known_releases of the artist
+        resume_dates (dict): FollowList.resume_dates of the artist
+
+    Returns:
+        list: Spotify album objects, newest first per group
+    """
+    found = []
+    for group in SYNC_GROUPS:
+        releases = song_menu.iter_artist_releases(artist_id, group, page_size)
+        for album in releases:
+            if older(album.get("release_date"), resume_dates.get(group)):
+                break
+            if album["id"] not in known:
+                found.append(album)
+        # Stop paging: the rest of the group is known
+        releases.close()
+    return found
+
+
+def new_songs(song_menu, artist_id, releases):
+    """
+    Song dicts of the artist's own new releases, oldest release first, without
+    songs repeated across them (a single that is also on the new album)
+    """
+    songs = []
+    seen = set()
+    own = [album for album in releases if is_own_release(album, artist_id)]
+    for album in sorted(own, key=lambda album: album.get("release_date") or ""):
+        for song in song_menu.get_album_songs(album):
+            key = title_normalizer.match_key(song["name"])
+            if key not in seen:
+                seen.add(key)
+                songs.append(song)
+    return songs
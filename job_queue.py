@@ -0,0 +1,457 @@
+"""
+Persistent job queue for the long-running job service
+Jobs and their expanded tracks are stored in SQLite so queued work survives restarts.
+Several service nodes may share one queue file (e.g. on a shared downloads volume):
+work is claimed with a lease that the owner renews by heartbeat, and leases that
+expire because a node died are reclaimed by the others.
+
+Claims are scheduled rather than taken in submission order: every job has a
+priority class (interactive single tracks, then albums, then bulk backfill), and
+the next track is the most urgent class's, from the submitter with the fewest
+tracks running (then the one served longest ago), from that submitter's shortest
+job (by total track duration). A single-song request therefore starts as soon as
+a worker is free, ahead of a queued 2,000-track discography, and submitters of
+the same class take turns instead of waiting for each other's whole jobs.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+JOB_KINDS = ("artist", "album", "track", "url")
+
+# Priority classes, most urgent first; a class's queued tracks are all claimed before the next class's
+PRIORITY_CLASSES = ("interactive", "album", "bulk")
+# Class of each job kind unless the submission names one
+DEFAULT_PRIORITY = {"track": "interactive", "url": "interactive", "album": "album", "artist": "bulk"}
+
+try:
+    from config import ESTIMATE_TRACK_SECONDS
+except ImportError:
+    ESTIMATE_TRACK_SECONDS = 300
+
+# Seconds a claim stays valid without a heartbeat
+DEFAULT_LEASE_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    lease_owner TEXT,
+    lease_expires REAL,
+    priority TEXT,
+    submitter TEXT,
+    duration_ms INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id),
+    position INTEGER NOT NULL,
+    artist TEXT,
+    song TEXT,
+    album TEXT,
+    url TEXT,
+    metadata TEXT NOT NULL,
+    status TEXT NOT NULL,
+    file_path TEXT,
+    error TEXT,
+    lease_owner TEXT,
+    lease_expires REAL,
+    duration_ms INTEGER,
+    queued_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS submitters (
+    name TEXT PRIMARY KEY,
+    last_claim REAL NOT NULL,
+    running INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tracks_status ON tracks(status, job_id, position);
+CREATE INDEX IF NOT EXISTS tracks_job ON tracks(job_id);
+"""
+
+# Order in which claim_track hands out tracks (see the module docstring). Submitters are
+# ranked by the tracks they have running (kept in submitters.running by claims and
+# outcomes, not recounted per claim) and by when they were last served
+TRACK_ORDER = (
+    "CASE jobs.priority WHEN 'interactive' THEN 0 WHEN 'album' THEN 1 ELSE 2 END, "
+    "COALESCE(submitters.running, 0), COALESCE(submitters.last_claim, 0), "
+    "jobs.duration_ms, jobs.created_at, tracks.position"
+)
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of download jobs.
+
+    A job (artist/album/track/url) starts as 'queued', is expanded into tracks
+    while 'resolving', and is 'running' until every track is done or failed.
+    Resolving jobs and running tracks carry a lease (owner + expiry time);
+    only the current lease owner can record the outcome.
+    """
+
+    def __init__(self, db_path):
+        """
+        Open (or create) the queue database
+
+        Args:
+            db_path (str): Path to the SQLite file
+        """
+        folder = os.path.dirname(db_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Other nodes hold the write lock only briefly, so wait rather than fail
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def recover(self):
+        """
+        Requeue work whose lease has expired (its owner stopped or crashed).
+        Claims also pick up expired work, this just makes it visible as queued.
+
+        Returns:
+            int: Number of jobs and tracks put back in the queue
+        """
+        now = time.time()
+        with self._lock:
+            jobs = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE status = 'resolving' AND (lease_expires IS NULL OR lease_expires < ?)", (now, now)
+            ).rowcount
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                tracks = self._conn.execute(
+                    "UPDATE tracks SET status = 'queued', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                    "WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)", (now, now)
+                ).rowcount
+                if tracks:
+                    self._recount_running()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return jobs + tracks
+
+    def _recount_running(self):
+        """Set every submitter's running count from the tracks (after requeueing)"""
+        self._conn.execute(
+            "UPDATE submitters SET running = (SELECT COUNT(*) FROM tracks JOIN jobs ON jobs.id = tracks.job_id "
+            "WHERE tracks.status = 'running' AND jobs.submitter = submitters.name)"
+        )
+
+    def submit(self, kind, payload, priority=None, submitter=None):
+        """
+        Add a new job to the queue
+
+        Args:
+            kind (str): One of JOB_KINDS
+            payload (dict): Job parameters (artist, album, song, url, ...)
+            priority (str, optional): One of PRIORITY_CLASSES. If None, the kind's DEFAULT_PRIORITY
+            submitter (str, optional): Who submitted the job, for fair sharing between submitters
+
+        Returns:
+            str: The new job ID
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'. Expected one of: {', '.join(JOB_KINDS)}")
+        priority = priority or DEFAULT_PRIORITY[kind]
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority '{priority}'. Expected one of: {', '.join(PRIORITY_CLASSES)}")
+
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, priority, submitter, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), priority, submitter or "", now, now),
+            )
+        return job_id
+
+    def claim_job(self, owner, lease_seconds=DEFAULT_LEASE_SECONDS, priorities=PRIORITY_CLASSES):
+        """
+        Lease the most urgent, then oldest, queued (or abandoned) job for resolution
+
+        Args:
+            owner (str): Unique name of the claiming node/thread
+            lease_seconds (float): How long the claim is valid without a heartbeat
+            priorities (tuple): Only claim jobs of these priority classes
+
+        Returns:
+            dict: Job with 'id', 'kind', 'payload', 'priority' and 'created_at', or None if nothing is available
+        """
+        placeholders = ", ".join("?" for _ in priorities)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT id, kind, payload, priority, created_at FROM jobs "
+                    "WHERE (status = 'queued' OR (status = 'resolving' AND lease_expires < ?)) "
+                    f"AND priority IN ({placeholders}) "
+                    "ORDER BY CASE priority WHEN 'interactive' THEN 0 WHEN 'album' THEN 1 ELSE 2 END, created_at "
+                    "LIMIT 1",
+                    (now, *priorities),
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'resolving', lease_owner = ?, lease_expires = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (owner, now + lease_seconds, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if not row:
+            return None
+        return {"id": row["id"], "kind": row["kind"], "payload": json.loads(row["payload"]),
+                "priority": row["priority"], "created_at": row["created_at"]}
+
+    def add_tracks(self, job_id, tracks, owner):
+        """
+        Store the resolved tracks of a job and mark it running
+
+        Args:
+            job_id (str): Job the tracks belong to
+            tracks (list): Dicts with 'artist', 'song', 'album', 'url' and 'metadata'
+            owner (str): Lease owner that resolved the job
+
+        Returns:
+            bool: False if the lease was lost and another node owns the job now
+        """
+        now = time.time()
+        rows = [
+            (job_id, position, track.get("artist"), track.get("song"), track.get("album"),
+             track.get("url"), json.dumps(track.get("metadata") or {}), (track.get("metadata") or {}).get("duration_ms"),
+             now, now)
+            for position, track in enumerate(tracks, 1)
+        ]
+        # The job's length for shortest-job-first, tracks without a Spotify duration at the usual estimate
+        job_duration = sum(row[7] or ESTIMATE_TRACK_SECONDS * 1000 for row in rows)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = self._conn.execute(
+                    "UPDATE jobs SET status = ?, duration_ms = ?, lease_owner = NULL, lease_expires = NULL, "
+                    "updated_at = ? WHERE id = ? AND status = 'resolving' AND lease_owner = ?",
+                    ("running" if rows else "done", job_duration, now, job_id, owner),
+                ).rowcount
+                if updated:
+                    self._conn.executemany(
+                        "INSERT INTO tracks (job_id, position, artist, song, album, url, metadata, status, duration_ms, "
+                        "queued_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                        rows,
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return bool(updated)
+
+    def fail_job(self, job_id, error, owner):
+        """Mark a job as failed (e.g. the artist or album could not be found)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'resolving' AND lease_owner = ?",
+                (str(error), time.time(), job_id, owner),
+            )
+
+    def claim_track(self, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Lease the next queued (or abandoned) track: most urgent class first, then the
+        submitter with the fewest tracks running (served longest ago on a tie), then
+        that submitter's shortest job
+
+        Args:
+            owner (str): Unique name of the claiming node/worker
+            lease_seconds (float): How long the claim is valid without a heartbeat
+
+        Returns:
+            dict: Track row (with decoded 'metadata', plus the job's 'priority' and
+                'submitter'), or None if nothing is available
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT tracks.*, jobs.priority, jobs.submitter FROM tracks JOIN jobs ON jobs.id = tracks.job_id "
+                    "LEFT JOIN submitters ON submitters.name = jobs.submitter "
+                    "WHERE tracks.status = 'queued' OR (tracks.status = 'running' AND tracks.lease_expires < ?) "
+                    f"ORDER BY {TRACK_ORDER} LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE tracks SET status = 'running', lease_owner = ?, lease_expires = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (owner, now + lease_seconds, now, row["id"]),
+                    )
+                    # A reclaimed track (its lease expired) is already counted as running
+                    started = 1 if row["status"] == "queued" else 0
+                    self._conn.execute(
+                        "INSERT INTO submitters (name, last_claim, running) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET last_claim = excluded.last_claim, "
+                        "running = running + excluded.running",
+                        (row["submitter"], now, started),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if not row:
+            return None
+        track = dict(row)
+        track["metadata"] = json.loads(track["metadata"])
+        return track
+
+    def heartbeat(self, table, item_id, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Extend a lease held by owner
+
+        Args:
+            table (str): 'jobs' or 'tracks'
+            item_id: Job or track ID
+            owner (str): Current lease owner
+            lease_seconds (float): New lease length from now
+
+        Returns:
+            bool: False if the lease has been lost to another node
+        """
+        if table not in ("jobs", "tracks"):
+            raise ValueError(f"Unknown table '{table}'")
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                f"UPDATE {table} SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status IN ('resolving', 'running')",
+                (now + lease_seconds, now, item_id, owner),
+            ).rowcount
+        return bool(updated)
+
+    def finish_track(self, track_id, owner, file_path=None, error=None):
+        """
+        Record the outcome of a track and close its job when nothing is left.
+        Only the current lease owner can do this, so each track is recorded exactly once.
+
+        Args:
+            track_id (int): Track to update
+            owner (str): Lease owner reporting the outcome
+            file_path (str, optional): Downloaded file (marks the track done)
+            error (str, optional): Failure reason (marks the track failed)
+
+        Returns:
+            bool: False if the lease was lost and the outcome was discarded
+        """
+        status = "done" if file_path else "failed"
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = self._conn.execute(
+                    "UPDATE tracks SET status = ?, file_path = ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                    "updated_at = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                    (status, file_path, error, now, track_id, owner),
+                ).rowcount
+                if updated:
+                    job_id = self._conn.execute("SELECT job_id FROM tracks WHERE id = ?", (track_id,)).fetchone()[0]
+                    self._conn.execute(
+                        "UPDATE submitters SET running = MAX(running - 1, 0) "
+                        "WHERE name = (SELECT submitter FROM jobs WHERE id = ?)",
+                        (job_id,),
+                    )
+                    remaining = self._conn.execute(
+                        "SELECT COUNT(*) FROM tracks WHERE job_id = ? AND status IN ('queued', 'running')", (job_id,)
+                    ).fetchone()[0]
+                    if not remaining:
+                        self._conn.execute(
+                            "UPDATE jobs SET status = 'done', updated_at = ? WHERE id = ?", (now, job_id)
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return bool(updated)
+
+    def job_status(self, job_id):
+        """
+        Get a job with its progress counters
+
+        Returns:
+            dict: Job status, or None if the job does not exist
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM tracks WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        return self._job_dict(row, counts)
+
+    def list_jobs(self, limit=100):
+        """Get the most recent jobs with their progress counters"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            counts = {}
+            for job_id, status, count in self._conn.execute(
+                "SELECT job_id, status, COUNT(*) FROM tracks GROUP BY job_id, status"
+            ):
+                counts.setdefault(job_id, {})[status] = count
+        return [self._job_dict(row, counts.get(row["id"], {})) for row in rows]
+
+    def job_tracks(self, job_id):
+        """Get every track of a job in order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, position, artist, song, album, url, status, file_path, error, lease_owner "
+                "FROM tracks WHERE job_id = ? ORDER BY position",
+                (job_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _job_dict(self, row, counts):
+        total = sum(counts.values())
+        finished = counts.get("done", 0) + counts.get("failed", 0)
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "payload": json.loads(row["payload"]),
+            "status": row["status"],
+            "priority": row["priority"],
+            "submitter": row["submitter"],
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "progress": {
+                "total": total,
+                "queued": counts.get("queued", 0),
+                "running": counts.get("running", 0),
+                "done": counts.get("done", 0),
+                "failed": counts.get("failed", 0),
+                "percent": round(100.0 * finished / total, 1) if total else 0.0,
+                # Share of the finished tracks that were downloaded
+                "success_rate": round(100.0 * counts.get("done", 0) / finished, 1) if finished else None,
+            },
+        }
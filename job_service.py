@@ -0,0 +1,526 @@
+"""
+Long-running job service
+Keeps the Spotify client, YouTube clients and yt-dlp warm, accepts jobs over a
+local HTTP API (TCP or Unix socket) and works through them with a worker pool.
+Several services (e.g. containers) can share one queue file and split the work.
+Tracks are handed to workers by priority class, fair share between submitters
+and shortest job first (see job_queue).
+"""
+
+import json
+import os
+import re
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from CallYoutube import CallYoutube
+from CreateSongMenu import CreateSongMenu
+import bandwidth
+import metrics
+import tracing
+from job_queue import DEFAULT_LEASE_SECONDS, JOB_KINDS, PRIORITY_CLASSES, JobQueue
+from mp3_downloader import DownloadCancelled, MP3Downloader
+
+try:
+    from config import SERVICE_HOST, SERVICE_PORT, SERVICE_SOCKET, SERVICE_WORKERS, JOB_QUEUE_PATH, JOB_LEASE_SECONDS
+except ImportError:
+    SERVICE_HOST = "127.0.0.1"
+    SERVICE_PORT = 8765
+    SERVICE_SOCKET = None
+    SERVICE_WORKERS = 2
+    JOB_QUEUE_PATH = None
+    JOB_LEASE_SECONDS = DEFAULT_LEASE_SECONDS
+
+# Fields each job kind needs in its payload (album jobs may use album_id instead)
+REQUIRED_FIELDS = {
+    "artist": ("artist",),
+    "album": ("artist", "album"),
+    "track": ("artist", "song"),
+    "url": ("url",),
+}
+
+
+class Lease:
+    """
+    Keeps a queue lease alive from a background thread while work is in progress
+
+    Usage:
+        with Lease(queue, "tracks", track_id, owner) as lease:
+            ...
+            if lease.lost: ...
+    """
+
+    def __init__(self, queue, table, item_id, owner, lease_seconds=None):
+        self.queue = queue
+        self.table = table
+        self.item_id = item_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds or JOB_LEASE_SECONDS
+        self.lost = False
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{owner}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+    def _run(self):
+        # Renew well before expiry so one slow write does not lose the lease
+        while not self._done.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.table, self.item_id, self.owner, self.lease_seconds):
+                    self.lost = True
+                    print(f"⚠️  Lease on {self.table[:-1]} {self.item_id} was lost to another node")
+                    return
+            except Exception as e:
+                print(f"⚠️  Heartbeat failed for {self.table[:-1]} {self.item_id}: {e}")
+
+
+def validate_job(kind, payload):
+    """
+    Check a job submission before it is queued
+
+    Returns:
+        str: Error message, or None if the job is valid
+    """
+    if kind not in JOB_KINDS:
+        return f"Unknown job kind '{kind}'. Expected one of: {', '.join(JOB_KINDS)}"
+    if payload.get("priority") not in (None, *PRIORITY_CLASSES):
+        return f"Unknown priority '{payload['priority']}'. Expected one of: {', '.join(PRIORITY_CLASSES)}"
+    if kind == "album" and payload.get("album_id"):
+        return None
+    missing = [field for field in REQUIRED_FIELDS[kind] if not payload.get(field)]
+    if missing:
+        return f"Missing field(s) for {kind} job: {', '.join(missing)}"
+    return None
+
+
+class JobService:
+    """
+    Worker pool plus resolver thread around a persistent JobQueue.
+
+    The resolver expands artist/album/track jobs into tracks using Spotify (a
+    second resolver takes only interactive jobs, so a single song is not stuck
+    behind the expansion of a large artist job); each worker owns a YouTube
+    client and searches/downloads one track at a time.
+    """
+
+    def __init__(self, queue, workers=None, downloader=None):
+        """
+        Warm up every client once for the lifetime of the service
+
+        Args:
+            queue (JobQueue): Persistent queue to work from
+            workers (int, optional): Number of download workers. If None, uses config default
+            downloader (MP3Downloader, optional): Already initialised downloader to reuse
+        """
+        self.queue = queue
+        self.worker_count = workers or SERVICE_WORKERS
+        # Lease owner prefix, unique per process across every node sharing the queue
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads = []
+
+        print("🔥 Warming up clients...")
+        self.song_menu = CreateSongMenu()
+        self.downloader = downloader or MP3Downloader()
+        # Each worker's download gets an equal share of the bandwidth budget
+        self.downloader.bandwidth.set_slots(self.worker_count)
+        # googleapiclient clients are not thread-safe, so each worker gets its own
+        self.searchers = [CallYoutube({}) for _ in range(self.worker_count)]
+        # Albums of the tracks this node downloaded per job, for album gain when the job is done
+        self._job_albums = {}
+        self._job_albums_lock = threading.Lock()
+
+    def start(self):
+        """Recover interrupted work and start the resolver and worker threads"""
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"♻️  Requeued {recovered} interrupted job(s)/track(s)")
+
+        self._threads.append(threading.Thread(target=self._resolver_loop, name="resolver", daemon=True))
+        self._threads.append(threading.Thread(
+            target=self._resolver_loop, args=(("interactive",),), name="resolver-interactive", daemon=True
+        ))
+        for i, searcher in enumerate(self.searchers, 1):
+            self._threads.append(threading.Thread(
+                target=self._worker_loop, args=(searcher,), name=f"worker-{i}", daemon=True
+            ))
+        for thread in self._threads:
+            thread.start()
+        print(f"👷 Started {self.worker_count} worker(s) on node {self.node_id}")
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def submit(self, kind, payload, priority=None, submitter=None):
+        """Queue a job and wake the resolver"""
+        job_id = self.queue.submit(kind, payload, priority=priority, submitter=submitter)
+        self._wakeup.set()
+        return job_id
+
+    def _wait_for_work(self):
+        self._wakeup.wait(timeout=1.0)
+        self._wakeup.clear()
+
+    def _resolver_loop(self, priorities=PRIORITY_CLASSES):
+        owner = f"{self.node_id}/{threading.current_thread().name}"
+        while not self._stop.is_set():
+            job = self.queue.claim_job(owner, JOB_LEASE_SECONDS, priorities)
+            if not job:
+                self._wait_for_work()
+                continue
+
+            with Lease(self.queue, "jobs", job["id"], owner):
+                try:
+                    tracks = self.resolve(job["kind"], job["payload"])
+                except Exception as e:
+                    print(f"❌ Could not resolve job {job['id']}: {e}")
+                    self.queue.fail_job(job["id"], e, owner)
+                    continue
+
+                if tracks is None:
+                    self.queue.fail_job(job["id"], "Nothing found on Spotify", owner)
+                    continue
+
+                if self.queue.add_tracks(job["id"], tracks, owner):
+                    print(f"📋 Job {job['id']} ({job['kind']}): {len(tracks)} track(s) queued")
+                    self._wakeup.set()
+
+    def resolve(self, kind, payload):
+        """
+        Expand a job into the tracks to download
+
+        Returns:
+            list: Track dicts for JobQueue.add_tracks, or None if nothing was found
+        """
+        if kind == "url":
+            return [{
+                "artist": payload.get("artist"),
+                "song": payload.get("song"),
+                "album": payload.get("album"),
+                "url": payload["url"],
+                "metadata": {},
+            }]
+
+        if kind == "track":
+            song = self.song_menu.find_track(payload["artist"], payload["song"])
+            if song:
+                artist, songs = payload["artist"], [song]
+            else:
+                # Still worth a YouTube search without Spotify metadata
+                artist, songs = payload["artist"], [{"name": payload["song"]}]
+
+        elif kind == "album":
+            if payload.get("album_id"):
+                album = self.song_menu.sp.album(payload["album_id"])
+            else:
+                album = self.song_menu.find_album(payload["artist"], payload["album"])
+            if not album:
+                return None
+            artist = payload.get("artist") or album["artists"][0]["name"]
+            songs = self.song_menu.get_album_songs(album)
+
+        else:  # artist
+            artist_info = self.song_menu.find_artist(payload["artist"])
+            if not artist_info:
+                return None
+            artist = artist_info["name"]
+            songs = self.song_menu.songs_from_albums(self.song_menu.get_album_data(artist_info).values())
+
+        return [{
+            "artist": artist,
+            "song": song["name"],
+            "album": song.get("album"),
+            "url": None,
+            "metadata": {
+                "album": song.get("album"),
+                "release_date": song.get("release_date"),
+                "spotify_id": song.get("spotify_id"),
+                "album_id": song.get("album_id"),
+                "album_image": song.get("album_image"),
+                "duration_ms": song.get("duration_ms"),
+            },
+        } for song in songs]
+
+    def _worker_loop(self, searcher):
+        owner = f"{self.node_id}/{threading.current_thread().name}"
+        while not self._stop.is_set():
+            track = self.queue.claim_track(owner, JOB_LEASE_SECONDS)
+            if not track:
+                self._wait_for_work()
+                continue
+            metrics.QUEUE_WAIT.observe(time.time() - track["queued_at"], priority=track["priority"])
+            self.run_track(searcher, track, owner)
+
+    def run_track(self, searcher, track, owner):
+        """
+        Process a claimed track while keeping its lease alive, and record the outcome.
+        The download is abandoned as soon as the lease is lost to another node.
+        """
+        with Lease(self.queue, "tracks", track["id"], owner) as lease, \
+                tracing.track_context(f"{track['artist']} - {track['song']}" if track["song"] else track["url"]):
+            try:
+                file_path, error = self.process_track(searcher, track, cancel=lambda: lease.lost)
+            except DownloadCancelled:
+                print(f"⚠️  Track {track['id']} was reclaimed by another node, download abandoned")
+                return
+            except Exception as e:
+                file_path, error = None, str(e)
+        if not self.queue.finish_track(track["id"], owner, file_path=file_path, error=error):
+            print(f"⚠️  Track {track['id']} was reclaimed by another node, result not recorded")
+        elif (self.queue.job_status(track["job_id"]) or {}).get("status") == "done":
+            self._write_album_gain(track["job_id"])
+
+    def _write_album_gain(self, job_id):
+        """Album ReplayGain for a finished job, from the loudness measured while its tracks encoded"""
+        with self._job_albums_lock:
+            album_keys = self._job_albums.pop(job_id, None)
+        if album_keys:
+            self.downloader.write_album_gain(album_keys)
+
+    def process_track(self, searcher, track, cancel=None):
+        """
+        Search (if needed) and download a single track
+
+        Args:
+            cancel (callable, optional): Stops the download once it returns True
+
+        Returns:
+            tuple: (file_path, error) where exactly one is None
+
+        Raises:
+            DownloadCancelled: When cancel returned True
+        """
+        urls = [track["url"]] if track["url"] else None
+        if not urls:
+            existing = self.downloader.find_existing(track["artist"], track["song"])
+            if existing:
+                print(f"📚 Already in library: {existing}")
+                return existing, None
+            urls, _, _ = searcher.search_youtube(track["artist"], track["song"])
+            if not urls:
+                return None, "No video found"
+
+        # Searched tracks fall back on the next candidate if a video cannot be downloaded
+        file_path = self.downloader.download_with_fallback(
+            urls, track["artist"], track["song"], track["album"], track["metadata"] or None, cancel=cancel
+        )
+
+        if not file_path:
+            return None, "Download failed"
+        album_key = self.downloader.album_key(track["artist"], track["album"], track["metadata"])
+        if album_key is not None:
+            with self._job_albums_lock:
+                self._job_albums.setdefault(track["job_id"], set()).add(album_key)
+        return file_path, None
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API:
+        POST /jobs               submit {"kind": ..., ...payload} -> {"id": ...}; optional "priority"
+                                 (interactive, album or bulk) and "submitter" (else X-Submitter or client address)
+        GET  /jobs               recent jobs with progress
+        GET  /jobs/<id>          one job with progress
+        GET  /jobs/<id>/tracks   per-track status
+        GET  /bandwidth          bandwidth budget and downloads in flight
+        GET  /downloads          live progress of running downloads
+        PUT  /bandwidth          change the budget {"limit": "2M"} (null for unlimited)
+        GET  /metrics            Prometheus metrics
+        GET  /health             liveness check
+    """
+
+    service = None  # Set by make_server
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+
+        if path == "/health":
+            return self._send_json(200, {"status": "ok"})
+
+        if path == "/metrics":
+            data = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        if path == "/jobs":
+            return self._send_json(200, {"jobs": self.service.queue.list_jobs()})
+
+        if path == "/bandwidth":
+            return self._send_json(200, self.service.downloader.bandwidth.status())
+
+        if path == "/downloads":
+            return self._send_json(200, {"downloads": self.service.downloader.active_downloads()})
+
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)(/tracks)?", path)
+        if match:
+            job = self.service.queue.job_status(match.group(1))
+            if not job:
+                return self._send_json(404, {"error": "Job not found"})
+            if match.group(2):
+                return self._send_json(200, {"id": job["id"], "tracks": self.service.queue.job_tracks(job["id"])})
+            return self._send_json(200, job)
+
+        self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._send_json(404, {"error": "Not found"})
+
+        payload = self._read_json()
+        if payload is None:
+            return
+
+        kind = payload.pop("kind", None)
+        error = validate_job(kind, payload)
+        if error:
+            return self._send_json(400, {"error": error})
+
+        priority = payload.pop("priority", None)
+        submitter = payload.pop("submitter", None) or self.headers.get("X-Submitter") or self.address_string()
+        job_id = self.service.submit(kind, payload, priority=priority, submitter=submitter)
+        self._send_json(202, {"id": job_id, "status": "queued"})
+
+    def do_PUT(self):
+        if self.path.rstrip("/") != "/bandwidth":
+            return self._send_json(404, {"error": "Not found"})
+
+        payload = self._read_json()
+        if payload is None:
+            return
+        if "limit" not in payload:
+            return self._send_json(400, {"error": "Missing field: limit"})
+        budget = self.service.downloader.bandwidth
+        try:
+            limit = budget.set_limit(payload["limit"])
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        print(f"📶 Bandwidth budget set to {bandwidth.format_rate(limit)}")
+        self._send_json(200, budget.status())
+
+    def _read_json(self):
+        # Request body as a dict; sends the 400 response and returns None if it isn't one
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": "Request body must be JSON"})
+            return None
+        if not isinstance(payload, dict):
+            self._send_json(400, {"error": "Request body must be a JSON object"})
+            return None
+        return payload
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        print(f"🌐 {self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = socket.gethostname()
+        self.server_port = 0
+
+
+def make_server(service, host=None, port=None, socket_path=None):
+    """
+    Create the HTTP server for a running JobService
+
+    Args:
+        service (JobService): Service the API talks to
+        host (str, optional): TCP address. If None, uses config default
+        port (int, optional): TCP port. If None, uses config default
+        socket_path (str, optional): Unix socket path; takes precedence over host/port
+    """
+    handler = type("BoundJobRequestHandler", (JobRequestHandler,), {"service": service})
+    socket_path = socket_path or SERVICE_SOCKET
+    if socket_path:
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host or SERVICE_HOST, port or SERVICE_PORT), handler)
+
+
+def default_queue_path(download_folder):
+    return JOB_QUEUE_PATH or os.path.join(download_folder, ".mp3_downloader", "jobs.db")
+
+
+def serve(host=None, port=None, socket_path=None, workers=None, worker_only=False, trace_path=None):
+    """
+    Run the job service until interrupted
+
+    Args:
+        worker_only (bool): Only work the shared queue, without serving the HTTP API
+        trace_path (str, optional): Record per-track spans and write them here on shutdown
+    """
+    if trace_path:
+        tracing.enable()
+
+    downloader = MP3Downloader()
+    queue = JobQueue(default_queue_path(downloader.base_download_folder))
+    service = JobService(queue, workers=workers, downloader=downloader)
+    service.start()
+    print(f"💾 Job queue: {queue.db_path}")
+
+    if worker_only:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            print("\n🛑 Shutting down worker node...")
+        finally:
+            service.stop()
+            queue.close()
+            _write_trace(trace_path)
+        return
+
+    server = make_server(service, host=host, port=port, socket_path=socket_path)
+    if isinstance(server, UnixHTTPServer):
+        print(f"🚀 Job service listening on unix:{server.server_address}")
+    else:
+        print(f"🚀 Job service listening on http://{server.server_address[0]}:{server.server_address[1]}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Shutting down job service...")
+    finally:
+        server.server_close()
+        service.stop()
+        queue.close()
+        _write_trace(trace_path)
+
+
+def _write_trace(trace_path):
+    if trace_path:
+        count = tracing.write(trace_path)
+        print(f"🧵 Wrote {count} trace spans to {trace_path} (open in https://ui.perfetto.dev)")
@@ -0,0 +1,259 @@
+"""
+Persistent index of the MP3 library
+Records path, size, mtime, ID3 artist/title/album and duration of every MP3
+under the download folder in SQLite, so "is this song already downloaded?" is
+an indexed lookup instead of a walk over the whole library.
+
+The index is refreshed incrementally: a directory whose mtime has not changed
+has had no files added, removed or renamed, so it is not listed again and only
+its subdirectories are visited. Files are re-read only when their size or mtime
+changed. Edits that don't touch the directory (re-tagging a file in place) are
+picked up by a full rescan (python main.py --rescan).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import title_normalizer
+
+try:
+    from mutagen.mp3 import MP3
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+try:
+    from config import LIBRARY_INDEX_PATH
+except ImportError:
+    LIBRARY_INDEX_PATH = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    artist TEXT,
+    title TEXT,
+    album TEXT,
+    duration REAL,
+    name_key TEXT,
+    tag_key TEXT
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE INDEX IF NOT EXISTS files_name_key ON files(name_key);
+CREATE INDEX IF NOT EXISTS files_tag_key ON files(tag_key);
+"""
+
+
+def song_key(artist_name, song_name):
+    """
+    Lookup key for an artist/song pair: the file name stem the downloader gives it
+    ("<Artist> - <Song>"), compared case-insensitively
+    """
+    return (f"{title_normalizer.clean_filename(artist_name)} - "
+            f"{title_normalizer.clean_filename(song_name)}").lower()
+
+
+def default_index_path(download_folder):
+    return LIBRARY_INDEX_PATH or os.path.join(download_folder, ".mp3_downloader", "library.db")
+
+
+class LibraryIndex:
+    """
+    SQLite index of the MP3s under a library root.
+
+    Paths are stored relative to the root, so the same index works wherever the
+    library is mounted (e.g. /downloads in the container, ~/Downloads/... on the host).
+    Safe to use from several threads, and from several processes sharing the volume.
+    """
+
+    def __init__(self, root, db_path=None):
+        """
+        Open (or create) the index
+
+        Args:
+            root (str): Library folder (the downloader's base_download_folder)
+            db_path (str, optional): SQLite file. If None, uses config default
+        """
+        self.root = os.path.abspath(root)
+        self.db_path = db_path or default_index_path(self.root)
+        folder = os.path.dirname(self.db_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def lookup(self, artist_name, song_name):
+        """
+        Find an already downloaded song, by file name or by ID3 artist/title
+
+        Returns:
+            str: Absolute path of the file, or None
+        """
+        key = song_key(artist_name, song_name)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE name_key = ? UNION SELECT path FROM files WHERE tag_key = ?", (key, key)
+            ).fetchall()
+            for (path,) in rows:
+                full_path = os.path.join(self.root, path)
+                if os.path.exists(full_path):
+                    return full_path
+                # Deleted since the last refresh
+                self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        return None
+
+    def add(self, file_path):
+        """Index (or re-index) a single file, e.g. one that was just downloaded and tagged"""
+        rel = os.path.relpath(os.path.abspath(file_path), self.root)
+        if rel.startswith(os.pardir):
+            return
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return
+        row = self._read_file(file_path, rel, st)
+        with self._lock:
+            self._upsert_file(row)
+
+    def refresh(self, full=False):
+        """
+        Bring the index up to date with the library on disk
+
+        Args:
+            full (bool): List every directory and stat every file, even where the
+                directory mtime is unchanged (--rescan)
+
+        Returns:
+            dict: Counts of dirs_scanned, dirs_skipped, added, updated, removed, plus seconds
+        """
+        start = time.perf_counter()
+        stats = {"dirs_scanned": 0, "dirs_skipped": 0, "added": 0, "updated": 0, "removed": 0}
+        with self._lock:
+            known_dirs = {}
+            children = {}
+            for path, parent, mtime_ns in self._conn.execute("SELECT path, parent, mtime_ns FROM dirs"):
+                known_dirs[path] = mtime_ns
+                children.setdefault(parent, []).append(path)
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stack = [""]
+                while stack:
+                    rel = stack.pop()
+                    try:
+                        # Taken before listing, so changes made during the scan are seen next time
+                        mtime_ns = os.stat(os.path.join(self.root, rel)).st_mtime_ns
+                    except OSError:
+                        stats["removed"] += self._remove_tree(rel)
+                        continue
+                    if not full and known_dirs.get(rel) == mtime_ns:
+                        stats["dirs_skipped"] += 1
+                        stack.extend(children.get(rel, ()))
+                        continue
+                    stats["dirs_scanned"] += 1
+                    subdirs = self._scan_dir(rel, stats)
+                    for gone in set(children.get(rel, ())) - set(subdirs):
+                        stats["removed"] += self._remove_tree(gone)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+                        (rel, os.path.dirname(rel) if rel else None, mtime_ns)
+                    )
+                    stack.extend(subdirs)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        return stats
+
+    def _scan_dir(self, rel, stats):
+        """List one directory, update its file rows, and return its subdirectories"""
+        folder = os.path.join(self.root, rel)
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in self._conn.execute(
+            "SELECT path, size, mtime_ns FROM files WHERE dir = ?", (rel,)
+        )}
+        subdirs = []
+        seen = set()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return subdirs
+        for entry in entries:
+            # Skip our own state (.mp3_downloader) and other hidden folders
+            if entry.name.startswith("."):
+                continue
+            child = os.path.join(rel, entry.name) if rel else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(child)
+                    continue
+                if not entry.name.lower().endswith(".mp3") or not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            seen.add(child)
+            previous = known.get(child)
+            if previous == (st.st_size, st.st_mtime_ns):
+                continue
+            self._upsert_file(self._read_file(entry.path, child, st))
+            stats["updated" if previous else "added"] += 1
+        for gone in set(known) - seen:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (gone,))
+            stats["removed"] += 1
+        return subdirs
+
+    def _remove_tree(self, rel):
+        """Forget a directory that no longer exists, with everything below it"""
+        prefix = rel + os.sep
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        removed = self._conn.execute(
+            "DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (rel, pattern)
+        ).rowcount
+        self._conn.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (rel, pattern))
+        return removed
+
+    def _read_file(self, file_path, rel, st):
+        """Build a files row, reading ID3 artist/title/album and duration when mutagen is available"""
+        artist = title = album = duration = None
+        if MUTAGEN_AVAILABLE:
+            try:
+                audio = MP3(file_path)
+                duration = round(audio.info.length, 3)
+                tags = audio.tags
+                if tags is not None:
+                    artist = str(tags["TPE1"]) if "TPE1" in tags else None
+                    title = str(tags["TIT2"]) if "TIT2" in tags else None
+                    album = str(tags["TALB"]) if "TALB" in tags else None
+            except Exception:
+                # Unreadable or not really an MP3; still indexed by name
+                pass
+        stem = os.path.splitext(os.path.basename(rel))[0]
+        return (rel, os.path.dirname(rel), st.st_size, st.st_mtime_ns, artist, title, album, duration,
+                stem.lower(), song_key(artist, title) if artist and title else None)
+
+    def _upsert_file(self, row):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, dir, size, mtime_ns, artist, title, album, duration, name_key, tag_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+        )
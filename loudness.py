@@ -0,0 +1,203 @@
+"""
+Loudness analysis and ReplayGain tags
+Track loudness (EBU R128 / ITU-R BS.1770) is measured by ffmpeg's ebur128
+filter on a branch of the same ffmpeg run that encodes the download, so the
+audio is decoded only once. Besides the integrated loudness and peak, each
+track keeps the loudness of its 400 ms gating blocks (as a histogram of the
+0.1 LU values ffmpeg reports), which is all that is needed to gate the blocks
+of a whole album together: album gain is computed after the batch without
+reading any audio again.
+"""
+
+import json
+import math
+import re
+import threading
+from collections import Counter
+
+try:
+    from mutagen.id3 import ID3, TXXX, ID3NoHeaderError
+    import mutagen
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+try:
+    from config import REPLAYGAIN, REPLAYGAIN_REFERENCE_LUFS
+except ImportError:
+    REPLAYGAIN = False
+    REPLAYGAIN_REFERENCE_LUFS = -18.0
+
+# BS.1770 gates
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# '[Parsed_ebur128_0 @ 0x55d0] t: 0.399977   TARGET:-23 LUFS    M: -25.4 S:-120.7 ...'
+BLOCK_PATTERN = re.compile(r'\bt:\s*[\d.]+\s+.*?\bM:\s*(-?[\d.]+|-inf|nan)')
+# Summary: '    I:         -14.2 LUFS' and (with peak=sample) '    Peak:        0.5 dBFS'
+INTEGRATED_PATTERN = re.compile(r'^\s*I:\s*(-?[\d.]+|-inf)\s*LUFS', re.MULTILINE)
+PEAK_PATTERN = re.compile(r'^\s*Peak:\s*(-?[\d.]+|-inf)\s*dBFS', re.MULTILINE)
+
+
+def analysis_args():
+    """ffmpeg output options for an extra output that only measures loudness (add after the encode outputs)"""
+    return ["-map", "0:a:0", "-af", "ebur128=peak=sample", "-f", "null", "-"]
+
+
+def parse_ebur128(output):
+    """
+    Track loudness from the ebur128 filter's log (ffmpeg's stderr)
+
+    Returns:
+        dict: {"loudness": integrated LUFS, "peak": sample peak (linear, 1.0 = full scale),
+            "blocks": Counter of gating block loudness}, or None if the log has no summary
+    """
+    integrated = INTEGRATED_PATTERN.findall(output)
+    if not integrated:
+        return None
+    blocks = Counter()
+    for value in BLOCK_PATTERN.findall(output):
+        if value not in ("-inf", "nan"):
+            blocks[float(value)] += 1
+    peaks = PEAK_PATTERN.findall(output)
+    peak = 10 ** (float(peaks[-1]) / 20) if peaks and peaks[-1] != "-inf" else 0.0
+    # The summary comes last; recompute from the blocks when there are any, so tracks
+    # and albums are gated the same way
+    loudness = gated_loudness(blocks) if blocks else float(integrated[-1])
+    return {"loudness": loudness, "peak": peak, "blocks": blocks}
+
+
+def gated_loudness(blocks):
+    """
+    Integrated loudness of gating blocks (BS.1770: absolute gate, then relative gate)
+
+    Args:
+        blocks (Counter): Block loudness (LUFS) -> number of blocks
+
+    Returns:
+        float: LUFS, or -inf for silence
+    """
+    def mean_loudness(selected):
+        count = sum(blocks[value] for value in selected)
+        if not count:
+            return -math.inf
+        energy = sum(blocks[value] * 10 ** ((value + 0.691) / 10) for value in selected) / count
+        return -0.691 + 10 * math.log10(energy)
+
+    above_absolute = [value for value in blocks if value > ABSOLUTE_GATE_LUFS]
+    relative_gate = mean_loudness(above_absolute) + RELATIVE_GATE_LU
+    return mean_loudness([value for value in above_absolute if value > relative_gate])
+
+
+def album_loudness(tracks):
+    """Loudness of an album: its tracks' blocks gated together, and the highest peak"""
+    blocks = Counter()
+    for track in tracks:
+        blocks.update(track["blocks"])
+    return {"loudness": gated_loudness(blocks), "peak": max(track["peak"] for track in tracks), "blocks": blocks}
+
+
+def gain(measured):
+    """ReplayGain 2.0 gain in dB to bring measured to REPLAYGAIN_REFERENCE_LUFS"""
+    return REPLAYGAIN_REFERENCE_LUFS - measured["loudness"] if math.isfinite(measured["loudness"]) else 0.0
+
+
+def write_tags(path, track=None, album=None):
+    """
+    Write REPLAYGAIN_TRACK_* and/or REPLAYGAIN_ALBUM_* tags: ID3 TXXX frames for MP3s,
+    native tags for other formats
+
+    Args:
+        track, album (dict): Loudness as returned by parse_ebur128 / album_loudness
+    """
+    if not MUTAGEN_AVAILABLE:
+        return
+    values = {}
+    for scope, measured in (("track", track), ("album", album)):
+        if measured:
+            values[f"replaygain_{scope}_gain"] = f"{gain(measured):+.2f} dB"
+            values[f"replaygain_{scope}_peak"] = f"{measured['peak']:.6f}"
+    if not values:
+        return
+
+    if path.lower().endswith(".mp3"):
+        try:
+            tags = ID3(path)
+        except ID3NoHeaderError:
+            tags = ID3()
+        for key, value in values.items():
+            tags.delall(f"TXXX:{key.upper()}")
+            tags.add(TXXX(encoding=3, desc=key.upper(), text=[value]))
+        tags.save(path)
+        return
+
+    audio = mutagen.File(path)
+    if audio is None:
+        return
+    if audio.tags is None:
+        audio.add_tags()
+    if path.lower().endswith(".m4a"):
+        for key, value in values.items():
+            audio.tags[f"----:com.apple.iTunes:{key}"] = [value.encode("utf-8")]
+    else:
+        # Vorbis comments (ogg, opus, flac)
+        for key, value in values.items():
+            audio.tags[key.upper()] = [value]
+    audio.save()
+
+
+def dumps(measured):
+    """Serialize track loudness (e.g. to keep it next to a stored object)"""
+    return json.dumps({"loudness": measured["loudness"], "peak": measured["peak"],
+                       "blocks": [[value, count] for value, count in sorted(measured["blocks"].items())]})
+
+
+def loads(text):
+    data = json.loads(text)
+    return {"loudness": data["loudness"], "peak": data["peak"], "blocks": Counter(dict(map(tuple, data["blocks"])))}
+
+
+class AlbumGain:
+    """
+    Collects the loudness of a batch's tracks by album, then writes album gain to
+    every file of each album (thread-safe)
+    """
+
+    def __init__(self):
+        self._albums = {}
+        self._lock = threading.Lock()
+
+    def add(self, album_key, measured, write):
+        """
+        Args:
+            album_key: Identifies the album (e.g. its Spotify ID); None skips the track
+            measured (dict): Track loudness
+            write (callable): Writes album loudness (its one argument) to the track's files
+        """
+        if album_key is None or measured is None:
+            return
+        with self._lock:
+            self._albums.setdefault(album_key, []).append((measured, write))
+
+    def write(self, album_keys=None):
+        """
+        Write album gain for the given albums (default: all collected) and forget them
+
+        Returns:
+            dict: {album_key: album gain in dB}
+        """
+        with self._lock:
+            keys = list(self._albums) if album_keys is None else [key for key in album_keys if key in self._albums]
+            albums = {key: self._albums.pop(key) for key in keys}
+        written = {}
+        for key, tracks in albums.items():
+            album = album_loudness([measured for measured, _ in tracks])
+            for _, write in tracks:
+                try:
+                    write(album)
+                except OSError as e:
+                    print(f"⚠️  Could not write album gain: {e}")
+            written[key] = gain(album)
+        if written:
+            print(f"🔊 Album gain written for {len(written)} album(s)")
+        return written
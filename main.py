@@ -1,67 +1,250 @@
+import argparse
+
+import bandwidth
+import CreateSongMenu
+import disk_space
+import follow
+import metrics
+import pipeline
+import tracing
 from ProcessInput import process_input
 from CallYoutube import CallYoutube
-from mp3_downloader import MP3Downloader
+from mp3_downloader import MP3Downloader, default_download_folder, saved_summary, success_rate
 from credentials_helper import check_credentials
+from library_index import LibraryIndex
 
-if __name__ == "__main__":
-    print("🎵 YouTube to MP3 Downloader")
-    print("=" * 40)
-    
-    # Check credentials before starting
-    if not check_credentials():
-        print("\n🔧 Please set up your API credentials first!")
-        print("📖 See SETUP.md for instructions")
-        exit(1)
-    
+try:
+    from config import METRICS_TEXTFILE
+except ImportError:
+    METRICS_TEXTFILE = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Search for artists, albums and songs and download them as MP3s")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a long-running job service with a local HTTP API instead of the interactive menu")
+    parser.add_argument("--host", help="Address for the job service to listen on (default from config.py)")
+    parser.add_argument("--port", type=int, help="Port for the job service to listen on (default from config.py)")
+    parser.add_argument("--socket", help="Unix socket path for the job service (instead of host/port)")
+    parser.add_argument("--workers", type=int, help="Number of job service download workers (default from config.py)")
+    parser.add_argument("--worker-only", action="store_true",
+                        help="With --serve: only work the shared job queue, without serving the HTTP API")
+    parser.add_argument("--playlist", metavar="LINK",
+                        help="Download a whole Spotify playlist or album (link or URI) without the interactive menu")
+    parser.add_argument("--follow", metavar="ARTIST",
+                        help="Follow an artist: its current releases are known, later ones are downloaded by --sync")
+    parser.add_argument("--unfollow", metavar="ARTIST", help="Stop following an artist (name or Spotify ID)")
+    parser.add_argument("--following", action="store_true", help="List the followed artists and exit")
+    parser.add_argument("--sync", action="store_true",
+                        help="Download the releases of every followed artist that are new since the last sync")
+    parser.add_argument("--rescan", action="store_true",
+                        help="Fully rescan the download folder into the library index and exit")
+    parser.add_argument("--bandwidth", metavar="RATE", type=bandwidth.parse_rate,
+                        help="Bandwidth budget shared by all downloads, e.g. 2M or 500K (default from config.py)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Record a span for every stage of every track and write Chrome Trace JSON (for Perfetto)")
+    parser.add_argument("--metrics-file", default=METRICS_TEXTFILE,
+                        help="Write Prometheus metrics to this file when a batch run finishes (textfile collector)")
+    return parser.parse_args()
+
+
+def print_success_rate(counts):
+    """Success rate of a batch: songs downloaded out of those not already in the library"""
+    wanted = counts['songs'] - counts['existing']
+    if wanted:
+        print(f"📈 {counts['downloaded']}/{wanted} downloaded ({success_rate(counts['downloaded'], wanted)}), "
+              f"{counts['fallbacks']} fallback(s) to another YouTube candidate, {counts['retries']} retried download(s)")
+    if saved_summary(counts):
+        print(saved_summary(counts))
+
+
+def run_collection(search_dict):
+    """
+    Download a whole Spotify playlist or album. Pages are streamed straight into
+    the search -> download pipeline, and results are reported as each song finishes
+    instead of being collected, so memory stays flat for playlists of any length.
+    """
+    collection = search_dict["collection"]
+    proceed = input(f"\nDo you want to download all {collection['total']} song(s) from "
+                    f"'{collection['name']}'? (y/n): ").lower()
+    if proceed not in ['y', 'yes']:
+        print("Download cancelled.")
+        return
+
+    youtube_searcher = CallYoutube(search_dict)
+    downloader = MP3Downloader()
+    counts = {"songs": 0, "existing": 0, "found": 0, "downloaded": 0, "retries": 0, "fallbacks": 0,
+              "disk_saved_bytes": 0}
+    failed = []
+
+    def report(result):
+        urls, artist, song, spotify_metadata, file_path = result
+        counts["songs"] += 1
+        counts["existing"] += 1 if file_path and not urls else 0
+        counts["found"] += 1 if urls else 0
+        counts["downloaded"] += 1 if file_path and urls else 0
+        if not file_path:
+            failed.append(f"{artist} - {song}: {'❌ Download failed' if urls else '❌ No video found'}")
+
+    print(f"\n🚀 Streaming {collection['total']} song(s) from '{collection['name']}'...")
+    try:
+        run_counts = pipeline.run(search_dict["songs"], youtube_searcher, downloader, total=collection['total'],
+                                  on_result=report)
+        counts.update(retries=run_counts["retries"], fallbacks=run_counts["fallbacks"],
+                      disk_saved_bytes=run_counts["disk_saved_bytes"])
+    except Exception as e:
+        # e.g. Spotify failing part-way through a long playlist; keep what was downloaded
+        print(f"\n❌ Stopped reading the {collection['kind']} from Spotify: {e}")
+
+    print("\n📋 Summary of results:")
+    print(f"🎵 {counts['songs']} songs: {counts['existing']} already in library, "
+          f"{counts['found']} found on YouTube, {counts['downloaded']} downloaded")
+    print_success_rate(counts)
+    for line in failed:
+        print(f"  {line}")
+    print("\n💿 MP3 files have been saved to the 'downloads' folder.")
+
+
+def run_follow(follows, artist_name):
+    """Follow the artist best matching artist_name, its current catalog as the snapshot"""
+    song_menu = CreateSongMenu.CreateSongMenu()
+    artist_info = song_menu.find_artist(artist_name)
+    if not artist_info:
+        print(f"❌ No artist found for: {artist_name}")
+        return
+    if any(artist["id"] == artist_info["id"] for artist in follows.artists()):
+        print(f"👤 Already following {artist_info['name']}")
+        return
+    releases = follow.catalog(song_menu, artist_info["id"])
+    follows.follow(artist_info, releases)
+    print(f"👤 Following {artist_info['name']}: {len(releases)} release(s) known, newer ones are downloaded by --sync")
+
+
+def run_sync(follows):
+    """
+    Download the new releases of every followed artist. Each artist's release
+    list is read only as far as the releases that are new since its last sync
+    """
+    artists = follows.artists()
+    if not artists:
+        print('👤 Not following any artists yet (python main.py --follow "Artist")')
+        return
+
+    song_menu = CreateSongMenu.CreateSongMenu()
+    youtube_searcher = None
+    downloader = None
+    totals = {"releases": 0, "songs": 0, "downloaded": 0}
+    print(f"🔄 Syncing {len(artists)} followed artist(s)...")
+    for artist in artists:
+        releases = follow.new_releases(song_menu, artist["id"], follows.known_releases(artist["id"]),
+                                       follows.resume_dates(artist["id"]))
+        songs = follow.new_songs(song_menu, artist["id"], releases)
+        if not songs:
+            follows.record(artist["id"], releases)
+            print(f"✔️  {artist['name']}: nothing new")
+            continue
+
+        own = [album["name"] for album in releases if follow.is_own_release(album, artist["id"])]
+        print(f"\n🆕 {artist['name']}: {len(songs)} song(s) from {', '.join(own)}")
+        youtube_searcher = youtube_searcher or CallYoutube({})
+        downloader = downloader or MP3Downloader()
+        pending = set()
+
+        def report(result):
+            urls, _, song, spotify_metadata, file_path = result
+            if not file_path:
+                pending.add(spotify_metadata.get("album_id"))
+                print(f"  {song}: {'❌ Download failed' if urls else '❌ No video found'}")
+
+        try:
+            counts = pipeline.run(songs, youtube_searcher, downloader, default_artist=artist["name"],
+                                  total=len(songs), on_result=report, prefetch_songs=0)
+        except disk_space.BatchTooLarge as e:
+            # Its releases stay new, so the next sync tries again
+            print(f"❌ {e}")
+            continue
+        print_success_rate(counts)
+        # Releases with a song that failed are read and tried again by the next sync
+        follows.record(artist["id"], releases, pending=pending)
+        totals["releases"] += len(own)
+        totals["songs"] += len(songs)
+        totals["downloaded"] += counts["downloaded"]
+
+    print(f"\n📋 Synced {len(artists)} artist(s): {totals['releases']} new release(s), "
+          f"{totals['downloaded']} of {totals['songs']} new song(s) downloaded")
+
+
+def run_interactive(playlist_link=None):
     print("This program lets you search for artists, albums, and songs, then find them on YouTube and convert them to MP3.")
     
     # Get user selections for artist and songs
     processor = process_input()
-    search_dict = processor.start()
+    if playlist_link:
+        song_menu = CreateSongMenu.CreateSongMenu()
+        link = song_menu.parse_spotify_link(playlist_link)
+        if not link:
+            print(f"❌ Not a Spotify playlist or album link: {playlist_link}")
+            return
+        search_dict = processor.collection_search_dict(song_menu, *link)
+    else:
+        search_dict = processor.start()
     
-    if search_dict:
+    if search_dict and search_dict.get("collection"):
+        run_collection(search_dict)
+    elif search_dict:
         # Initialize YouTube searcher with the search dictionary
         youtube_searcher = CallYoutube(search_dict)
         
-        # Process all songs (this now includes user confirmation)
-        results = youtube_searcher.process_songs(download=False)  # Just get URLs for now
-        
-        if results:
-            # Use the new MP3 downloader
+        # List the songs and ask for confirmation once for the whole batch
+        results = []
+        if youtube_searcher.confirm_songs():
             downloader = MP3Downloader()
+            songs = youtube_searcher.songs
             
-            print(f"\n🎵 Starting download of {len(results)} songs...")
-            
-            # Ask if all songs are from the same album
+            # Ask if all songs are from the same album (Spotify album metadata takes precedence)
             album_name = None
-            if len(results) > 1:
+            if len(songs) > 1:
                 same_album = input("Are all these songs from the same album? (y/n): ").lower() in ['y', 'yes']
                 if same_album:
                     album_name = input("Enter the album name: ").strip()
                     album_name = album_name if album_name else None
             
-            # Prepare download list with Spotify metadata
-            download_list = []
-            for urls, artist, song, spotify_metadata in results:
-                if urls:  # If we found a YouTube URL
-                    # Use album from Spotify metadata if available, otherwise use user input
-                    song_album = spotify_metadata.get('album') or album_name
-                    download_list.append((urls[0], artist, song, song_album, spotify_metadata))
+            # Each song is queued for download as soon as its YouTube search returns
+            print(f"\n🎵 Searching and downloading {len(songs)} songs by {youtube_searcher.artist}...")
+            downloaded_files = []
+            
+            def collect(result):
+                urls, artist, song, spotify_metadata, file_path = result
+                results.append(result)
+                if file_path and urls:
+                    downloaded_files.append(file_path)
             
-            if download_list:
-                downloaded_files = downloader.download_multiple_with_metadata(download_list)
+            try:
+                counts = pipeline.run(songs, youtube_searcher, downloader, default_artist=youtube_searcher.artist,
+                                      album_name=album_name, total=len(songs), on_result=collect, prefetch_songs=0)
+            except disk_space.BatchTooLarge as e:
+                print(f"❌ {e}")
+                return
+            print_success_rate(counts)
+            
+            if any(urls for urls, _, _, _, _ in results):
                 print(f"\n🎉 Downloaded {len(downloaded_files)} MP3 files successfully!")
                 print("🏷️  Files enhanced with Spotify metadata!")
+            elif results and all(file_path for _, _, _, _, file_path in results):
+                print("\n📚 All songs are already in the library")
             else:
                 print("❌ No valid YouTube URLs found for download")
         
         # Display final results
         if results:
             print("\n📋 Summary of results:")
-            for i, (urls, artist, song, spotify_metadata) in enumerate(results, 1):
-                if urls:
+            for i, (urls, artist, song, spotify_metadata, file_path) in enumerate(results, 1):
+                if file_path and not urls:
+                    print(f"{i}. {artist} - {song}: 📚 Already in library")
+                elif urls:
                     album_info = f" (Album: {spotify_metadata.get('album')})" if spotify_metadata.get('album') else ""
-                    print(f"{i}. {artist} - {song}{album_info}: ✅ Found")
+                    status = "✅ Downloaded" if file_path else "❌ Download failed"
+                    print(f"{i}. {artist} - {song}{album_info}: {status}")
                 else:
                     print(f"{i}. {artist} - {song}: ❌ No video found")
             
@@ -70,3 +253,68 @@ if __name__ == "__main__":
             print("❌ No YouTube videos were found or the process was canceled.")
     else:
         print("❌ No search criteria provided. Exiting.")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("🎵 YouTube to MP3 Downloader")
+    print("=" * 40)
+    
+    if args.bandwidth:
+        bandwidth.BANDWIDTH_LIMIT = args.bandwidth
+    
+    if args.following:
+        follows = follow.FollowList(follow.default_follow_path(default_download_folder()))
+        artists = follows.artists()
+        for artist in artists:
+            print(f"👤 {artist['name']}: {artist['releases']} release(s) known, latest {artist['latest'] or '-'}")
+        if not artists:
+            print('👤 Not following any artists yet (python main.py --follow "Artist")')
+        exit(0)
+    
+    if args.rescan:
+        library = LibraryIndex(default_download_folder())
+        print(f"📚 Rescanning {library.root}...")
+        stats = library.refresh(full=True)
+        print(f"✅ {library.count()} files indexed: {stats['added']} added, {stats['updated']} updated, "
+              f"{stats['removed']} removed ({stats['dirs_scanned']} folders in {stats['seconds']}s)")
+        exit(0)
+    
+    # Check credentials before starting
+    if not check_credentials():
+        print("\n🔧 Please set up your API credentials first!")
+        print("📖 See SETUP.md for instructions")
+        exit(1)
+    
+    if args.follow or args.unfollow or args.sync:
+        follows = follow.FollowList(follow.default_follow_path(default_download_folder()))
+        try:
+            if args.unfollow:
+                name = follows.unfollow(args.unfollow)
+                print(f"👤 Unfollowed {name}" if name else f"❌ Not following: {args.unfollow}")
+            if args.follow:
+                run_follow(follows, args.follow)
+            if args.sync:
+                run_sync(follows)
+        finally:
+            follows.close()
+            if args.metrics_file:
+                metrics.write_textfile(args.metrics_file)
+                print(f"📈 Metrics written to {args.metrics_file}")
+    elif args.serve:
+        from job_service import serve
+        serve(host=args.host, port=args.port, socket_path=args.socket, workers=args.workers,
+              worker_only=args.worker_only, trace_path=args.trace)
+    else:
+        if args.trace:
+            tracing.enable()
+        try:
+            run_interactive(args.playlist)
+        finally:
+            if args.metrics_file:
+                metrics.write_textfile(args.metrics_file)
+                print(f"📈 Metrics written to {args.metrics_file}")
+            if args.trace:
+                count = tracing.write(args.trace)
+                print(f"🧵 Wrote {count} trace spans to {args.trace} (open in https://ui.perfetto.dev)")
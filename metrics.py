@@ -0,0 +1,218 @@
+"""
+Pipeline metrics in Prometheus text format
+Counters and latency histograms for every stage (Spotify lookups, YouTube search,
+download, transcode, tagging, ...). Exposed at /metrics by the job service, or
+written to a textfile-collector file at the end of a batch run.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import tracing
+
+# Latency buckets in seconds, from quick API calls up to long transcodes
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing value per label set"""
+
+    type_name = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, ("le", _format_value(bound))), count))
+                samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), entry[-2]))
+                samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), entry[-1]))
+        return samples
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format
+
+        Returns:
+            str: Exposition text
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "mp3dl_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",)))
+STAGE_TOTAL = REGISTRY.register(Counter(
+    "mp3dl_stage_total", "Pipeline stage executions", ("stage",)))
+STAGE_FAILURES = REGISTRY.register(Counter(
+    "mp3dl_stage_failures_total", "Pipeline stage executions that failed", ("stage",)))
+RETRIES = REGISTRY.register(Counter(
+    "mp3dl_retries_total", "Retried attempts per stage", ("stage",)))
+BYTES_DOWNLOADED = REGISTRY.register(Counter(
+    "mp3dl_bytes_downloaded_total", "Source media bytes downloaded by yt-dlp"))
+BYTES_WRITTEN = REGISTRY.register(Counter(
+    "mp3dl_bytes_written_total", "MP3 bytes written to the library"))
+STORE_REUSED = REGISTRY.register(Counter(
+    "mp3dl_store_reused_total", "Downloads served from the shared audio store without running yt-dlp"))
+AUTO_QUALITY_SAVED = REGISTRY.register(Counter(
+    "mp3dl_auto_quality_saved_bytes_total", "Disk saved by auto quality compared to encoding at the ceiling bitrate"))
+PREFETCHES = REGISTRY.register(Counter(
+    "mp3dl_menu_prefetches_total", "Interactive menu lookups prefetched, by outcome (hit, waited, miss, cancelled)",
+    ("result",)))
+FALLBACKS = REGISTRY.register(Counter(
+    "mp3dl_candidate_fallbacks_total", "Downloads moved on to the next YouTube candidate after a failure"))
+QUEUE_WAIT = REGISTRY.register(Histogram(
+    "mp3dl_queue_wait_seconds", "Time tracks waited in the job queue before a worker claimed them, per priority class",
+    ("priority",), buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)))
+DOWNLOAD_THROUGHPUT = REGISTRY.register(Histogram(
+    "mp3dl_download_throughput_bytes_per_second", "Achieved throughput of each yt-dlp download",
+    buckets=tuple(2 ** power * 1024 for power in range(6, 16))))
+
+
+def observe(stage, seconds, failed=False, start=None):
+    """
+    Record one execution of a stage that was timed elsewhere
+
+    Args:
+        stage (str): Stage name
+        seconds (float): Duration of the stage
+        failed (bool): Whether the stage failed
+        start (float, optional): time.perf_counter() at the start, to also record a trace span
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    STAGE_TOTAL.inc(stage=stage)
+    if failed:
+        STAGE_FAILURES.inc(stage=stage)
+    if start is not None:
+        tracing.add_span(stage, start, start + seconds, failed=failed)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Time a block as one execution of a pipeline stage (and a trace span with --trace).
+    An exception escaping the block counts as a failure; call mark_failed()
+    on the yielded object for failures that are reported by return value.
+
+    Usage:
+        with metrics.timed("youtube_search") as stage:
+            ...
+            if not found:
+                stage.mark_failed()
+    """
+    record = _StageRecord()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record.failed = True
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, failed=record.failed, start=start)
+
+
+class _StageRecord:
+    def __init__(self):
+        self.failed = False
+
+    def mark_failed(self):
+        self.failed = True
+
+
+def render():
+    return REGISTRY.render()
+
+
+def write_textfile(path):
+    """
+    Write all metrics for the node_exporter textfile collector.
+    The file is replaced atomically so the collector never reads a partial file.
+    """
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp_path, path)
@@ -1,10 +1,31 @@
 import sys
 import re
 import os
+import contextvars
+import json
+import random
+import shlex
+import shutil
 import subprocess
+import threading
 import time
+import queue
+from contextlib import contextmanager
 from pathlib import Path
 
+import bandwidth
+import chunked_transfer
+import cover_art
+import disk_space
+import loudness
+import metrics
+import staging
+import title_normalizer
+import transcode
+from audio_store import open_store
+from library_index import LibraryIndex
+import tracing
+
 # Try to load configuration, fall back to defaults if not available
 try:
     from config import PARENT_FOLDER_NAME, AUDIO_QUALITY, USE_ARTIST_FOLDERS, USE_SPOTIFY_METADATA, FALLBACK_GENRE, FALLBACK_YEAR
@@ -17,10 +38,55 @@ except ImportError:
     FALLBACK_GENRE = None
     FALLBACK_YEAR = None
 
+try:
+    from config import DOWNLOAD_DELAY_SECONDS, YTDLP_COMMAND
+except ImportError:
+    DOWNLOAD_DELAY_SECONDS = 2
+    YTDLP_COMMAND = None
+
+try:
+    from config import SKIP_EXISTING
+except ImportError:
+    SKIP_EXISTING = True
+
+try:
+    from config import STALL_TIMEOUT_SECONDS, STALL_RETRIES, PROGRESS_INTERVAL_SECONDS
+except ImportError:
+    STALL_TIMEOUT_SECONDS = 60
+    STALL_RETRIES = 2
+    PROGRESS_INTERVAL_SECONDS = 10
+
+try:
+    from config import DOWNLOAD_RETRIES, RETRY_BACKOFF_SECONDS
+except ImportError:
+    DOWNLOAD_RETRIES = 2
+    RETRY_BACKOFF_SECONDS = 2
+
+# Environment variables take precedence (used by the offline benchmarks)
+DOWNLOAD_DELAY_SECONDS = float(os.getenv('DOWNLOAD_DELAY_SECONDS', DOWNLOAD_DELAY_SECONDS))
+YTDLP_COMMAND = os.getenv('YTDLP_COMMAND') or YTDLP_COMMAND
+STALL_TIMEOUT_SECONDS = float(os.getenv('STALL_TIMEOUT_SECONDS', STALL_TIMEOUT_SECONDS))
+RETRY_BACKOFF_SECONDS = float(os.getenv('RETRY_BACKOFF_SECONDS', RETRY_BACKOFF_SECONDS))
+
+# Failures worth retrying on the same video (network trouble, throttling, server errors,
+# stalls). Anything else (unavailable, private, age or region restricted...) won't change
+# on a retry, so the next YouTube candidate is tried instead
+TRANSIENT_ERRORS = re.compile(
+    r'HTTP Error (?:5\d\d|429)|timed? ?out|Connection (?:reset|refused|aborted)|Temporary failure|'
+    r'Name or service not known|Unable to download webpage|Remote end closed|IncompleteRead|stalled',
+    re.IGNORECASE
+)
+
+# '[download]  42.0% of ~  3.45MiB at  1.20MiB/s ETA 00:02 (frag 3/10)'
+PROGRESS_PATTERN = re.compile(
+    r'\[download\]\s+(?P<percent>[\d.]+)% of\s+~?\s*(?P<size>[\d.]+)\s*(?P<unit>[KMGT]?)i?B'
+    r'(?:\s+in\s+\S+)?(?:\s+at\s+(?P<speed>.+?))?(?:\s+ETA\s+(?P<eta>\S+))?(?:\s+\(.*\))?\s*$'
+)
+
 # Import for ID3 tag manipulation
 try:
     from mutagen.mp3 import MP3
-    from mutagen.id3 import ID3, TIT2, TPE1, TALB, TDRC, TCON, TPE2, TRCK
+    from mutagen.id3 import ID3, TIT2, TPE1, TALB, TDRC, TCON, TPE2, TRCK, APIC
     ID3_AVAILABLE = True
 except ImportError:
     ID3_AVAILABLE = False
@@ -37,6 +103,557 @@ except ImportError:
     if USE_SPOTIFY_METADATA:
         print("⚠️  Warning: Spotify credentials not available. Metadata enhancement disabled.")
 
+def success_rate(downloaded, total):
+    """Share of a batch that was downloaded, as shown in batch summaries (e.g. 95.0%)"""
+    return f"{100 * downloaded / total:.1f}%" if total else "n/a"
+
+
+def add_saved_bytes(stats, saved_bytes):
+    """Count disk saved by auto quality in a batch's stats and the metrics"""
+    if saved_bytes:
+        stats["disk_saved_bytes"] = stats.get("disk_saved_bytes", 0) + saved_bytes
+        metrics.AUTO_QUALITY_SAVED.inc(saved_bytes)
+
+
+def saved_summary(stats):
+    """Batch summary of the disk auto quality saved, or "" when it saved nothing"""
+    saved_bytes = stats.get("disk_saved_bytes", 0)
+    if not saved_bytes:
+        return ""
+    return f"💾 Auto quality saved {saved_bytes / 1024 ** 2:.1f} MB compared to {transcode.AUTO_QUALITY_CEILING}"
+
+
+class DownloadStalled(Exception):
+    """yt-dlp made no progress for STALL_TIMEOUT_SECONDS"""
+
+
+class RateChanged(Exception):
+    """The bandwidth budget re-rated a running yt-dlp download; it is restarted at the new rate"""
+
+
+class DownloadCancelled(Exception):
+    """The download's cancel check fired (see cancel_when): its processes were killed and its staging removed"""
+
+
+# Cancel check of the downloads started by the current thread or asyncio task (see cancel_when)
+_cancel_check = contextvars.ContextVar("cancel_check", default=None)
+
+
+@contextmanager
+def cancel_when(check):
+    """
+    Cancel the downloads started inside the block as soon as check() returns True:
+    their yt-dlp/ffmpeg processes are killed and DownloadCancelled is raised.
+    check is polled about once a second, also by the worker threads an asyncio
+    task starts (asyncio.to_thread copies the context).
+    """
+    token = _cancel_check.set(check)
+    try:
+        yield
+    finally:
+        _cancel_check.reset(token)
+
+
+def check_cancelled():
+    """
+    Raises:
+        DownloadCancelled: If the cancel check of the current download has fired
+    """
+    check = _cancel_check.get()
+    if check is not None and check():
+        raise DownloadCancelled()
+
+
+def is_transient(reason):
+    """Whether a download that failed with reason (yt-dlp's error output) may succeed if retried"""
+    return bool(reason and TRANSIENT_ERRORS.search(reason))
+
+
+def folder_size(folder):
+    """Total size of the files directly in folder (0 if it cannot be read)"""
+    if not folder:
+        return 0
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+    except OSError:
+        return 0
+
+
+class _ProgressDisplay:
+    """
+    Live progress of one download: redrawn in place on a terminal, otherwise
+    (logs, the job service) printed every PROGRESS_INTERVAL_SECONDS
+    """
+    
+    def __init__(self, label):
+        self.label = label
+        self.interactive = sys.stdout.isatty()
+        self.last_print = time.monotonic()
+        self.drawn = False
+    
+    def update(self, status):
+        text = f"⬇️  {self.label}: {status['percent']:5.1f}% of {status['total_bytes'] / 1024 ** 2:.2f} MiB"
+        if status['speed']:
+            text += f" at {status['speed']}"
+        if status['eta']:
+            text += f", ETA {status['eta']}"
+        if self.interactive:
+            print(f"\r{text}\033[K", end="", flush=True)
+            self.drawn = True
+        elif time.monotonic() - self.last_print >= PROGRESS_INTERVAL_SECONDS:
+            print(text)
+            self.last_print = time.monotonic()
+    
+    def finish(self):
+        if self.drawn:
+            print()
+
+
+class _CancelEvent:
+    """
+    Stop signal for chunked_transfer, set once the cancel check of the download
+    creating it fires (its range threads do not share its context)
+    """
+    
+    def __init__(self):
+        self.check = _cancel_check.get()
+    
+    def is_set(self):
+        return bool(self.check is not None and self.check())
+
+
+class StallClock:
+    """
+    Time since a process last made progress: output lines that show progress,
+    or growth of the files in the folder it writes into
+    """
+    
+    def __init__(self, watch_folder=None, initial_size=None):
+        """
+        Args:
+            initial_size (int, optional): folder_size(watch_folder) if already known
+                (the asyncio API scans the folder off the event loop)
+        """
+        self.watch_folder = watch_folder
+        self.last_progress = self.last_scan = time.monotonic()
+        self.folder_size = folder_size(watch_folder) if initial_size is None else initial_size
+    
+    def progress(self):
+        self.last_progress = time.monotonic()
+    
+    def scan_due(self):
+        """Whether the folder should be scanned: no progress, and no scan, for a second"""
+        now = time.monotonic()
+        return bool(self.watch_folder) and now - self.last_progress >= 1 and now - self.last_scan >= 1
+    
+    def observe(self, size):
+        """Record a scan of the folder; growth counts as progress"""
+        self.last_scan = time.monotonic()
+        if size != self.folder_size:
+            self.folder_size = size
+            self.last_progress = self.last_scan
+    
+    def check(self):
+        """
+        Raises:
+            DownloadStalled: After STALL_TIMEOUT_SECONDS without progress
+        """
+        if self.scan_due():
+            self.observe(folder_size(self.watch_folder))
+        if time.monotonic() - self.last_progress > STALL_TIMEOUT_SECONDS:
+            raise DownloadStalled(f"No progress for {STALL_TIMEOUT_SECONDS:.0f}s")
+
+
+class DownloadWatch:
+    """
+    Follows one yt-dlp run through its output: live progress (shown and kept in
+    the downloader's active downloads under key) and the timing of its download
+    and ffmpeg transcode ([ExtractAudio]) stages. Chunked transfers report their
+    progress through on_transfer instead.
+    """
+    
+    def __init__(self, downloader, label, rate_limit, key, connections=1):
+        self.downloader = downloader
+        self.label = label
+        self.rate_limit = rate_limit
+        self.key = key
+        self.connections = connections
+        self.start = time.perf_counter()
+        self.transcode_start = None
+        self.total_bytes = 0
+        self.downloaded_bytes = None
+        self.display = _ProgressDisplay(label or 'Download')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A run that raised was killed; a finished one calls finish(returncode) itself
+        if exc_type is not None:
+            self.finish()
+    
+    def rerate_check(self, reservation):
+        """
+        Monitor interrupt raising RateChanged once the budget has re-rated the
+        download's reservation, while it is still downloading (the rate does not
+        matter to yt-dlp's ffmpeg conversion)
+        """
+        def check():
+            if reservation.rate != self.rate_limit and self.transcode_start is None:
+                raise RateChanged()
+        return check
+    
+    def on_line(self, name, line):
+        """Handle an output line; returns True when it shows progress"""
+        if name == 'stderr':
+            return False
+        status = self.downloader._parse_progress(line)
+        if status:
+            return self.update(status)
+        if self.transcode_start is None and line.startswith('[ExtractAudio]'):
+            self.transcode_start = time.perf_counter()
+            return True
+        return line.startswith('[download] Destination')
+    
+    def on_transfer(self, downloaded_bytes, total_bytes):
+        """on_progress of a chunked_transfer.fetch"""
+        elapsed = time.perf_counter() - self.start
+        speed = downloaded_bytes / elapsed if elapsed > 0 else 0
+        total_bytes = total_bytes or downloaded_bytes
+        eta = int((total_bytes - downloaded_bytes) / speed) if speed else None
+        self.update({
+            'percent': 100.0 * downloaded_bytes / total_bytes if total_bytes else 0.0,
+            'total_bytes': total_bytes,
+            'downloaded_bytes': downloaded_bytes,
+            'speed': bandwidth.format_rate(speed) if speed else None,
+            'eta': f"{eta // 60:02d}:{eta % 60:02d}" if eta is not None else None,
+        })
+    
+    def update(self, status):
+        """Show and record a progress status (see _parse_progress); returns True when bytes arrived"""
+        self.total_bytes = status['total_bytes']
+        self.display.update(status)
+        with self.downloader._progress_lock:
+            self.downloader._progress[self.key] = dict(status, track=self.label)
+        moved = status['downloaded_bytes'] != self.downloaded_bytes
+        self.downloaded_bytes = status['downloaded_bytes']
+        return moved
+    
+    def finish(self, returncode=None):
+        """Record the stages (returncode None: the run was killed) and report the throughput"""
+        self.display.finish()
+        with self.downloader._progress_lock:
+            self.downloader._progress.pop(self.key, None)
+        end = time.perf_counter()
+        if returncode is None:
+            metrics.observe('download', end - self.start, failed=True, start=self.start)
+            return
+        
+        failed = returncode != 0
+        download_seconds = (self.transcode_start or end) - self.start
+        metrics.observe('download', download_seconds, failed=failed and self.transcode_start is None, start=self.start)
+        if self.transcode_start is not None:
+            metrics.observe('transcode', end - self.transcode_start, failed=failed, start=self.transcode_start)
+        if self.total_bytes:
+            metrics.BYTES_DOWNLOADED.inc(self.total_bytes)
+            throughput = self.total_bytes / max(download_seconds, 1e-6)
+            metrics.DOWNLOAD_THROUGHPUT.observe(throughput)
+            limit_info = f", limit {bandwidth.format_rate(self.rate_limit)}" if self.rate_limit else ""
+            connections_info = f" over {self.connections} connections" if self.connections > 1 else ""
+            print(f"📶 Downloaded {self.total_bytes / 1024 ** 2:.2f} MiB in {download_seconds:.1f}s{connections_info} "
+                  f"({bandwidth.format_rate(throughput)}{limit_info})")
+
+
+def track_label(youtube_url, artist_name=None, song_name=None):
+    """How a download is named in progress and messages: "<Artist> - <Song>", else its URL"""
+    return f"{artist_name} - {song_name}" if artist_name and song_name else youtube_url
+
+
+def ytdlp_restart(error, attempt, reservation):
+    """
+    Report why an interrupted yt-dlp run is restarted (see MP3Downloader.run_ytdlp)
+    
+    Args:
+        error (Exception): RateChanged or DownloadStalled
+        attempt (int): Attempts made so far; only stalls count
+        reservation (bandwidth.Reservation): The run's share of the bandwidth budget
+        
+    Returns:
+        int: The attempt number of the restart
+        
+    Raises:
+        DownloadStalled: error, once STALL_RETRIES restarts were used
+    """
+    if isinstance(error, RateChanged):
+        print(f"📶 Bandwidth budget changed, restarting the download at {bandwidth.format_rate(reservation.rate)}")
+        return attempt
+    if attempt > STALL_RETRIES:
+        raise error
+    metrics.RETRIES.inc(stage='download')
+    print(f"⚠️  {error}, restarting the download (attempt {attempt + 1}/{STALL_RETRIES + 1})")
+    return attempt + 1
+
+
+class TrackDownload:
+    """
+    One attempt at downloading a track from one YouTube video, and its outcome:
+    why it failed, and the disk auto quality saved.
+    
+    The download itself is written once, as steps: steps() yields each blocking
+    call it needs as a (function, *args) tuple and is sent back the result.
+    MP3Downloader.run_steps makes the calls on the current thread; the asyncio
+    API runs yt-dlp and ffmpeg as asyncio subprocesses instead.
+    """
+    
+    def __init__(self, downloader, youtube_url, artist_name=None, song_name=None, album_name=None,
+                 spotify_metadata=None, connections=None):
+        """
+        Args:
+            downloader (MP3Downloader): Downloader whose library, staging and settings are used
+            youtube_url (str): The YouTube video URL
+            artist_name, song_name, album_name (str, optional): For file naming and ID3 tags
+            spotify_metadata (dict, optional): Cached Spotify metadata; None tags from YouTube instead
+            connections (int, optional): Connections for a large source (default: the downloader's)
+        """
+        self.downloader = downloader
+        self.youtube_url = youtube_url
+        self.artist_name = artist_name
+        self.song_name = song_name
+        self.album_name = album_name
+        self.spotify_metadata = spotify_metadata
+        self.connections = connections or downloader.connections
+        self.label = track_label(youtube_url, artist_name, song_name)
+        self.duration_seconds = disk_space.duration_of(spotify_metadata)
+        self.album_key = downloader.album_key(artist_name, album_name, spotify_metadata)
+        self.download_folder = None
+        self.reason = None
+        self.saved_bytes = 0
+    
+    @property
+    def uses_store(self):
+        """Whether the download goes through the shared audio store (see MP3Downloader._download_via_store)"""
+        return bool(self.downloader.store and self.artist_name and self.song_name)
+    
+    def tag(self, file_path):
+        """Apply this track's ID3 tags: from the cached Spotify metadata, else from YouTube"""
+        d = self.downloader
+        if self.spotify_metadata is not None:
+            d._add_id3_tags_with_metadata(file_path, self.artist_name, self.song_name, self.album_name,
+                                          self.spotify_metadata)
+        else:
+            d._add_id3_tags(file_path, self.artist_name, self.song_name, self.album_name, self.youtube_url)
+    
+    def start(self):
+        """
+        Check that the download can run and create its library folder
+        
+        Returns:
+            bool: False if it cannot (reason says why)
+        """
+        d = self.downloader
+        if not d.ytdlp_available:
+            print("❌ yt-dlp is not available. Please install it first:")
+            print("pip install yt-dlp")
+            self.failed("yt-dlp is not available")
+            return False
+        print(f"🎵 Downloading: {self.youtube_url}")
+        if not d._is_valid_youtube_url(self.youtube_url):
+            print("❌ Invalid YouTube URL")
+            self.failed("Invalid YouTube URL")
+            return False
+        self.download_folder = d._download_folder(self.artist_name)
+        return True
+    
+    def failed(self, reason):
+        """Record why the download failed; returns None"""
+        self.reason = reason
+        return None
+    
+    def error(self, error):
+        """Report an exception that ended the download; returns None"""
+        if isinstance(error, DownloadStalled):
+            print(f"❌ Download stalled: {error} after {STALL_RETRIES + 1} attempt(s)")
+            return self.failed(f"Download stalled: {error}")
+        print(f"❌ Download error: {error}")
+        return self.failed(str(error))
+    
+    def ytdlp_failed(self, result):
+        """Report a yt-dlp run that failed; returns None"""
+        print(f"❌ yt-dlp failed:")
+        print(result.stderr)
+        return self.failed(result.stderr)
+    
+    def steps(self, staging_folder):
+        """
+        Download, convert and tag the track in staging_folder, then move it into the
+        library (steps: see the class docstring)
+        
+        With several output profiles, ReplayGain, auto quality or a chunked transfer,
+        the source is downloaded and decoded once and encoded once per profile by our
+        own ffmpeg run; otherwise yt-dlp converts it.
+        
+        Returns:
+            str: Path of the library (first profile) file or None if the download failed
+        """
+        d = self.downloader
+        if d._encodes_source(self.connections):
+            name = None
+            if self.artist_name and self.song_name:
+                name = f"{d._clean_filename(self.artist_name)} - {d._clean_filename(self.song_name)}"
+            encoded = yield from self.encode_steps(staging_folder, name, d.profiles)
+            if not encoded:
+                return None
+            file_path, self.saved_bytes = yield (d.publish_outputs, *encoded, self.download_folder, self.tag,
+                                                 self.album_key)
+            return file_path
+        
+        output_path = os.path.join(staging_folder, d._output_template(self.artist_name, self.song_name))
+        print("🔄 Converting to MP3...")
+        result = yield d.run_ytdlp, d._ytdlp_audio_command(self.youtube_url, output_path), self.label, staging_folder
+        if result.returncode != 0:
+            return self.ytdlp_failed(result)
+        file_path = yield d.finish_download, self, staging_folder
+        return file_path or self.failed("Converted file not found")
+    
+    def encode_steps(self, staging_folder, name, profiles):
+        """
+        Download the source audio into staging_folder and encode it for profiles in
+        one ffmpeg run, measuring its loudness in the same pass when REPLAYGAIN is on
+        (steps: see the class docstring)
+        
+        With more than one connection, a large source is fetched as a chunked
+        transfer; anything else (small or fragmented streams, or a chunked transfer
+        that fails) is downloaded by yt-dlp from the same extraction.
+        
+        Args:
+            name (str): Output file name without extension (None = the video title)
+            profiles (list): Output profiles, the library's first
+            
+        Returns:
+            tuple: ([(profile, staged_path)], loudness or None), or None if it failed
+        """
+        d = self.downloader
+        source_folder = os.path.join(staging_folder, "source")
+        format_file = os.path.join(staging_folder, "source-format.txt") if transcode.has_auto(profiles) else None
+        source = info_file = None
+        if self.connections > 1:
+            result = yield d.run_extraction, d._source_info_command(self.youtube_url)
+            if result.returncode != 0:
+                return self.ytdlp_failed(result)
+            info, info_file = d._source_info(result.stdout, staging_folder, format_file)
+            if chunked_transfer.eligible(info, self.connections):
+                source = yield d.chunked_download, info, source_folder, self.label, self.connections
+        
+        if not source:
+            cmd = d._ytdlp_source_command(self.youtube_url, os.path.join(source_folder, "%(title)s.%(ext)s"),
+                                          format_file, info_file, self.connections)
+            result = yield d.run_ytdlp, cmd, self.label, staging_folder
+            if result.returncode != 0:
+                return self.ytdlp_failed(result)
+            source = d._find_source_file(source_folder)
+        if not source:
+            print("❌ Source audio was downloaded but not found in expected location")
+            return self.failed("Downloaded source not found")
+        
+        outputs, cmd = d._encode_plan(staging_folder, source, name, d._resolve_auto(profiles, format_file))
+        result = yield d.run_encode, cmd, staging_folder
+        if result.returncode != 0:
+            print(f"❌ ffmpeg failed:")
+            print(result.stderr)
+            return self.failed(result.stderr)
+        
+        measured = loudness.parse_ebur128(result.stderr) if loudness.REPLAYGAIN else None
+        if loudness.REPLAYGAIN and not measured:
+            print("⚠️  No loudness measurement in the ffmpeg output; ReplayGain tags skipped")
+        return outputs, measured
+
+
+class FallbackAttempts:
+    """
+    The attempts download_with_fallback makes for a track (shared with the asyncio
+    API): iterating yields a TrackDownload per attempt, to be run after waiting
+    delay seconds. Iterating on means the attempt failed: transient failures
+    (network errors, HTTP 5xx/429, stalls) are retried on the same video up to
+    DOWNLOAD_RETRIES times, with exponential backoff from RETRY_BACKOFF_SECONDS;
+    any other failure moves on to the next candidate straight away.
+    """
+    
+    def __init__(self, downloader, youtube_urls, artist_name=None, song_name=None, album_name=None,
+                 spotify_metadata=None, stats=None, connections=None):
+        """
+        Args:
+            youtube_urls (list): Candidate URLs, best first
+            stats (dict, optional): Its "retries" and "fallbacks" counts, and the "disk_saved_bytes"
+                of auto quality, are increased
+            Others: As for TrackDownload
+        """
+        self.downloader = downloader
+        self.youtube_urls = youtube_urls
+        self.artist_name = artist_name
+        self.song_name = song_name
+        self.album_name = album_name
+        self.spotify_metadata = spotify_metadata
+        self.stats = {} if stats is None else stats
+        self.connections = connections
+        self.delay = 0
+    
+    def __iter__(self):
+        stats = self.stats
+        for index, youtube_url in enumerate(self.youtube_urls):
+            self.delay = 0
+            if index:
+                metrics.FALLBACKS.inc()
+                stats["fallbacks"] = stats.get("fallbacks", 0) + 1
+                print(f"↪️  Trying candidate {index + 1}/{len(self.youtube_urls)}: {youtube_url}")
+            for attempt in range(DOWNLOAD_RETRIES + 1):
+                track = TrackDownload(self.downloader, youtube_url, self.artist_name, self.song_name,
+                                      self.album_name, self.spotify_metadata, self.connections)
+                yield track
+                if attempt == DOWNLOAD_RETRIES or not is_transient(track.reason):
+                    break
+                # Jittered, so parallel workers hitting the same outage don't retry in lockstep
+                self.delay = RETRY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+                metrics.RETRIES.inc(stage='download')
+                stats["retries"] = stats.get("retries", 0) + 1
+                print(f"🔁 Transient error, retrying in {self.delay:.1f}s "
+                      f"(attempt {attempt + 2}/{DOWNLOAD_RETRIES + 1})")
+        if len(self.youtube_urls) > 1:
+            print(f"❌ All {len(self.youtube_urls)} YouTube candidates failed for "
+                  f"{track_label(self.youtube_urls[0], self.artist_name, self.song_name)}")
+    
+    def succeeded(self, track, file_path):
+        """Count the attempt that downloaded the track in the stats; returns file_path"""
+        add_saved_bytes(self.stats, track.saved_bytes)
+        return file_path
+
+
+def default_download_folder(download_folder=None, parent_folder_name=None):
+    """
+    The library folder MP3Downloader downloads into, without setting up a downloader
+    (for commands that only read the library or the follow list)
+    
+    Args:
+        download_folder (str): Custom download path. If None, uses $DOWNLOAD_PATH (set in the Docker image)
+            or ~/Downloads/[parent_folder_name]
+        parent_folder_name (str): Name of the parent folder in Downloads. If None, uses config default
+    
+    Returns:
+        str: Path of the download folder (not created here)
+    """
+    # Use configuration defaults if not specified
+    if parent_folder_name is None:
+        parent_folder_name = PARENT_FOLDER_NAME
+    
+    # Containers download into the mounted (possibly shared) volume
+    if download_folder is None:
+        download_folder = os.getenv('DOWNLOAD_PATH')
+    
+    # Use user's Downloads folder by default
+    if download_folder is None:
+        download_folder = os.path.join(Path.home(), "Downloads", parent_folder_name)
+    return download_folder
+
+
 class MP3Downloader:
     """
     A simplified class for downloading MP3s from YouTube videos using yt-dlp only
@@ -47,28 +664,110 @@ class MP3Downloader:
         Initialize the downloader with a target folder
         
         Args:
-            download_folder (str): Custom download path. If None, uses ~/Downloads/[parent_folder_name]
+            download_folder (str): Custom download path. If None, uses $DOWNLOAD_PATH (set in the Docker image)
+                or ~/Downloads/[parent_folder_name]
             parent_folder_name (str): Name of the parent folder in Downloads. If None, uses config default
         """
-        # Use configuration defaults if not specified
-        if parent_folder_name is None:
-            parent_folder_name = PARENT_FOLDER_NAME
-            
-        # Use user's Downloads folder by default
-        if download_folder is None:
-            download_folder = os.path.join(Path.home(), "Downloads", parent_folder_name)
-        
+        download_folder = default_download_folder(download_folder, parent_folder_name)
         self.base_download_folder = download_folder
         if not os.path.exists(download_folder):
             os.makedirs(download_folder)
         
+        # Downloads are assembled in staging and moved into the library when finished
+        self.staging_root = staging.staging_root(download_folder)
+        stale = staging.cleanup_stale(self.staging_root)
+        if stale:
+            print(f"🧹 Removed {stale} abandoned download(s) from {self.staging_root}")
+        
+        # Album covers, fetched once per album and shared by its tracks (None when COVER_ART is off)
+        self.cover_art = cover_art.open_cache(download_folder)
+        
+        # Shared content-addressed store (None unless AUDIO_STORE_DIR is set)
+        self.store = open_store()
+        
+        # Output profiles, the library's first; with several, each download is decoded once
+        # and encoded for all of them
+        self.profiles = transcode.load_profiles()
+        self.quality = self.profiles[0]["quality"]
+        if len(self.profiles) > 1:
+            for profile in self.profiles[1:]:
+                os.makedirs(profile["root"], exist_ok=True)
+            print(f"🎚️  Output profiles: " + ", ".join(
+                f"{profile['name']} ({profile['format']} {profile['quality']})" for profile in self.profiles))
+            if self.store:
+                print("⚠️  The shared audio store is not used with several output profiles")
+                self.store = None
+        
+        # Loudness of downloaded tracks by album, until write_album_gain (REPLAYGAIN)
+        self.album_gain = loudness.AlbumGain()
+        
+        # Live progress of running downloads, by thread
+        self._progress = {}
+        self._progress_lock = threading.Lock()
+        
+        # Bandwidth budget shared by all downloads in flight (unlimited unless BANDWIDTH_LIMIT is set)
+        self.bandwidth = bandwidth.BandwidthBudget()
+        
+        # Connections per download for large sources (see chunked_transfer; 1 = a single stream)
+        self.connections = chunked_transfer.CHUNKED_CONNECTIONS
+        
+        # Downloads wait for room on the staging and library volumes instead of failing on a full disk
+        self.disk_space = disk_space.DiskSpaceGate(
+            self.staging_root,
+            [download_folder, self.store.root if self.store else None] + [profile["root"] for profile in self.profiles],
+            quality=[profile["quality"] for profile in self.profiles]
+        )
+        
+        # Index of the MP3s already in the library, opened on first use
+        self._library = None
+        self._library_refreshed = False
+        self._library_lock = threading.Lock()
+        
+        # yt-dlp invocation (configurable so a stand-in can be swapped in)
+        self.ytdlp_command = shlex.split(YTDLP_COMMAND) if YTDLP_COMMAND else [sys.executable, '-m', 'yt_dlp']
+        
         # Check if yt-dlp is available
         self._check_ytdlp_availability()
     
+    @property
+    def library(self):
+        """LibraryIndex of base_download_folder"""
+        with self._library_lock:
+            if self._library is None:
+                self._library = LibraryIndex(self.base_download_folder)
+            return self._library
+    
+    def find_existing(self, artist_name, song_name):
+        """
+        Check the library index for a song that was already downloaded, so it
+        isn't searched for and downloaded again. The index is brought up to date
+        (incrementally) on the first call.
+        
+        Returns:
+            str: Path of the existing file, or None
+        """
+        if not SKIP_EXISTING or not artist_name or not song_name:
+            return None
+        library = self.library
+        with self._library_lock:
+            if not self._library_refreshed:
+                stats = library.refresh()
+                self._library_refreshed = True
+                print(f"📚 Library index: {library.count()} files "
+                      f"({stats['added']} added, {stats['updated']} updated, {stats['removed']} removed "
+                      f"in {stats['seconds']}s)")
+        return library.lookup(artist_name, song_name)
+    
+    def _index_file(self, file_path):
+        try:
+            self.library.add(file_path)
+        except Exception as e:
+            print(f"⚠️  Could not add {file_path} to the library index: {e}")
+    
     def _check_ytdlp_availability(self):
         """Check if yt-dlp is available"""
         try:
-            result = subprocess.run([sys.executable, '-m', 'yt_dlp', '--version'], 
+            result = subprocess.run(self.ytdlp_command + ['--version'], 
                          capture_output=True, text=True, timeout=5)
             if result.returncode == 0:
                 self.ytdlp_available = True
@@ -81,7 +780,7 @@ class MP3Downloader:
             print("❌ yt-dlp is not installed")
             print("Install with: pip install yt-dlp")
     
-    def download_mp3(self, youtube_url, artist_name=None, song_name=None, album_name=None):
+    def download_mp3(self, youtube_url, artist_name=None, song_name=None, album_name=None, connections=None):
         """
         Download an MP3 from a YouTube URL using yt-dlp
         
@@ -90,88 +789,582 @@ class MP3Downloader:
             artist_name (str, optional): Artist name for file naming and ID3 tags
             song_name (str, optional): Song name for file naming and ID3 tags
             album_name (str, optional): Album name for ID3 tags
+            connections (int, optional): Connections for a large source (default: self.connections)
             
         Returns:
             str: Path to the downloaded file or None if download failed
         """
-        if not self.ytdlp_available:
-            print("❌ yt-dlp is not available. Please install it first:")
-            print("pip install yt-dlp")
-            return None
+        return self.download_track(TrackDownload(self, youtube_url, artist_name, song_name, album_name,
+                                                 connections=connections))
+    
+    def download_track(self, track):
+        """
+        Run one download attempt (see TrackDownload) on this thread: through the
+        shared audio store if enabled, else in a private staging folder once the
+        disks have room for it
         
-        try:
-            print(f"🎵 Downloading: {youtube_url}")
+        Returns:
+            str: Path to the downloaded file or None if it failed (track.reason says why)
             
-            # Validate YouTube URL
-            if not self._is_valid_youtube_url(youtube_url):
-                print("❌ Invalid YouTube URL")
+        Raises:
+            DownloadCancelled: When the download's cancel check fired (see cancel_when)
+        """
+        try:
+            if not track.start():
                 return None
-            
-            # Determine artist folder and create if needed
-            if artist_name and USE_ARTIST_FOLDERS:
-                clean_artist = self._clean_filename(artist_name)
-                artist_folder = os.path.join(self.base_download_folder, clean_artist)
-                if not os.path.exists(artist_folder):
-                    os.makedirs(artist_folder)
-                download_folder = artist_folder
-            else:
-                download_folder = self.base_download_folder
-            
-            # Generate filename
-            if artist_name and song_name:
-                # Clean names for filename
-                clean_artist = self._clean_filename(artist_name)
-                clean_song = self._clean_filename(song_name)
-                output_template = f"{clean_artist} - {clean_song}.%(ext)s"
+            if track.uses_store:
+                return self._download_via_store(track)
+            with self._staged_download(track) as staging_folder:
+                return self.run_steps(track.steps(staging_folder))
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            return track.error(e)
+    
+    @staticmethod
+    def run_steps(steps):
+        """
+        Run a download's steps (see TrackDownload) on this thread: each step is a
+        (function, *args) call, whose result is sent back into the steps
+        
+        Returns:
+            What the steps return
+        """
+        result = None
+        try:
+            while True:
+                try:
+                    function, *args = steps.send(result)
+                except StopIteration as done:
+                    return done.value
+                result = function(*args)
+        finally:
+            steps.close()
+    
+    def _download_folder(self, artist_name=None):
+        """Library folder for an artist's files (created if needed)"""
+        if artist_name and USE_ARTIST_FOLDERS:
+            artist_folder = os.path.join(self.base_download_folder, self._clean_filename(artist_name))
+            os.makedirs(artist_folder, exist_ok=True)
+            return artist_folder
+        return self.base_download_folder
+    
+    def _output_template(self, artist_name=None, song_name=None):
+        """yt-dlp output template: <Artist> - <Song>, or the video title without names"""
+        if artist_name and song_name:
+            return f"{self._clean_filename(artist_name)} - {self._clean_filename(song_name)}.%(ext)s"
+        return "%(title)s.%(ext)s"
+    
+    def finish_download(self, track, staging_folder):
+        """
+        Find the file yt-dlp converted in staging_folder, tag it and move it into the
+        track's library folder
+        
+        Returns:
+            str: Path of the library file or None if it was not found
+        """
+        staged_file = self._find_downloaded_file(staging_folder, track.artist_name, track.song_name)
+        if not staged_file:
+            print("❌ File was converted but not found in expected location")
+            print("Check the downloads folder manually")
+            return None
+        # Add ID3 tags to the file, then move only the finished file into the library
+        track.tag(staged_file)
+        downloaded_file = self._publish(staged_file, track.download_folder)
+        metrics.BYTES_WRITTEN.inc(os.path.getsize(downloaded_file))
+        self._index_file(downloaded_file)
+        print(f"✅ Download successful: {downloaded_file}")
+        return downloaded_file
+    
+    def _ytdlp_audio_command(self, youtube_url, output_path):
+        """yt-dlp command line that downloads youtube_url and converts it to MP3 at output_path"""
+        return self.ytdlp_command + [
+            '--extract-audio',              # Extract audio only
+            '--audio-format', 'mp3',        # Convert to MP3
+            '--audio-quality', self.quality, # Configurable quality (the library profile's)
+            '--output', output_path,        # Output path
+            '--no-playlist',                # Single video only
+            '--ignore-errors',              # Continue on errors
+            '--newline',                    # One progress line per update
+            youtube_url
+        ]
+    
+    def _download_via_store(self, track):
+        """
+        Download a track through the shared audio store. yt-dlp only runs if no
+        library has fetched this video at this quality before; the library file is
+        then a view of the stored object carrying its own tags.
+        
+        Returns:
+            str: Path of the library file or None if the download failed
+        """
+        key = self.store.key(self._video_id(track.youtube_url), 'mp3', self.quality)
+        loudness_file = os.path.join(self.store.object_dir(key), "loudness.json")
+        measured = None
+        
+        # Held while downloading, so concurrent requests for the same video wait and reuse it
+        with self.store.locked(key):
+            if self.store.has(key):
+                print(f"♻️  Reusing {key} from the shared audio store")
+                metrics.STORE_REUSED.inc()
+                # Objects stored before REPLAYGAIN was turned on have no measurement
+                if loudness.REPLAYGAIN and os.path.exists(loudness_file):
+                    with open(loudness_file, encoding="utf-8") as f:
+                        measured = loudness.loads(f.read())
             else:
-                # Use video title
-                output_template = "%(title)s.%(ext)s"
-            
-            output_path = os.path.join(download_folder, output_template)
-            
-            # yt-dlp command
-            cmd = [
-                sys.executable, '-m', 'yt_dlp',
-                '--extract-audio',              # Extract audio only
-                '--audio-format', 'mp3',        # Convert to MP3
-                '--audio-quality', AUDIO_QUALITY, # Configurable quality
-                '--output', output_path,        # Output path
-                '--no-playlist',                # Single video only
-                '--ignore-errors',              # Continue on errors
-                youtube_url
-            ]
+                # Only the finished file enters the store, so a failed download leaves nothing behind
+                with self._staged_download(track) as staging_folder:
+                    if loudness.REPLAYGAIN or transcode.has_auto(self.profiles[:1]) or track.connections > 1:
+                        # Encoded by our own ffmpeg run, which measures loudness in the same pass
+                        # and picks the bitrate for auto quality
+                        encoded = self.run_steps(track.encode_steps(staging_folder, "audio", self.profiles[:1]))
+                        if not encoded:
+                            return None
+                        outputs, measured = encoded
+                        staged_file = outputs[0][1]
+                        track.saved_bytes = transcode.auto_saved_bytes(outputs[0][0], os.path.getsize(staged_file))
+                    else:
+                        print("🔄 Converting to MP3...")
+                        result = self.run_ytdlp(
+                            self._ytdlp_audio_command(track.youtube_url,
+                                                      os.path.join(staging_folder, "audio.%(ext)s")),
+                            track.label, staging_folder
+                        )
+                        if result.returncode != 0:
+                            return track.ytdlp_failed(result)
+                        staged_file = self._find_downloaded_file(staging_folder)
+                        if not staged_file:
+                            print("❌ File was converted but not found in expected location")
+                            return track.failed("Converted file not found")
+                    self.store.add(key, staged_file)
+                    if measured:
+                        with open(loudness_file, "w", encoding="utf-8") as f:
+                            f.write(loudness.dumps(measured))
+        
+        view_path = os.path.join(
+            track.download_folder,
+            f"{self._clean_filename(track.artist_name)} - {self._clean_filename(track.song_name)}.mp3"
+        )
+        view_tag = track.tag
+        if measured:
+            def view_tag(path, album=None):
+                track.tag(path)
+                loudness.write_tags(path, track=measured, album=album)
+            # Album gain re-links the view with the album tags added, leaving other views alone
+            self.album_gain.add(track.album_key, measured,
+                                lambda album: self.store.link_view(key, view_path, lambda path: view_tag(path, album)))
+        self.store.link_view(key, view_path, view_tag)
+        self._index_file(view_path)
+        print(f"✅ Download successful: {view_path}")
+        return view_path
+    
+    def publish_outputs(self, outputs, measured, download_folder, tag, album_key=None):
+        """
+        Tag encoded outputs (the library file once, the others copy its tags) and move
+        each into its profile's library
+        
+        Args:
+            outputs (list): (profile, staged_path) pairs, the library profile first
+            measured (dict): Track loudness, or None
             
-            print("🔄 Converting to MP3...")
+        Returns:
+            tuple: (path of the library file, bytes saved by auto quality)
+        """
+        # Tag the library file once; the other outputs copy its tags
+        library_file = outputs[0][1]
+        tag(library_file)
+        if measured:
+            loudness.write_tags(library_file, track=measured)
+        for _, path in outputs[1:]:
+            transcode.copy_tags(library_file, path)
+            if measured and not path.endswith(".mp3"):
+                loudness.write_tags(path, track=measured)
+        
+        # Every output is finished before any is published
+        relative_folder = os.path.relpath(download_folder, self.base_download_folder)
+        published = []
+        saved_bytes = 0
+        for profile, path in outputs:
+            folder = download_folder
+            if profile["root"]:
+                folder = os.path.normpath(os.path.join(profile["root"], relative_folder))
+                os.makedirs(folder, exist_ok=True)
+            published.append(staging.move_into_place(path, os.path.join(folder, os.path.basename(path))))
+            size = os.path.getsize(published[-1])
+            metrics.BYTES_WRITTEN.inc(size)
+            saved_bytes += transcode.auto_saved_bytes(profile, size)
+        
+        if measured:
+            self.album_gain.add(album_key, measured,
+                                lambda album: [loudness.write_tags(path, album=album) for path in published])
+        self._index_file(published[0])
+        gain_info = f" (ReplayGain {loudness.gain(measured):+.2f} dB)" if measured else ""
+        print(f"✅ Download successful: {published[0]}{gain_info}")
+        for (profile, _), path in zip(outputs[1:], published[1:]):
+            print(f"   ↳ {profile['name']}: {path}")
+        return published[0], saved_bytes
+    
+    def _encode_plan(self, staging_folder, source, name, profiles):
+        """
+        Staged output paths and the ffmpeg command encoding source into all of them
+        
+        Returns:
+            tuple: ([(profile, staged_path)], cmd)
+        """
+        name = name or self._clean_filename(os.path.splitext(os.path.basename(source))[0])
+        outputs = []
+        for profile in profiles:
+            os.makedirs(os.path.join(staging_folder, profile["name"]))
+            outputs.append((profile, os.path.join(staging_folder, profile["name"], f"{name}.{profile['format']}")))
+        
+        cmd = transcode.encode_command(source, outputs)
+        if loudness.REPLAYGAIN:
+            cmd += loudness.analysis_args()
+        print(f"🔄 Encoding {len(outputs)} profile(s) from one decode..." if len(outputs) > 1 else "🔄 Converting to MP3...")
+        return outputs, cmd
+    
+    @staticmethod
+    def album_key(artist_name, album_name, spotify_metadata=None):
+        """Identifies a track's album for album gain: its Spotify ID, else artist + album name"""
+        album_id = (spotify_metadata or {}).get('album_id')
+        if album_id:
+            return album_id
+        return (artist_name, album_name) if album_name else None
+    
+    def write_album_gain(self, album_keys=None):
+        """
+        Post-batch step: write album ReplayGain to the files of each album downloaded
+        since the last call, from the loudness measured while encoding (no audio is read)
+        
+        Args:
+            album_keys (iterable, optional): Only these albums (default: all)
+        """
+        return self.album_gain.write(album_keys)
+    
+    def _ytdlp_source_command(self, youtube_url, output_path, format_file=None, info_file=None, connections=1):
+        """
+        yt-dlp command line that downloads the best audio stream of youtube_url as it is (no conversion)
+        
+        Args:
+            format_file (str, optional): Where yt-dlp writes the selected stream's bitrate and
+                codec (see transcode.SOURCE_FORMAT_TEMPLATE), for auto quality
+            info_file (str, optional): Extraction info already fetched (see _source_info), used
+                instead of extracting youtube_url again
+            connections (int): Fragments of a fragmented stream downloaded at once
+        """
+        format_args = ['--print-to-file', transcode.SOURCE_FORMAT_TEMPLATE, format_file] if format_file else []
+        if connections > 1:
+            format_args += ['--concurrent-fragments', str(connections)]
+        return self.ytdlp_command + [
+            '--format', 'bestaudio/best',
+            '--output', output_path,
+            '--no-playlist',
+            '--newline',
+        ] + format_args + (['--load-info-json', info_file] if info_file else [youtube_url])
+    
+    def _source_info_command(self, youtube_url):
+        """yt-dlp command line that prints the extraction info of youtube_url's best audio stream"""
+        return self.ytdlp_command + [
+            '--dump-json',
+            '--format', 'bestaudio/best',
+            '--no-playlist',
+            '--verbose',                    # Log each extraction step (to stderr)
+            youtube_url
+        ]
+    
+    def _source_info(self, output, staging_folder, format_file=None):
+        """
+        Parse the output of _source_info_command and keep it in staging_folder, so
+        yt-dlp can download from it without extracting again
+        
+        Args:
+            format_file (str, optional): Also write the stream's bitrate and codec here, as
+                --print-to-file would (for auto quality)
             
-            # Run yt-dlp
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        Returns:
+            tuple: (info dict, info file path), or ({}, None) if the output is not JSON
+        """
+        try:
+            info = json.loads(output)
+        except ValueError:
+            return {}, None
+        info_file = os.path.join(staging_folder, "source.info.json")
+        with open(info_file, "w", encoding="utf-8") as f:
+            f.write(output)
+        if format_file:
+            with open(format_file, "w", encoding="utf-8") as f:
+                f.write(f"{info.get('abr') or 'NA'} {info.get('acodec') or 'NA'}\n")
+        return info, info_file
+    
+    def chunked_download(self, info, source_folder, label, connections):
+        """
+        Fetch the stream of a source's extraction info over several connections (see
+        chunked_transfer), with the live progress, bandwidth share and metrics of a
+        yt-dlp download
+        
+        Returns:
+            str: Path of the downloaded source, or None if the transfer failed (the
+                caller falls back to yt-dlp)
             
-            if result.returncode == 0:
-                # Find the downloaded file
-                downloaded_file = self._find_downloaded_file(download_folder, artist_name, song_name)
-                if downloaded_file:
-                    # Add ID3 tags to the file
-                    self._add_id3_tags(downloaded_file, artist_name, song_name, album_name, youtube_url)
-                    print(f"✅ Download successful: {downloaded_file}")
-                    return downloaded_file
-                else:
-                    print("❌ File was converted but not found in expected location")
-                    print("Check the downloads folder manually")
-                    return None
-            else:
-                print(f"❌ yt-dlp failed:")
-                print(result.stderr)
+        Raises:
+            DownloadCancelled: When the download's cancel check fired (see cancel_when)
+        """
+        os.makedirs(source_folder, exist_ok=True)
+        title = self._clean_filename(info.get('title') or "source")
+        path = os.path.join(source_folder, f"{title}.{info.get('ext') or 'webm'}")
+        with self.bandwidth.download() as rate_limit:
+            watch = DownloadWatch(self, label, rate_limit, threading.get_ident(), connections)
+            try:
+                # The share is read again for every range, following peers finishing and budget changes
+                chunked_transfer.fetch(info['url'], path, headers=info.get('http_headers'), connections=connections,
+                                       rate_limit=self.bandwidth.share,
+                                       on_progress=watch.on_transfer, cancel=_CancelEvent())
+            except chunked_transfer.TransferCancelled:
+                watch.finish()
+                check_cancelled()
+                raise
+            except chunked_transfer.TRANSFER_ERRORS as e:
+                watch.finish()
+                print(f"⚠️  Chunked transfer failed ({e}), downloading with yt-dlp instead")
+                shutil.rmtree(source_folder, ignore_errors=True)
                 return None
-                
-        except subprocess.TimeoutExpired:
-            print("❌ Download timed out after 5 minutes")
+            except BaseException:
+                watch.finish()
+                raise
+            watch.finish(0)
+        return path
+    
+    def _resolve_auto(self, profiles, format_file=None):
+        """Profiles with auto qualities set from the source format yt-dlp wrote to format_file"""
+        if not format_file:
+            return profiles
+        try:
+            with open(format_file, encoding="utf-8") as f:
+                source_kbps, source_codec = transcode.parse_source_format(f.read())
+        except OSError:
+            source_kbps, source_codec = None, None
+        resolved = transcode.resolve_auto(profiles, source_kbps, source_codec)
+        source = f"{source_codec or 'unknown codec'} {source_kbps:.0f} kbps" if source_kbps else "unknown bitrate"
+        print(f"🎚️  Auto quality: source {source} -> " +
+              ", ".join(profile["quality"] for profile in resolved if profile.get("auto")))
+        return resolved
+    
+    def _encodes_source(self, connections=1):
+        """Whether downloads are converted by our own ffmpeg run rather than by yt-dlp"""
+        return len(self.profiles) > 1 or loudness.REPLAYGAIN or transcode.has_auto(self.profiles) or connections > 1
+    
+    @staticmethod
+    def _find_source_file(source_folder):
+        """The downloaded source audio in source_folder, or None"""
+        try:
+            names = [name for name in os.listdir(source_folder)
+                     if not name.endswith(('.part', '.ytdl')) and not name.startswith('.')]
+        except FileNotFoundError:
             return None
-        except Exception as e:
-            print(f"❌ Download error: {e}")
+        return os.path.join(source_folder, names[0]) if len(names) == 1 else None
+    
+    def run_encode(self, cmd, watch_folder):
+        """Run an ffmpeg encode, timed as the transcode stage; growing outputs count as progress"""
+        with metrics.timed('transcode') as stage:
+            result = self._monitor(cmd, lambda name, line: False, watch_folder)
+            if result.returncode != 0:
+                stage.mark_failed()
+        return result
+    
+    def run_extraction(self, cmd):
+        """Run a yt-dlp extraction (see _source_info_command); every output line counts as progress"""
+        return self._monitor(cmd, lambda name, line: True)
+    
+    @contextmanager
+    def _staged_download(self, track):
+        """A private staging folder for a track's download, once the disks have room for it"""
+        with self.disk_space.admit(*disk_space.estimate_track(track.duration_seconds, self.disk_space.quality),
+                                   track.label, cancel=check_cancelled):
+            with staging.staging_dir(self.staging_root) as staging_folder:
+                yield staging_folder
+    
+    def download_with_fallback(self, youtube_urls, artist_name=None, song_name=None, album_name=None,
+                               spotify_metadata=None, stats=None, connections=None, cancel=None):
+        """
+        Download a track from the first of its ranked YouTube candidates that works.
+        
+        Transient failures (network errors, HTTP 5xx/429, stalls) are retried on the
+        same video up to DOWNLOAD_RETRIES times, with exponential backoff from
+        RETRY_BACKOFF_SECONDS. Any other failure (video unavailable, private, age or
+        region restricted...) moves on to the next candidate straight away.
+        
+        Args:
+            youtube_urls (list): Candidate URLs, best first (see CallYoutube.search_youtube)
+            artist_name, song_name, album_name (str, optional): As for download_mp3
+            spotify_metadata (dict, optional): Cached Spotify metadata (see download_mp3_with_metadata);
+                None tags from YouTube instead
+            stats (dict, optional): Its "retries" and "fallbacks" counts, and the "disk_saved_bytes"
+                of auto quality, are increased
+            connections (int, optional): Connections for a large source (default: self.connections)
+            cancel (callable, optional): Polled while downloading; once it returns True the
+                download is stopped (see cancel_when)
+            
+        Returns:
+            str: Path to the downloaded file or None if every candidate failed
+            
+        Raises:
+            DownloadCancelled: When cancel returned True
+        """
+        if cancel is not None:
+            with cancel_when(cancel):
+                return self.download_with_fallback(youtube_urls, artist_name, song_name, album_name,
+                                                   spotify_metadata, stats, connections)
+        attempts = FallbackAttempts(self, youtube_urls, artist_name, song_name, album_name, spotify_metadata, stats,
+                                    connections)
+        for track in attempts:
+            time.sleep(attempts.delay)
+            check_cancelled()
+            file_path = self.download_track(track)
+            if file_path:
+                return attempts.succeeded(track, file_path)
+        return None
+    
+    def _publish(self, staged_file, download_folder):
+        """Atomically move a finished, tagged file from staging into the library folder"""
+        return staging.move_into_place(staged_file, os.path.join(download_folder, os.path.basename(staged_file)))
+    
+    def run_ytdlp(self, cmd, label=None, watch_folder=None):
+        """
+        Run a yt-dlp download command, streaming its output to time the
+        download and the ffmpeg transcode ([ExtractAudio]) stages separately
+        and to show live progress. The download is rate limited to its share of
+        the bandwidth budget, and its achieved throughput is reported when it finishes.
+        When the budget changes while it downloads, it is restarted at its new rate.
+        
+        There is no fixed timeout: yt-dlp runs for as long as it makes progress
+        (bytes downloaded, or files growing in watch_folder while ffmpeg converts).
+        After STALL_TIMEOUT_SECONDS without progress it is killed and restarted,
+        resuming the partial download, up to STALL_RETRIES times.
+        
+        Args:
+            cmd (list): yt-dlp command (should include --newline)
+            label (str, optional): Track name shown with the progress
+            watch_folder (str, optional): Folder yt-dlp writes into (the staging folder)
+            
+        Returns:
+            subprocess.CompletedProcess: Finished process with captured stdout/stderr
+            
+        Raises:
+            DownloadStalled: If the last attempt also stopped making progress
+        """
+        with self.bandwidth.fixed_download() as reservation:
+            attempt = 1
+            while True:
+                try:
+                    with DownloadWatch(self, label, reservation.rate, threading.get_ident()) as watch:
+                        result = self._monitor(self.limit_rate(cmd, watch.rate_limit), watch.on_line, watch_folder,
+                                               interrupt=watch.rerate_check(reservation))
+                        watch.finish(result.returncode)
+                        return result
+                except (RateChanged, DownloadStalled) as e:
+                    attempt = ytdlp_restart(e, attempt, reservation)
+    
+    def limit_rate(self, cmd, rate_limit):
+        """cmd with yt-dlp's --limit-rate set to rate_limit (unchanged for no limit)"""
+        if not rate_limit:
+            return cmd
+        prefix = len(self.ytdlp_command)
+        return cmd[:prefix] + ['--limit-rate', str(rate_limit)] + cmd[prefix:]
+    
+    def _monitor(self, cmd, on_line, watch_folder=None, interrupt=None):
+        """
+        Run cmd, handing each output line to on_line(stream_name, line), which
+        returns True when the line shows progress. Growth of the files in
+        watch_folder counts as progress too.
+        
+        Args:
+            interrupt (callable, optional): Called about once a second; an exception it
+                raises kills the process and is re-raised
+        
+        Raises:
+            DownloadStalled: After STALL_TIMEOUT_SECONDS without progress (the process is killed)
+            DownloadCancelled: When the download's cancel check fires (the process is killed)
+        """
+        stdout_lines, stderr_lines = [], []
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        lines = queue.Queue()
+        
+        def read_stream(stream, name):
+            for line in stream:
+                lines.put((name, line))
+            lines.put((name, None))
+        
+        readers = [
+            threading.Thread(target=read_stream, args=(process.stdout, 'stdout'), daemon=True),
+            threading.Thread(target=read_stream, args=(process.stderr, 'stderr'), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        
+        open_streams = 2
+        stall = StallClock(watch_folder)
+        try:
+            while open_streams:
+                try:
+                    name, line = lines.get(timeout=1)
+                except queue.Empty:
+                    name = line = None
+                if name and line is None:
+                    open_streams -= 1
+                elif line is not None:
+                    (stderr_lines if name == 'stderr' else stdout_lines).append(line)
+                    if on_line(name, line):
+                        stall.progress()
+                stall.check()
+                check_cancelled()
+                if interrupt:
+                    interrupt()
+            returncode = process.wait()
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        
+        return subprocess.CompletedProcess(cmd, returncode, ''.join(stdout_lines), ''.join(stderr_lines))
+    
+    def active_downloads(self):
+        """Live progress of the downloads running now (track, percent, speed, ETA)"""
+        with self._progress_lock:
+            return list(self._progress.values())
+    
+    @staticmethod
+    def _parse_progress(line):
+        """
+        Parse a yt-dlp '[download]  42.0% of 3.45MiB at 1.20MiB/s ETA 00:02' progress line
+        
+        Returns:
+            dict: percent, total_bytes, downloaded_bytes, speed and eta (as printed), or None
+        """
+        match = PROGRESS_PATTERN.match(line)
+        if not match:
             return None
+        units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+        percent = float(match.group('percent'))
+        total_bytes = int(float(match.group('size')) * units[match.group('unit')])
+        return {
+            'percent': percent,
+            'total_bytes': total_bytes,
+            'downloaded_bytes': int(total_bytes * percent / 100),
+            'speed': (match.group('speed') or '').strip() or None,
+            'eta': match.group('eta'),
+        }
+    
+    def _parse_download_size(self, line):
+        """Parse the total size (bytes) from a yt-dlp '[download]  42.0% of 3.45MiB' progress line"""
+        status = self._parse_progress(line)
+        return status['total_bytes'] if status else None
     
     def _is_valid_youtube_url(self, url):
         """Check if the URL is a valid YouTube URL"""
+        return self._video_id(url) is not None
+    
+    def _video_id(self, url):
+        """The 11-character video ID of a YouTube URL, or None"""
         youtube_patterns = [
             r'(?:https?:\/\/)?(?:www\.)?youtube\.com\/watch\?v=([0-9A-Za-z_-]{11})',
             r'(?:https?:\/\/)?(?:www\.)?youtu\.be\/([0-9A-Za-z_-]{11})',
@@ -180,21 +1373,34 @@ class MP3Downloader:
         ]
         
         for pattern in youtube_patterns:
-            if re.search(pattern, url):
-                return True
-        return False
+            match = re.search(pattern, url)
+            if match:
+                return match.group(1)
+        return None
     
     def _clean_filename(self, filename):
-        """Clean filename to remove invalid characters"""
-        # Remove or replace invalid characters for filenames
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)  # Remove invalid chars
-        filename = re.sub(r'[^\w\s\-_\.]', '', filename)  # Keep only alphanumeric, spaces, hyphens, underscores, dots
-        filename = filename.strip()  # Remove leading/trailing spaces
-        return filename
+        """Clean filename to remove invalid characters (memoized, see title_normalizer)"""
+        return title_normalizer.clean_filename(filename)
     
     def _find_downloaded_file(self, search_folder, artist_name=None, song_name=None):
         """Find the most recently downloaded MP3 file in the specified folder"""
+        with metrics.timed('file_discovery') as stage:
+            found = self._find_downloaded_file_in(search_folder, artist_name, song_name)
+            if not found:
+                stage.mark_failed()
+        return found
+    
+    def _find_downloaded_file_in(self, search_folder, artist_name=None, song_name=None):
         try:
+            # The output template names the file exactly; checking that first avoids
+            # picking up a file another worker just wrote to the same folder
+            if artist_name and song_name:
+                expected = os.path.join(
+                    search_folder, f"{self._clean_filename(artist_name)} - {self._clean_filename(song_name)}.mp3"
+                )
+                if os.path.exists(expected):
+                    return expected
+            
             # Get all MP3 files in search folder
             mp3_files = []
             for file in os.listdir(search_folder):
@@ -210,8 +1416,8 @@ class MP3Downloader:
             
             # If we have artist and song name, try to find exact match first
             if artist_name and song_name:
-                clean_artist = self._clean_filename(artist_name).lower()
-                clean_song = self._clean_filename(song_name).lower()
+                clean_artist = title_normalizer.match_key(artist_name)
+                clean_song = title_normalizer.match_key(song_name)
                 
                 for file_path, _ in mp3_files:
                     filename = os.path.basename(file_path).lower()
@@ -239,6 +1445,7 @@ class MP3Downloader:
         if not ID3_AVAILABLE:
             return
         
+        tag_start = time.perf_counter()
         try:
             # Load the MP3 file
             audio = MP3(file_path)
@@ -292,8 +1499,10 @@ class MP3Downloader:
                 tag_info += f", Year: {final_year}"
             
             print(f"🏷️  ID3 tags added: {tag_info}")
+            metrics.observe('tag', time.perf_counter() - tag_start, start=tag_start)
             
         except Exception as e:
+            metrics.observe('tag', time.perf_counter() - tag_start, failed=True, start=tag_start)
             print(f"⚠️  Warning: Could not add ID3 tags: {e}")
     
     def _add_id3_tags_with_metadata(self, file_path, artist_name=None, song_name=None, album_name=None, spotify_metadata=None):
@@ -310,6 +1519,7 @@ class MP3Downloader:
         if not ID3_AVAILABLE:
             return
         
+        tag_start = time.perf_counter()
         try:
             # Load the MP3 file
             audio = MP3(file_path)
@@ -353,6 +1563,14 @@ class MP3Downloader:
             if final_year:
                 audio.tags.add(TDRC(encoding=3, text=str(final_year)))
             
+            # Front cover from the Spotify album image (cached per album)
+            cover = None
+            if self.cover_art:
+                cover = self.cover_art.get(spotify_metadata.get('album_id'), spotify_metadata.get('album_image'))
+            if cover:
+                audio.tags.delall('APIC')
+                audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=cover))
+            
             # Save the tags
             audio.save()
             
@@ -362,10 +1580,14 @@ class MP3Downloader:
                 tag_info += f", Album: {final_album}"
             if final_year:
                 tag_info += f", Year: {final_year}"
+            if cover:
+                tag_info += ", Cover art"
             
             print(f"🏷️  ID3 tags added (from cached Spotify data): {tag_info}")
+            metrics.observe('tag', time.perf_counter() - tag_start, start=tag_start)
             
         except Exception as e:
+            metrics.observe('tag', time.perf_counter() - tag_start, failed=True, start=tag_start)
             print(f"⚠️  Warning: Could not add ID3 tags: {e}")
     
     def _clean_video_title_for_song(self, title):
@@ -378,32 +1600,26 @@ class MP3Downloader:
         Returns:
             str: Cleaned song name
         """
-        # Remove common patterns from YouTube titles
-        title = re.sub(r'\[.*?\]', '', title)  # Remove [Official Video], [Lyrics], etc.
-        title = re.sub(r'\(.*?[Oo]fficial.*?\)', '', title)  # Remove (Official Video), etc.
-        title = re.sub(r'\(.*?[Vv]ideo.*?\)', '', title)  # Remove (Video), (Music Video), etc.
-        title = re.sub(r'\(.*?[Ll]yrics.*?\)', '', title)  # Remove (Lyrics), (With Lyrics), etc.
-        title = re.sub(r'\(.*?[Aa]udio.*?\)', '', title)  # Remove (Audio), (Official Audio), etc.
-        title = re.sub(r'\|.*', '', title)  # Remove everything after |
-        title = re.sub(r'-.*[Yy]ou[Tt]ube.*', '', title)  # Remove "- YouTube" and similar
-        title = re.sub(r'HD$|4K$', '', title)  # Remove HD, 4K suffixes
-        title = re.sub(r'\s+', ' ', title)  # Normalize whitespace
-        title = title.strip(' -')  # Remove leading/trailing spaces and dashes
-        
-        return title if title else "Unknown Title"
+        return title_normalizer.clean_video_title(title)
     
     def download_multiple(self, urls_with_metadata, album_name=None):
         """
         Download multiple songs
         
         Args:
-            urls_with_metadata (list): List of tuples (url, artist, song) or just urls
+            urls_with_metadata (list): List of tuples (url, artist, song) or just urls; url may also
+                be a list of candidate URLs, best first
             album_name (str, optional): Album name to apply to all downloads
             
         Returns:
             list: List of downloaded file paths
+            
+        Raises:
+            disk_space.BatchTooLarge: When the volumes cannot hold the batch (see check_batch_space)
         """
         downloaded_files = []
+        stats = {}
+        self.check_batch_space([None] * len(urls_with_metadata))
         
         for item in urls_with_metadata:
             current_album = album_name  # Initialize with default album
@@ -424,15 +1640,21 @@ class MP3Downloader:
             
             print(f"\n📥 Downloading {len(downloaded_files) + 1}/{len(urls_with_metadata)}")
             
-            file_path = self.download_mp3(url, artist, song, current_album)
+            with tracing.track_context(f"{artist} - {song}" if artist and song else url, "track_download"):
+                file_path = self.download_with_fallback(url if isinstance(url, list) else [url], artist, song,
+                                                        current_album, stats=stats)
             if file_path:
                 downloaded_files.append(file_path)
             
             # Small delay between downloads to be respectful
-            if len(urls_with_metadata) > 1:
-                time.sleep(2)
+            if len(urls_with_metadata) > 1 and DOWNLOAD_DELAY_SECONDS:
+                time.sleep(DOWNLOAD_DELAY_SECONDS)
         
-        print(f"\n🎉 Download complete! {len(downloaded_files)}/{len(urls_with_metadata)} files downloaded successfully")
+        self.write_album_gain()
+        print(f"\n🎉 Download complete! {len(downloaded_files)}/{len(urls_with_metadata)} files downloaded successfully "
+              f"({success_rate(len(downloaded_files), len(urls_with_metadata))})")
+        if saved_summary(stats):
+            print(saved_summary(stats))
         return downloaded_files
     
     def download_multiple_with_metadata(self, urls_with_metadata):
@@ -440,12 +1662,18 @@ class MP3Downloader:
         Download multiple songs using cached Spotify metadata
         
         Args:
-            urls_with_metadata (list): List of tuples (url, artist, song, album, spotify_metadata)
+            urls_with_metadata (list): List of tuples (url, artist, song, album, spotify_metadata), where
+                url may also be a list of candidate URLs, best first
             
         Returns:
             list: List of downloaded file paths
+            
+        Raises:
+            disk_space.BatchTooLarge: When the volumes cannot hold the batch (see check_batch_space)
         """
         downloaded_files = []
+        stats = {}
+        self.check_batch_space([disk_space.duration_of(item[4]) for item in urls_with_metadata])
         
         for item in urls_with_metadata:
             url, artist, song, album, spotify_metadata = item
@@ -453,18 +1681,55 @@ class MP3Downloader:
             print(f"\n📥 Downloading {len(downloaded_files) + 1}/{len(urls_with_metadata)}")
             print(f"🎵 Using cached Spotify metadata for enhanced tags")
             
-            file_path = self.download_mp3_with_metadata(url, artist, song, album, spotify_metadata)
+            with tracing.track_context(f"{artist} - {song}", "track_download"):
+                # url may be a list of ranked candidates to fall back on
+                file_path = self.download_with_fallback(url if isinstance(url, list) else [url], artist, song,
+                                                        album, spotify_metadata or {}, stats)
             if file_path:
                 downloaded_files.append(file_path)
             
             # Small delay between downloads to be respectful
-            if len(urls_with_metadata) > 1:
-                time.sleep(2)
+            if len(urls_with_metadata) > 1 and DOWNLOAD_DELAY_SECONDS:
+                time.sleep(DOWNLOAD_DELAY_SECONDS)
         
-        print(f"\n🎉 Download complete! {len(downloaded_files)}/{len(urls_with_metadata)} files downloaded successfully")
+        self.write_album_gain()
+        print(f"\n🎉 Download complete! {len(downloaded_files)}/{len(urls_with_metadata)} files downloaded successfully "
+              f"({success_rate(len(downloaded_files), len(urls_with_metadata))})")
+        if saved_summary(stats):
+            print(saved_summary(stats))
         return downloaded_files
     
-    def download_mp3_with_metadata(self, youtube_url, artist_name=None, song_name=None, album_name=None, spotify_metadata=None):
+    def check_batch_space(self, durations):
+        """
+        Admit a batch against disk space before any of it downloads. Downloads that
+        don't fit yet wait for space; a batch the volumes cannot hold however much
+        space is freed is rejected.
+        
+        Args:
+            durations (list): Track lengths in seconds (None where unknown)
+            
+        Returns:
+            dict: The batch estimate (see DiskSpaceGate.check_batch)
+            
+        Raises:
+            disk_space.BatchTooLarge: When a volume is too small for the whole batch
+        """
+        batch = self.disk_space.check_batch(durations)
+        print(f"💾 Estimated size: ~{batch['needed_bytes'] / disk_space.MB:.0f} MB for {batch['tracks']} song(s)")
+        if batch['exceeds_volume']:
+            path, needed, capacity = batch['exceeds_volume']
+            raise disk_space.BatchTooLarge(
+                f"The batch needs ~{needed / disk_space.MB:.0f} MB on {path}, more than the volume holds above "
+                f"the reserve ({capacity / disk_space.MB:.0f} MB); split it or free space on another volume")
+        if batch['shortfall']:
+            path, needed, available = batch['shortfall']
+            print(f"⚠️  Not enough free space on {path} for the whole batch "
+                  f"(~{available / disk_space.MB:.0f} MB available above the reserve): "
+                  f"{batch['fits_now']} song(s) fit now, the rest will wait until space is freed")
+        return batch
+    
+    def download_mp3_with_metadata(self, youtube_url, artist_name=None, song_name=None, album_name=None, spotify_metadata=None,
+                                   connections=None):
         """
         Download an MP3 using pre-cached Spotify metadata
         
@@ -474,85 +1739,13 @@ class MP3Downloader:
             song_name (str, optional): Song name
             album_name (str, optional): Album name
             spotify_metadata (dict, optional): Pre-cached Spotify metadata
+            connections (int, optional): Connections for a large source (default: self.connections)
             
         Returns:
             str: Path to the downloaded file or None if download failed
         """
-        if not self.ytdlp_available:
-            print("❌ yt-dlp is not available. Please install it first:")
-            print("pip install yt-dlp")
-            return None
-        
-        try:
-            print(f"🎵 Downloading: {youtube_url}")
-            
-            # Validate YouTube URL
-            if not self._is_valid_youtube_url(youtube_url):
-                print("❌ Invalid YouTube URL")
-                return None
-            
-            # Determine artist folder and create if needed
-            if artist_name and USE_ARTIST_FOLDERS:
-                clean_artist = self._clean_filename(artist_name)
-                artist_folder = os.path.join(self.base_download_folder, clean_artist)
-                if not os.path.exists(artist_folder):
-                    os.makedirs(artist_folder)
-                download_folder = artist_folder
-            else:
-                download_folder = self.base_download_folder
-            
-            # Generate filename
-            if artist_name and song_name:
-                # Clean names for filename
-                clean_artist = self._clean_filename(artist_name)
-                clean_song = self._clean_filename(song_name)
-                output_template = f"{clean_artist} - {clean_song}.%(ext)s"
-            else:
-                # Use video title
-                output_template = "%(title)s.%(ext)s"
-            
-            output_path = os.path.join(download_folder, output_template)
-            
-            # yt-dlp command
-            cmd = [
-                sys.executable, '-m', 'yt_dlp',
-                '--extract-audio',              # Extract audio only
-                '--audio-format', 'mp3',        # Convert to MP3
-                '--audio-quality', AUDIO_QUALITY, # Configurable quality
-                '--output', output_path,        # Output path
-                '--no-playlist',                # Single video only
-                '--ignore-errors',              # Continue on errors
-                youtube_url
-            ]
-            
-            print("🔄 Converting to MP3...")
-            
-            # Run yt-dlp
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            if result.returncode == 0:
-                # Find the downloaded file
-                downloaded_file = self._find_downloaded_file(download_folder, artist_name, song_name)
-                if downloaded_file:
-                    # Add ID3 tags using cached Spotify metadata
-                    self._add_id3_tags_with_metadata(downloaded_file, artist_name, song_name, album_name, spotify_metadata)
-                    print(f"✅ Download successful: {downloaded_file}")
-                    return downloaded_file
-                else:
-                    print("❌ File was converted but not found in expected location")
-                    print("Check the downloads folder manually")
-                    return None
-            else:
-                print(f"❌ yt-dlp failed:")
-                print(result.stderr)
-                return None
-                
-        except subprocess.TimeoutExpired:
-            print("❌ Download timed out after 5 minutes")
-            return None
-        except Exception as e:
-            print(f"❌ Download error: {e}")
-            return None
+        return self.download_track(TrackDownload(self, youtube_url, artist_name, song_name, album_name,
+                                                 spotify_metadata or {}, connections))
     
     def get_video_info(self, youtube_url):
         """
@@ -568,17 +1761,20 @@ class MP3Downloader:
             return None
         
         try:
-            cmd = [
-                sys.executable, '-m', 'yt_dlp',
+            cmd = self.ytdlp_command + [
                 '--dump-json',
                 '--no-playlist',
+                '--verbose',                    # Log each extraction step (to stderr)
                 youtube_url
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            with metrics.timed('video_info') as stage:
+                # No fixed timeout: every step yt-dlp logs counts as progress
+                result = self._monitor(cmd, lambda name, line: True)
+                if result.returncode != 0:
+                    stage.mark_failed()
             
             if result.returncode == 0:
-                import json
                 info = json.loads(result.stdout)
                 return {
                     'title': info.get('title', 'Unknown'),
@@ -0,0 +1,202 @@
+"""
+Streaming search -> download pipeline
+Songs flow through three stages connected by bounded queues:
+
+    song source (e.g. Spotify playlist pages) -> YouTube search -> download
+
+Each stage runs on its own thread, so a download starts as soon as its search
+returns and the next Spotify page is fetched while earlier songs are being
+searched and downloaded. The queues are bounded, so memory stays flat no matter
+how many songs the source yields.
+"""
+
+import queue
+import threading
+import time
+
+import disk_space
+import tracing
+
+try:
+    from config import PIPELINE_QUEUE_SIZE, PLAYLIST_PREFETCH_SONGS
+except ImportError:
+    PIPELINE_QUEUE_SIZE = 8
+    PLAYLIST_PREFETCH_SONGS = 200
+
+_DONE = object()
+
+
+class _Failure:
+    """Carries an exception from a stage thread to the consumer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(buffer, item, stop):
+    # Blocking put that gives up once the consumer has gone away
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(buffer, stop):
+    """Yield items from a stage queue until its producer is done; re-raise its errors"""
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def prefetch(iterable, max_items=PLAYLIST_PREFETCH_SONGS, name="prefetch"):
+    """
+    Iterate over iterable on a background thread, staying at most max_items
+    ahead of the consumer. Errors raised by the iterable are re-raised here.
+    """
+    buffer = queue.Queue(maxsize=max(1, max_items))
+    stop = threading.Event()
+
+    def fill():
+        try:
+            for item in iterable:
+                if not _put(buffer, item, stop):
+                    return
+            _put(buffer, _DONE, stop)
+        except Exception as e:
+            _put(buffer, _Failure(e), stop)
+
+    threading.Thread(target=fill, name=name, daemon=True).start()
+    return _drain(buffer, stop)
+
+
+def song_entry(song_data, default_artist=None):
+    """
+    Normalize a song from a search_dict song list.
+
+    Returns:
+        tuple: (artist, song_name, spotify_metadata)
+    """
+    if isinstance(song_data, str):
+        return default_artist, song_data, {}
+    spotify_metadata = {
+        'album': song_data.get('album'),
+        'release_date': song_data.get('release_date'),
+        'spotify_id': song_data.get('spotify_id'),
+        'album_id': song_data.get('album_id'),
+        'album_image': song_data.get('album_image'),
+        'duration_ms': song_data.get('duration_ms')
+    }
+    return song_data.get('artist') or default_artist, song_data.get('name', song_data), spotify_metadata
+
+
+def run(songs, searcher, downloader, default_artist=None, album_name=None, total=None, on_result=None,
+        queue_size=PIPELINE_QUEUE_SIZE, prefetch_songs=PLAYLIST_PREFETCH_SONGS, delay_seconds=None):
+    """
+    Search YouTube for each song and download it as soon as its search returns.
+
+    Args:
+        songs (iterable): Song dicts or names; may be a lazy generator of any length
+        searcher (CallYoutube): Used from the search thread only
+        downloader (MP3Downloader): Downloads run on the calling thread; its (thread-safe)
+            library index is checked from the search thread before spending search quota
+        default_artist (str, optional): Artist for songs that don't carry their own
+        album_name (str, optional): Album for songs without Spotify album metadata
+        total (int, optional): Number of songs, for progress messages
+        on_result (callable, optional): Called in song order with
+            (urls, artist, song_name, spotify_metadata, file_path) once each song is done;
+            songs already in the library have no urls and the existing file_path
+        queue_size (int): Searched songs allowed to wait for a download
+        prefetch_songs (int): Songs the source may be read ahead of the searches
+        delay_seconds (float, optional): Minimum gap between download starts
+            (default: DOWNLOAD_DELAY_SECONDS)
+
+    Returns:
+        dict: {"songs", "existing", "found", "downloaded", "retries", "fallbacks", "disk_saved_bytes"}
+            counts, where fallbacks are downloads that moved on to another YouTube candidate and
+            disk_saved_bytes is what auto quality saved
+
+    Raises:
+        disk_space.BatchTooLarge: When songs is a list the volumes cannot hold (checked
+            before anything is searched or downloaded; lazy sources are not read ahead for it)
+    """
+    if isinstance(songs, (list, tuple)):
+        downloader.check_batch_space(
+            [disk_space.duration_of(song_entry(song_data, default_artist)[2]) for song_data in songs])
+    if delay_seconds is None:
+        from mp3_downloader import DOWNLOAD_DELAY_SECONDS
+        delay_seconds = DOWNLOAD_DELAY_SECONDS
+    of_total = f"/{total}" if total else ""
+    searched = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    source = prefetch(songs, prefetch_songs, name="song-source") if prefetch_songs else iter(songs)
+
+    def search_stage():
+        try:
+            for i, song_data in enumerate(source, 1):
+                if stop.is_set():
+                    return
+                artist, song_name, spotify_metadata = song_entry(song_data, default_artist)
+                existing = downloader.find_existing(artist, song_name)
+                if existing:
+                    print(f"\n📚 Already in library {i}{of_total}: {artist} - {song_name}")
+                    if not _put(searched, (i, [], artist, song_name, spotify_metadata, existing), stop):
+                        return
+                    continue
+                print(f"\n🔍 Searching {i}{of_total}: {artist} - {song_name}")
+                try:
+                    with tracing.track_context(f"{artist} - {song_name}", "track_search"):
+                        urls, _, _ = searcher.search_youtube(artist, song_name)
+                except Exception as e:
+                    # One failed search should not stop a long playlist
+                    print(f"❌ Search failed for {song_name}: {e}")
+                    urls = []
+                if not _put(searched, (i, urls, artist, song_name, spotify_metadata, None), stop):
+                    return
+            _put(searched, _DONE, stop)
+        except Exception as e:
+            _put(searched, _Failure(e), stop)
+        finally:
+            if hasattr(source, "close"):
+                source.close()
+
+    threading.Thread(target=search_stage, name="youtube-search", daemon=True).start()
+
+    counts = {"songs": 0, "existing": 0, "found": 0, "downloaded": 0, "retries": 0, "fallbacks": 0,
+              "disk_saved_bytes": 0}
+    last_download = None
+    for i, urls, artist, song_name, spotify_metadata, file_path in _drain(searched, stop):
+        counts["songs"] += 1
+        if file_path:
+            counts["existing"] += 1
+        elif urls:
+            counts["found"] += 1
+            # Keep downloads spaced out; time spent waiting on searches counts towards the gap
+            if last_download is not None and delay_seconds:
+                remaining = delay_seconds - (time.monotonic() - last_download)
+                if remaining > 0:
+                    time.sleep(remaining)
+            last_download = time.monotonic()
+            print(f"\n📥 Downloading {i}{of_total}: {artist} - {song_name}")
+            song_album = spotify_metadata.get('album') or album_name
+            with tracing.track_context(f"{artist} - {song_name}", "track_download"):
+                file_path = downloader.download_with_fallback(urls, artist, song_name, song_album,
+                                                              spotify_metadata, stats=counts)
+            if file_path:
+                counts["downloaded"] += 1
+        else:
+            print(f"❌ No video found for {song_name}")
+        if on_result:
+            on_result((urls, artist, song_name, spotify_metadata, file_path))
+    # Album ReplayGain once every track of the batch is measured
+    downloader.write_album_gain()
+    return counts
@@ -0,0 +1,140 @@
+"""
+Menu prefetching
+The interactive menu waits on the user most of the time (reading the artist
+list, choosing album or song, reading the album list) and then blocks on
+Spotify for the next menu. Spotify lookups the user is likely to need next are
+started in the background while a menu is shown, and the menu takes their
+results from here when they are ready (or waits for the lookup already in
+flight, instead of repeating it).
+
+Results are kept by key in a least recently used cache of PREFETCH_MAX_ENTRIES
+lookups, so memory stays bounded however long the user browses. Lookups that
+have not started yet are dropped when the user moves on (cancel), or when the
+cache evicts them.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+import metrics
+
+try:
+    from config import PREFETCH, PREFETCH_ARTISTS, PREFETCH_WORKERS, PREFETCH_MAX_ENTRIES
+except ImportError:
+    PREFETCH = True
+    PREFETCH_ARTISTS = 3
+    PREFETCH_WORKERS = 4
+    PREFETCH_MAX_ENTRIES = 256
+
+# Environment variable takes precedence (e.g. to switch prefetching off for a session)
+PREFETCH = os.getenv("PREFETCH", str(PREFETCH)).lower() not in ("0", "false", "no", "off")
+
+
+class Prefetcher:
+    """Background lookups by key, with a bounded cache of their results"""
+
+    def __init__(self, workers=PREFETCH_WORKERS, max_entries=PREFETCH_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by cancel, so follow-up lookups of cancelled work are not started
+        self._generation = 0
+        self._closed = False
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Start fn(*args, **kwargs) in the background unless key is cached or in flight
+
+        Returns:
+            Future: The lookup's future (None once closed)
+        """
+        with self._lock:
+            if self._closed:
+                return None
+            future = self._entries.get(key)
+            if _usable(future):
+                self._entries.move_to_end(key)
+                return future
+            future = self._pool.submit(fn, *args, **kwargs)
+            self._store(key, future)
+        metrics.PREFETCHES.inc(result="started")
+        return future
+
+    def get(self, key, fn, *args, **kwargs):
+        """
+        Result of the lookup under key: the prefetched one, waiting for it if it is
+        still running, or fn(*args, **kwargs) called here when it was never started,
+        was cancelled or failed (so errors surface in the menu as before)
+        """
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                self._entries.move_to_end(key)
+        if _usable(future):
+            ready = future.done()
+            try:
+                result = future.result()
+                metrics.PREFETCHES.inc(result="hit" if ready else "waited")
+                return result
+            except (CancelledError, Exception):
+                # Cancelled while waited for, or failed: looked up again here
+                pass
+        metrics.PREFETCHES.inc(result="miss")
+        result = fn(*args, **kwargs)
+        done = Future()
+        done.set_result(result)
+        with self._lock:
+            if not self._closed:
+                self._store(key, done)
+        return result
+
+    def then(self, future, fn):
+        """
+        Call fn(result) once future succeeds (typically to submit follow-up lookups),
+        unless cancel was called in the meantime
+        """
+        if future is None:
+            return
+        generation = self._generation
+
+        def callback(done):
+            if done.cancelled() or done.exception() is not None or generation != self._generation:
+                return
+            fn(done.result())
+
+        future.add_done_callback(callback)
+
+    def cancel(self):
+        """Drop the lookups that have not started yet; finished results stay cached"""
+        with self._lock:
+            self._generation += 1
+            for key, future in list(self._entries.items()):
+                if future.cancel():
+                    del self._entries[key]
+                    metrics.PREFETCHES.inc(result="cancelled")
+
+    def close(self):
+        """Cancel pending lookups and stop the workers (running lookups finish in the background)"""
+        self.cancel()
+        with self._lock:
+            self._closed = True
+            self._entries.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _store(self, key, future):
+        """Cache future under key, evicting (and cancelling, if not started) the least recently used"""
+        self._entries[key] = future
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            evicted.cancel()
+
+
+def _usable(future):
+    """Whether a cached future has (or will have) a result: not cancelled or failed"""
+    if future is None or future.cancelled():
+        return False
+    return not future.done() or future.exception() is None
@@ -0,0 +1,114 @@
+"""
+Staging area for downloads in progress
+yt-dlp's intermediate files (.part, .webm, .temp.mp3) and the MP3 being tagged
+live in a private folder per download under STAGING_DIR. Only the finished,
+tagged file is moved into the library, atomically, so the library never holds
+partial files and a crash leaves debris only in staging. Put STAGING_DIR on a
+tmpfs to keep scratch I/O off a slow library volume.
+"""
+
+import errno
+import os
+import shutil
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    from config import STAGING_DIR, STAGING_MAX_AGE_HOURS
+except ImportError:
+    STAGING_DIR = None
+    STAGING_MAX_AGE_HOURS = 24
+
+# Environment variable takes precedence (e.g. a tmpfs mount in the container)
+STAGING_DIR = os.getenv("STAGING_DIR") or STAGING_DIR
+
+_HOST = socket.gethostname()
+
+
+def staging_root(download_folder):
+    """STAGING_DIR, or a folder inside the library (same filesystem, so moves are renames)"""
+    root = os.path.expanduser(STAGING_DIR) if STAGING_DIR else os.path.join(download_folder, ".mp3_downloader", "staging")
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+@contextmanager
+def staging_dir(root):
+    """A private folder for one download, removed with whatever is left in it afterwards"""
+    # Host and PID in the name let cleanup_stale tell abandoned folders from ones in use
+    folder = os.path.join(root, f"{_HOST}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(folder)
+    try:
+        yield folder
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def move_into_place(staged_path, final_path):
+    """
+    Move a finished file to its final path atomically: readers see either the
+    previous file or the complete new one, never a partial write
+    """
+    try:
+        os.replace(staged_path, final_path)
+        return final_path
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Staging is on another filesystem (e.g. tmpfs): copy next to the target, then rename
+    folder, name = os.path.split(final_path)
+    temporary = os.path.join(folder, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(staged_path, "rb") as src, open(temporary, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(temporary, final_path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    os.remove(staged_path)
+    return final_path
+
+
+def _pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def cleanup_stale(root, max_age_hours=None):
+    """
+    Remove staging folders left behind by downloads that crashed or were killed:
+    folders of this host whose process is gone, and folders of any host older
+    than max_age_hours (other hosts' processes cannot be checked).
+
+    Returns:
+        int: Number of folders removed
+    """
+    max_age = (STAGING_MAX_AGE_HOURS if max_age_hours is None else max_age_hours) * 3600
+    removed = 0
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        host, _, rest = entry.name.rpartition("-")[0].rpartition("-")
+        pid = int(rest) if rest.isdigit() else None
+        try:
+            age = time.time() - entry.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        abandoned = host == _HOST and pid is not None and pid != os.getpid() and not _pid_running(pid)
+        if abandoned or age > max_age:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
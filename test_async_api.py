@@ -0,0 +1,183 @@
+import asyncio
+import email.utils
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import mp3_downloader
+import transcode
+from async_api import AsyncDownloader, AsyncSpotify, AsyncYouTube, retry_after
+from audio_store import open_store
+from CallYoutube import YOUTUBE_CANDIDATES, CallYoutube
+from conftest import STANDIN
+from mp3_downloader import StallClock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+from stub_server import StubCatalog, start_stub_server, stub_environment  # noqa: E402
+
+VIDEO = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def test_retry_after_in_seconds():
+    assert retry_after("7", 2) == 7
+    assert retry_after(None, 2) == 2
+
+
+def test_retry_after_as_http_date():
+    in_ten_seconds = email.utils.formatdate(time.time() + 10, usegmt=True)
+    assert 8 <= retry_after(in_ten_seconds, 2) <= 10
+    # A date already past means retry now
+    assert retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 2) == 0
+
+
+def test_unparseable_retry_after_falls_back_to_the_backoff():
+    assert retry_after("soon", 4) == 4
+
+
+def test_stall_clock_takes_folder_scans_from_the_caller(monkeypatch, tmp_path):
+    stall = StallClock(str(tmp_path), initial_size=0)
+    assert not stall.scan_due()
+    # A second without progress or a scan: the caller scans (off the event loop)
+    stall.last_progress = stall.last_scan = time.monotonic() - 2
+    assert stall.scan_due()
+    stall.observe(1024)
+    assert not stall.scan_due()
+    assert time.monotonic() - stall.last_progress < 1
+
+    # check() does not scan again right after the caller did
+    monkeypatch.setattr(mp3_downloader, "folder_size", lambda folder: 1 / 0)
+    stall.check()
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    """The benchmark stub of the Spotify and YouTube APIs, with 120 tracks"""
+    catalog = StubCatalog(120)
+    server, base_url = start_stub_server(catalog)
+    for name, value in stub_environment(base_url).items():
+        monkeypatch.setenv(name, value)
+    yield catalog
+    server.shutdown()
+    server.server_close()
+
+
+def record_processes(monkeypatch):
+    """Processes started from here on (asyncio subprocesses too), for checking they were killed"""
+    processes = []
+
+    class RecordingPopen(subprocess.Popen):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            processes.append(self)
+
+    monkeypatch.setattr(subprocess, "Popen", RecordingPopen)
+    return processes
+
+
+async def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.05)
+
+
+def test_search_returns_the_first_videos_as_candidates(stub_api):
+    async def search():
+        async with AsyncYouTube() as youtube:
+            return await youtube.search("Bench Artist", "Bench Song")
+
+    urls, artist, song = asyncio.run(search())
+    assert (artist, song) == ("Bench Artist", "Bench Song")
+    items = stub_api.youtube({"q": ["Bench Artist - Bench Song"]})[1]["items"]
+    video_ids = [item["id"]["videoId"] for item in items if item["id"]["kind"] == "youtube#video"]
+    assert urls == [CallYoutube.YOUTUBE_URL_PREFIX + video_id for video_id in video_ids[:YOUTUBE_CANDIDATES]]
+
+
+def test_catalog_iterators_page_through_playlists_and_albums(stub_api):
+    async def collect():
+        async with AsyncSpotify() as spotify:
+            # Two pages of 100 and 20
+            playlist = [song async for song in spotify.iter_playlist_songs(stub_api.playlist_id)]
+            album = [song async for song in spotify.iter_collection_songs("album", stub_api.albums[0]["id"])]
+            info = await spotify.get_collection_info("playlist", stub_api.playlist_id)
+            return playlist, album, info
+
+    playlist, album, info = asyncio.run(collect())
+    assert [song["name"] for song in playlist] == [f"Bench Song {i}" for i in range(1, 121)]
+    assert [song["name"] for song in album] == [f"Bench Song {i}" for i in range(1, 11)]
+    assert {song["album"] for song in album} == {"Bench Album 1"}
+    assert info == {"kind": "playlist", "id": stub_api.playlist_id, "name": "Bench Playlist", "total": 120}
+
+
+def test_downloads_fall_back_to_the_next_candidate(downloader, monkeypatch):
+    monkeypatch.setenv("STANDIN_FAIL_VIDEOS", "unavailable")
+    stats = {}
+    items = [(["https://www.youtube.com/watch?v=unavailable", VIDEO], "Artist", f"Song {i}", "Album",
+              {"duration_ms": 180000, "album_id": "album-1"}) for i in range(3)]
+
+    async def download():
+        paths = await AsyncDownloader(downloader).download_many(items)
+        # download_many keeps its own stats; a single download counts into the caller's
+        paths.append(await AsyncDownloader(downloader).download(*items[0][:4], stats=stats))
+        return paths
+
+    paths = asyncio.run(download())
+    assert len(paths) == 4 and all(os.path.exists(path) for path in paths)
+    assert sorted(os.path.basename(path) for path in paths[:3]) == [f"Artist - Song {i}.mp3" for i in range(3)]
+    assert stats["fallbacks"] == 1
+    assert os.listdir(downloader.staging_root) == []
+
+
+def cancel_mid_download(downloader, monkeypatch):
+    """Start a long download, cancel it once yt-dlp runs; returns (seconds taken, processes started)"""
+    monkeypatch.setenv("STANDIN_DOWNLOAD_SECONDS", "30")
+    processes = record_processes(monkeypatch)
+
+    async def run():
+        task = asyncio.ensure_future(AsyncDownloader(downloader).download(VIDEO, "Artist", "Song"))
+        await wait_for(lambda: processes)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    started = time.monotonic()
+    asyncio.run(run())
+    return time.monotonic() - started, processes
+
+
+def test_cancelling_a_download_kills_yt_dlp(downloader, monkeypatch):
+    seconds, processes = cancel_mid_download(downloader, monkeypatch)
+    assert seconds < 10
+    assert processes and all(process.poll() is not None for process in processes)
+    assert os.listdir(downloader.staging_root) == []
+
+
+def test_cancelling_a_download_through_the_audio_store_kills_yt_dlp(downloader, monkeypatch, tmp_path):
+    downloader.store = open_store(str(tmp_path / "store"))
+    seconds, processes = cancel_mid_download(downloader, monkeypatch)
+    # The worker thread notices within a second
+    assert seconds < 10
+    assert processes and all(process.poll() is not None for process in processes)
+    assert os.listdir(downloader.staging_root) == []
+    assert not downloader.store.has(downloader.store.key("dQw4w9WgXcQ", "mp3", downloader.quality))
+
+
+def test_encoded_downloads_run_the_same_steps_on_the_loop(downloader, monkeypatch):
+    # Two connections: extraction, then the source (too small to chunk) by yt-dlp, then our own ffmpeg encode
+    ffmpeg = os.path.join(os.path.dirname(STANDIN), "ffmpeg_standin.py")
+    monkeypatch.setattr(transcode, "FFMPEG_COMMAND", f'"{sys.executable}" "{ffmpeg}"')
+    processes = record_processes(monkeypatch)
+
+    # Tagged from Spotify metadata, so there is no yt-dlp lookup for YouTube tags
+    path = asyncio.run(AsyncDownloader(downloader).download(VIDEO, "Artist", "Song", "Album", {"duration_ms": 180000},
+                                                            connections=2))
+    assert path == os.path.join(downloader.base_download_folder, "Artist", "Artist - Song.mp3")
+    assert os.path.getsize(path) > 0
+    commands = [" ".join(process.args) for process in processes]
+    assert len(commands) == 3
+    assert "--dump-json" in commands[0]
+    assert "--load-info-json" in commands[1]
+    assert ffmpeg in commands[2]
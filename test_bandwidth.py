@@ -0,0 +1,116 @@
+import os
+import threading
+from contextlib import ExitStack
+
+from bandwidth import MIN_RATE, BandwidthBudget, parse_rate
+
+
+def test_single_download_gets_the_whole_budget():
+    budget = BandwidthBudget("4M", slots=4)
+    with budget.download() as rate:
+        assert rate == 4 * 1024 ** 2
+
+
+def test_budget_is_split_between_downloads_in_flight():
+    budget = BandwidthBudget("4M", slots=2)
+    with budget.download():
+        with budget.download() as second:
+            assert second == 2 * 1024 ** 2
+            assert budget.share() == 2 * 1024 ** 2
+        # The peer finished: the survivor's share goes back up
+        assert budget.share() == 4 * 1024 ** 2
+
+
+def test_budget_change_applies_to_the_current_share():
+    budget = BandwidthBudget("4M")
+    with budget.download():
+        budget.set_limit("1M")
+        assert budget.share() == 1024 ** 2
+        budget.set_limit(None)
+        assert budget.share() is None
+
+
+def test_share_never_drops_below_the_minimum_rate():
+    budget = BandwidthBudget(2048)
+    with budget.download(), budget.download(), budget.download():
+        assert budget.share() == MIN_RATE
+
+
+def test_parse_rate():
+    assert parse_rate("500K") == 500 * 1024
+    assert parse_rate("2.5M") == int(2.5 * 1024 ** 2)
+    assert parse_rate("none") is None
+    assert parse_rate(0) is None
+
+
+def in_flight_total(budget, reservations, chunked):
+    """Sum of the rates the downloads in flight may use now"""
+    share = budget.share() if chunked else 0
+    return sum(reservation.rate for reservation in reservations) + chunked * share
+
+
+def test_overlapping_downloads_stay_within_the_budget():
+    limit = 4 * 1024 ** 2
+    budget = BandwidthBudget(limit, slots=4)
+    with ExitStack() as downloads:
+        reservations = []
+        chunked = 0
+        # yt-dlp downloads and a chunked transfer starting one after another
+        for fixed in (True, False, True, True):
+            if fixed:
+                reservations.append(downloads.enter_context(budget.fixed_download()))
+            else:
+                downloads.enter_context(budget.download())
+                chunked += 1
+            assert in_flight_total(budget, reservations, chunked) <= limit
+        # A yt-dlp download started alone keeps only its slot's share
+        assert reservations[0].rate == limit // 4
+
+    with budget.fixed_download() as first:
+        with budget.download():
+            assert in_flight_total(budget, [first], 1) == limit
+            with budget.fixed_download() as second:
+                assert in_flight_total(budget, [first, second], 1) <= limit
+            # The chunked transfer takes up what the finished download left
+            assert in_flight_total(budget, [first], 1) == limit
+
+
+def test_more_downloads_than_slots_share_what_is_left():
+    limit = 4 * 1024 ** 2
+    budget = BandwidthBudget(limit, slots=2)
+    with budget.fixed_download() as first, budget.fixed_download() as second, budget.fixed_download() as third:
+        assert first.rate + second.rate == limit
+        # Nothing is left: the extra download runs at the minimum rate yt-dlp accepts
+        assert third.rate == MIN_RATE
+
+
+def test_budget_change_re_rates_fixed_downloads():
+    budget = BandwidthBudget("4M", slots=2)
+    with budget.fixed_download() as first, budget.fixed_download() as second:
+        assert first.rate == second.rate == 2 * 1024 ** 2
+        budget.set_limit("1M")
+        assert first.rate == second.rate == 512 * 1024
+        budget.set_limit(None)
+        assert first.rate is None and second.rate is None
+
+
+def test_ytdlp_is_restarted_at_its_new_rate_when_the_budget_changes(downloader, monkeypatch):
+    # A 180 s stand-in track at 128 kbps is ~2.7 MiB: about 3 s at the first rate
+    downloader.bandwidth.set_limit("1M")
+    rates = []
+    monitor = downloader._monitor
+
+    def recording_monitor(cmd, *args, **kwargs):
+        if "--limit-rate" in cmd:
+            rates.append(int(cmd[cmd.index("--limit-rate") + 1]))
+        return monitor(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(downloader, "_monitor", recording_monitor)
+    timer = threading.Timer(0.5, downloader.bandwidth.set_limit, args=("64M",))
+    timer.start()
+    try:
+        path = downloader.download_mp3("https://www.youtube.com/watch?v=dQw4w9WgXcQ", "Artist", "Song")
+    finally:
+        timer.cancel()
+    assert path and os.path.exists(path)
+    assert rates == [1024 ** 2, 64 * 1024 ** 2]
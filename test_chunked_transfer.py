@@ -0,0 +1,145 @@
+import http.client
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import chunked_transfer
+from chunked_transfer import TransferError, fetch, plan_chunks
+
+DATA = os.urandom(300 * 1024)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves DATA with byte ranges. Requests for ranges ending at a byte in the
+    server's drop_at are cut short after the next length in its drops list, and
+    a server set to garbled answers with something that is not HTTP
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("Range"))
+        if self.server.garbled:
+            self.wfile.write(b"NOT HTTP\r\n\r\n")
+            return
+        header = self.headers.get("Range")
+        if header and self.server.ranges:
+            start, end = header.split("=")[1].split("-")
+            start, end = int(start), int(end) if end else len(DATA) - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        else:
+            start, end = 0, len(DATA) - 1
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        body = DATA[start:end + 1]
+        with self.server.lock:
+            drop = self.server.drops.pop(0) if self.server.drops and end in self.server.drop_at else None
+        # A dropped connection sends only part of the body it announced
+        self.wfile.write(body[:drop] if drop is not None else body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.requests = []
+    httpd.ranges = True
+    httpd.drops = []
+    httpd.drop_at = set()
+    httpd.garbled = False
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/source.webm"
+
+
+def test_plan_chunks_covers_the_file_in_order():
+    assert plan_chunks(10, 4) == [(0, 3), (4, 7), (8, 9)]
+    assert plan_chunks(8, 4) == [(0, 3), (4, 7)]
+    assert plan_chunks(3, 4) == [(0, 2)]
+    assert plan_chunks(0, 4) == []
+
+
+def test_ranges_are_fetched_over_several_connections(server, tmp_path):
+    path = tmp_path / "source.webm"
+    assert fetch(url(server), str(path), connections=4, chunk_size=64 * 1024) == len(DATA)
+    assert path.read_bytes() == DATA
+    # The probe, then one request per range
+    assert len(server.requests) == 1 + len(plan_chunks(len(DATA), 64 * 1024))
+
+
+def test_dropped_range_resumes_where_it_stopped(server, tmp_path):
+    chunk_size = 64 * 1024
+    server.drop_at = {2 * chunk_size - 1}
+    server.drops = [1000]
+    path = tmp_path / "source.webm"
+
+    assert fetch(url(server), str(path), connections=3, chunk_size=chunk_size, retries=1) == len(DATA)
+    assert path.read_bytes() == DATA
+    # The second range is asked for again from the first byte it did not get
+    assert f"bytes={chunk_size + 1000}-{2 * chunk_size - 1}" in server.requests
+
+
+def test_range_failing_after_its_retries_raises(server, tmp_path):
+    chunk_size = 64 * 1024
+    server.drop_at = {chunk_size - 1}
+    server.drops = [10, 10]
+
+    with pytest.raises(TransferError):
+        fetch(url(server), str(tmp_path / "source.webm"), connections=2, chunk_size=chunk_size, retries=1)
+
+
+def test_server_without_ranges_falls_back_to_one_stream(server, tmp_path):
+    server.ranges = False
+    path = tmp_path / "source.webm"
+    assert fetch(url(server), str(path), connections=4, chunk_size=64 * 1024) == len(DATA)
+    assert path.read_bytes() == DATA
+    assert server.requests == ["bytes=0-0", None]
+
+
+def test_rate_limit_is_read_again_for_every_range(server, tmp_path):
+    rates = []
+
+    def share():
+        rates.append(len(rates))
+        return None
+
+    fetch(url(server), str(tmp_path / "source.webm"), connections=2, chunk_size=64 * 1024, rate_limit=share)
+    assert len(rates) == len(plan_chunks(len(DATA), 64 * 1024))
+
+
+def test_ranges_are_written_without_pwrite(server, tmp_path, monkeypatch):
+    # As on Windows, where os.pwrite does not exist
+    monkeypatch.delattr(os, "pwrite", raising=False)
+    path = tmp_path / "source.webm"
+    assert fetch(url(server), str(path), connections=4, chunk_size=64 * 1024) == len(DATA)
+    assert path.read_bytes() == DATA
+
+
+def test_malformed_response_raises_a_transfer_error(server, tmp_path):
+    server.garbled = True
+    with pytest.raises(TransferError):
+        fetch(url(server), str(tmp_path / "source.webm"), connections=2, chunk_size=64 * 1024)
+
+
+@pytest.mark.parametrize("error", [ValueError("bad Content-Range"), http.client.IncompleteRead(b"")])
+def test_failed_transfer_falls_back_to_ytdlp(downloader, tmp_path, monkeypatch, error):
+    def failing_fetch(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(chunked_transfer, "fetch", failing_fetch)
+    source_folder = tmp_path / "source"
+    info = {"url": "http://127.0.0.1:9/source.webm", "title": "Song", "ext": "webm", "protocol": "http"}
+    assert downloader.chunked_download(info, str(source_folder), "Artist - Song", 4) is None
+    assert not source_folder.exists()
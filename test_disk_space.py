@@ -0,0 +1,111 @@
+from collections import namedtuple
+
+import pytest
+
+import disk_space
+import pipeline
+from disk_space import MB, DiskSpaceGate
+
+Usage = namedtuple("Usage", "total used free")
+
+
+def gate_with_free(monkeypatch, tmp_path, free_mb, reserve_mb=100):
+    """A gate over one empty volume of free_mb (staging and library in tmp_path)"""
+    monkeypatch.setattr(disk_space.shutil, "disk_usage",
+                        lambda path: Usage(int(free_mb * MB), 0, int(free_mb * MB)))
+    staging = tmp_path / "staging"
+    library = tmp_path / "library"
+    staging.mkdir()
+    library.mkdir()
+    return DiskSpaceGate(str(staging), [str(library)], reserve_mb=reserve_mb, poll_seconds=0.01)
+
+
+def test_reserve_counts_against_later_downloads(monkeypatch, tmp_path):
+    gate = gate_with_free(monkeypatch, tmp_path, free_mb=200)
+    needs = gate.needs(60 * MB, 10 * MB)
+
+    assert gate.try_reserve(needs) is None
+    # 100 MB above the reserve, 60 MB of it held by the first download
+    short = gate.try_reserve(needs)
+    assert short is not None
+    path, needed, available = short
+    assert needed == 60 * MB
+    assert available == 40 * MB
+
+
+def test_release_makes_space_available_again(monkeypatch, tmp_path):
+    gate = gate_with_free(monkeypatch, tmp_path, free_mb=200)
+    needs = gate.needs(60 * MB, 10 * MB)
+
+    assert gate.try_reserve(needs) is None
+    assert gate.try_reserve(needs) is not None
+    gate.release(needs)
+    assert gate.try_reserve(needs) is None
+
+
+def test_finished_file_on_staging_volume_is_not_counted_twice(monkeypatch, tmp_path):
+    gate = gate_with_free(monkeypatch, tmp_path, free_mb=200)
+    # Staging and library share a volume: the finished file is renamed, not copied
+    (device, (_, needed)), = gate.needs(60 * MB, 10 * MB).items()
+    assert needed == 60 * MB
+
+
+def test_shortfall_reports_the_reserve(monkeypatch, tmp_path):
+    gate = gate_with_free(monkeypatch, tmp_path, free_mb=50, reserve_mb=100)
+    path, needed, available = gate.shortfall(gate.needs(1 * MB, 1 * MB))
+    assert needed == 1 * MB
+    assert available == 0
+
+
+def test_check_batch_counts_tracks_that_fit(monkeypatch, tmp_path):
+    gate = gate_with_free(monkeypatch, tmp_path, free_mb=120, reserve_mb=100)
+    staging_bytes, output_bytes = disk_space.estimate_track(300, gate.quality)
+    batch = gate.check_batch([300] * 10)
+
+    # Each track needs its staging space on top of the finished files of the tracks before it
+    expected = 0
+    while expected < 10 and staging_bytes + expected * output_bytes <= 20 * MB:
+        expected += 1
+    assert 0 < expected < 10
+    assert batch["tracks"] == 10
+    assert batch["needed_bytes"] == 10 * output_bytes
+    assert batch["fits_now"] == expected
+    assert batch["shortfall"] is not None
+
+
+def test_batch_larger_than_the_volume_is_flagged(monkeypatch, tmp_path):
+    gate = gate_with_free(monkeypatch, tmp_path, free_mb=120, reserve_mb=100)
+    batch = gate.check_batch([300] * 10)
+    # The volume is 120 MB in all (free_mb is also its size): freeing space cannot help
+    path, needed, capacity = batch["exceeds_volume"]
+    assert needed > capacity == 20 * MB
+    assert gate.check_batch([300])["exceeds_volume"] is None
+
+
+def test_pipeline_rejects_a_batch_the_volume_cannot_hold_up_front(monkeypatch, downloader):
+    monkeypatch.setattr(disk_space.shutil, "disk_usage", lambda path: Usage(600 * MB, 580 * MB, 20 * MB))
+    searches = []
+
+    class Searcher:
+        def search_youtube(self, artist, song):
+            searches.append(song)
+            return [], artist, song
+
+    songs = [{"name": f"Song {i}", "duration_ms": 300000} for i in range(100)]
+    with pytest.raises(disk_space.BatchTooLarge):
+        pipeline.run(songs, Searcher(), downloader, default_artist="Artist", prefetch_songs=0, delay_seconds=0)
+    assert searches == []
+
+
+def test_pipeline_admits_a_batch_that_fits_once_space_is_freed(monkeypatch, downloader):
+    monkeypatch.setattr(disk_space.shutil, "disk_usage", lambda path: Usage(10_000 * MB, 9_500 * MB, 500 * MB))
+    searches = []
+
+    class Searcher:
+        def search_youtube(self, artist, song):
+            searches.append(song)
+            return [], artist, song
+
+    songs = [{"name": f"Song {i}", "duration_ms": 300000} for i in range(100)]
+    counts = pipeline.run(songs, Searcher(), downloader, default_artist="Artist", prefetch_songs=0, delay_seconds=0)
+    assert counts["songs"] == len(searches) == 100
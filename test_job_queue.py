@@ -0,0 +1,143 @@
+import threading
+
+from job_queue import JobQueue
+
+
+def resolved_job(queue, kind, songs, submitter, duration_ms=200000, priority=None):
+    """Submit a job and expand it into len(songs) tracks, as the resolver would"""
+    job_id = queue.submit(kind, {}, priority=priority, submitter=submitter)
+    job = queue.claim_job("resolver")
+    assert job["id"] == job_id
+    queue.add_tracks(job_id, [{"song": song, "metadata": {"duration_ms": duration_ms}} for song in songs], "resolver")
+    return job_id
+
+
+def claim_and_finish(queue, owner="worker"):
+    track = queue.claim_track(owner)
+    assert queue.finish_track(track["id"], owner, file_path="/music/done.mp3")
+    return track["song"]
+
+
+def test_interactive_tracks_go_before_queued_bulk_work(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    resolved_job(queue, "artist", [f"bulk {i}" for i in range(50)], "alice")
+    assert claim_and_finish(queue) == "bulk 0"
+
+    resolved_job(queue, "track", ["single"], "bob")
+    resolved_job(queue, "album", ["album 1", "album 2"], "carol")
+    assert [claim_and_finish(queue) for _ in range(4)] == ["single", "album 1", "album 2", "bulk 1"]
+
+
+def test_submitters_of_a_class_take_turns(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    resolved_job(queue, "artist", [f"alice {i}" for i in range(20)], "alice")
+    resolved_job(queue, "artist", [f"bob {i}" for i in range(20)], "bob")
+
+    order = [claim_and_finish(queue) for _ in range(6)]
+    assert [song.split()[0] for song in order] == ["alice", "bob"] * 3
+
+
+def test_submitter_with_fewer_tracks_running_goes_first(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    resolved_job(queue, "artist", [f"alice {i}" for i in range(5)], "alice")
+    resolved_job(queue, "artist", [f"bob {i}" for i in range(5)], "bob")
+
+    first = queue.claim_track("worker-1")
+    second = queue.claim_track("worker-2")
+    assert {first["submitter"], second["submitter"]} == {"alice", "bob"}
+    # bob's track finishes while alice's is still running: bob is served again
+    bobs = first if first["submitter"] == "bob" else second
+    queue.finish_track(bobs["id"], "worker-1" if bobs is first else "worker-2", file_path="/music/bob.mp3")
+    assert queue.claim_track("worker-3")["submitter"] == "bob"
+
+
+def test_shortest_job_first_within_a_submitter_and_class(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    resolved_job(queue, "album", ["long 1", "long 2"], "alice", duration_ms=600000)
+    resolved_job(queue, "album", ["short 1", "short 2"], "alice", duration_ms=120000)
+
+    assert [claim_and_finish(queue) for _ in range(4)] == ["short 1", "short 2", "long 1", "long 2"]
+
+
+def test_job_status_reports_class_and_submitter(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.submit("artist", {"artist": "Queen"}, submitter="alice")
+    status = queue.job_status(job_id)
+    assert status["priority"] == "bulk"
+    assert status["submitter"] == "alice"
+
+
+def test_competing_nodes_claim_each_track_exactly_once(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    queue = JobQueue(db_path)
+    job_id = resolved_job(queue, "artist", [f"song {i}" for i in range(60)], "alice")
+    # One connection per node, as separate processes sharing the file would have
+    nodes = [JobQueue(db_path) for _ in range(4)]
+    claimed = {index: [] for index in range(len(nodes))}
+    start = threading.Barrier(len(nodes))
+
+    def work(index):
+        start.wait()
+        while True:
+            track = nodes[index].claim_track(f"node-{index}")
+            if track is None:
+                return
+            claimed[index].append(track["id"])
+            assert nodes[index].finish_track(track["id"], f"node-{index}", file_path="/music/done.mp3")
+
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(len(nodes))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [track_id for tracks in claimed.values() for track_id in tracks]
+    assert len(ids) == 60
+    assert len(set(ids)) == 60
+    assert all(track["status"] == "done" for track in queue.job_tracks(job_id))
+
+
+def test_expired_track_lease_is_reclaimed_and_the_old_owner_is_locked_out(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = resolved_job(queue, "track", ["song"], "alice")
+
+    # The owner stopped heartbeating: its lease is already over
+    lost = queue.claim_track("node-1", lease_seconds=-1)
+    reclaimed = queue.claim_track("node-2")
+    assert reclaimed["id"] == lost["id"]
+    assert queue.claim_track("node-3") is None
+
+    assert not queue.heartbeat("tracks", lost["id"], "node-1")
+    assert not queue.finish_track(lost["id"], "node-1", file_path="/music/stale.mp3")
+    assert queue.finish_track(reclaimed["id"], "node-2", file_path="/music/done.mp3")
+    assert queue.job_tracks(job_id)[0]["file_path"] == "/music/done.mp3"
+
+
+def test_live_lease_is_not_reclaimed(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    resolved_job(queue, "track", ["song"], "alice")
+
+    track = queue.claim_track("node-1", lease_seconds=60)
+    assert queue.claim_track("node-2") is None
+    assert queue.heartbeat("tracks", track["id"], "node-1")
+
+
+def test_expired_job_lease_is_reclaimed(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.submit("album", {"album": "A Night at the Opera"}, submitter="alice")
+
+    assert queue.claim_job("resolver-1", lease_seconds=-1)["id"] == job_id
+    assert queue.claim_job("resolver-2")["id"] == job_id
+    assert not queue.add_tracks(job_id, [{"song": "stale"}], "resolver-1")
+    assert queue.add_tracks(job_id, [{"song": "Bohemian Rhapsody"}], "resolver-2")
+    assert [track["song"] for track in queue.job_tracks(job_id)] == ["Bohemian Rhapsody"]
+
+
+def test_recover_requeues_work_of_crashed_owners(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = resolved_job(queue, "track", ["song"], "alice")
+    queue.claim_track("node-1", lease_seconds=-1)
+
+    queue.recover()
+    assert queue.job_tracks(job_id)[0]["status"] == "queued"
+    assert queue.claim_track("node-2")["song"] == "song"
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+
+import job_service
+from job_queue import JobQueue
+from job_service import JobService
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def service_for(queue, downloader):
+    """A JobService around queue without warming up the Spotify/YouTube clients"""
+    service = JobService.__new__(JobService)
+    service.queue = queue
+    service.downloader = downloader
+    service._job_albums = {}
+    service._job_albums_lock = threading.Lock()
+    return service
+
+
+def url_track(queue, owner):
+    job_id = queue.submit("url", {"url": URL}, submitter="alice")
+    queue.claim_job("resolver")
+    queue.add_tracks(job_id, [{"artist": "Artist", "song": "Song", "url": URL, "metadata": {}}], "resolver")
+    return job_id, queue.claim_track(owner, job_service.JOB_LEASE_SECONDS)
+
+
+def test_track_is_recorded_when_its_lease_holds(tmp_path, downloader):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id, track = url_track(queue, "node-1")
+
+    service_for(queue, downloader).run_track(None, track, "node-1")
+    recorded, = queue.job_tracks(job_id)
+    assert recorded["status"] == "done"
+    assert os.path.exists(recorded["file_path"])
+
+
+def test_download_is_abandoned_when_the_lease_expires_mid_track(tmp_path, downloader, monkeypatch):
+    # Heartbeats every 0.2 s; the stand-in download alone would take 20 s
+    monkeypatch.setattr(job_service, "JOB_LEASE_SECONDS", 0.6)
+    monkeypatch.setenv("STANDIN_DOWNLOAD_SECONDS", "20")
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id, track = url_track(queue, "node-1")
+    other_node = JobQueue(queue.db_path)
+
+    def expire_and_reclaim():
+        # node-1 missed its heartbeats: its lease runs out and node-2 takes the track
+        other_node._conn.execute("UPDATE tracks SET lease_expires = 0 WHERE id = ?", (track["id"],))
+        assert other_node.claim_track("node-2")["id"] == track["id"]
+
+    timer = threading.Timer(0.5, expire_and_reclaim)
+    timer.start()
+    started = time.monotonic()
+    service_for(queue, downloader).run_track(None, track, "node-1")
+    timer.join()
+
+    assert time.monotonic() - started < 5
+    recorded, = queue.job_tracks(job_id)
+    assert recorded["status"] == "running"
+    assert recorded["lease_owner"] == "node-2"
+    # Nothing of node-1's download is left in the library or in staging
+    assert not [name for folder, _, names in os.walk(downloader.base_download_folder) for name in names
+                if name.endswith(".mp3")]
+    assert os.listdir(downloader.staging_root) == []
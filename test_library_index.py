@@ -0,0 +1,134 @@
+import os
+import shutil
+import sys
+
+import pytest
+from mutagen.id3 import ID3, TIT2, TPE1
+
+from library_index import LibraryIndex
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "standins"))
+from yt_dlp_standin import synthetic_mp3  # noqa: E402
+
+# Long enough for mutagen to find the audio after the ID3 tag
+AUDIO = synthetic_mp3(1)
+
+
+def write_mp3(path, artist=None, title=None):
+    """Write a one-second MP3, with ID3 artist/title when given"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(AUDIO)
+    if artist and title:
+        id3 = ID3()
+        id3.add(TPE1(encoding=3, text=artist))
+        id3.add(TIT2(encoding=3, text=title))
+        id3.save(path)
+
+
+def changed(*folders):
+    """
+    Move the folders' mtimes on: filesystem timestamps are coarse, and a change made
+    in the same tick as the last refresh would otherwise leave the mtime as it was
+    """
+    for folder in folders:
+        st = os.stat(folder)
+        os.utime(folder, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "library"
+    root.mkdir()
+    index = LibraryIndex(str(root), db_path=str(tmp_path / "library.db"))
+    yield root, index
+    index.close()
+
+
+def test_added_renamed_and_deleted_files_are_picked_up(library):
+    root, index = library
+    write_mp3(str(root / "Artist" / "Artist - Song.mp3"))
+    assert index.refresh()["added"] == 1
+    assert index.lookup("Artist", "Song") == str(root / "Artist" / "Artist - Song.mp3")
+
+    os.rename(root / "Artist" / "Artist - Song.mp3", root / "Artist" / "Artist - Other Song.mp3")
+    changed(root / "Artist")
+    stats = index.refresh()
+    assert (stats["added"], stats["removed"]) == (1, 1)
+    assert index.lookup("Artist", "Song") is None
+    assert index.lookup("artist", "other song") == str(root / "Artist" / "Artist - Other Song.mp3")
+
+    os.remove(root / "Artist" / "Artist - Other Song.mp3")
+    changed(root / "Artist")
+    assert index.refresh()["removed"] == 1
+    assert index.count() == 0
+
+
+def test_added_renamed_and_deleted_folders_are_picked_up(library):
+    root, index = library
+    for song in ("One", "Two"):
+        write_mp3(str(root / "Artist" / "Album" / f"Artist - {song}.mp3"))
+    assert index.refresh()["added"] == 2
+
+    os.rename(root / "Artist", root / "Renamed")
+    changed(root)
+    stats = index.refresh()
+    assert (stats["added"], stats["removed"]) == (2, 2)
+    assert index.lookup("Artist", "One") == str(root / "Renamed" / "Album" / "Artist - One.mp3")
+
+    shutil.rmtree(root / "Renamed")
+    changed(root)
+    assert index.refresh()["removed"] == 2
+    assert index.count() == 0
+
+
+def test_unchanged_folders_are_not_listed_again(library):
+    root, index = library
+    for artist in ("A", "B", "C"):
+        write_mp3(str(root / artist / f"{artist} - Song.mp3"))
+    assert index.refresh()["dirs_scanned"] == 4
+
+    stats = index.refresh()
+    assert (stats["dirs_scanned"], stats["dirs_skipped"]) == (0, 4)
+
+    write_mp3(str(root / "B" / "B - New Song.mp3"))
+    changed(root / "B")
+    stats = index.refresh()
+    assert (stats["dirs_scanned"], stats["dirs_skipped"], stats["added"]) == (1, 3, 1)
+    assert index.lookup("B", "New Song")
+
+
+def test_files_retagged_in_place_need_a_full_rescan(library):
+    root, index = library
+    path = str(root / "Artist" / "track01.mp3")
+    write_mp3(path, "Artist", "Song")
+    index.refresh()
+
+    write_mp3(path, "Artist", "Retagged Song")
+    # The folder listing did not change, so its files are not looked at
+    assert index.refresh()["updated"] == 0
+    assert index.lookup("Artist", "Retagged Song") is None
+    assert index.refresh(full=True)["updated"] == 1
+    assert index.lookup("Artist", "Retagged Song") == path
+
+
+def test_lookup_by_id3_artist_and_title(library):
+    root, index = library
+    path = str(root / "Unsorted" / "track01.mp3")
+    write_mp3(path, "Some Artist", "Some Song")
+    index.refresh()
+
+    assert index.lookup("some artist", "SOME SONG") == path
+    assert index.lookup("Some Artist", "Another Song") is None
+
+
+def test_file_deleted_since_the_refresh_is_not_returned(library):
+    root, index = library
+    path = str(root / "Artist" / "Artist - Song.mp3")
+    write_mp3(path)
+    index.add(path)
+    assert index.count() == 1
+
+    os.remove(path)
+    assert index.lookup("Artist", "Song") is None
+    assert index.count() == 0
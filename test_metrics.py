@@ -0,0 +1,110 @@
+import os
+import re
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, Registry
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """
+    Parse Prometheus text exposition
+
+    Returns:
+        tuple: ({name: (help, type)}, {(sample name, frozenset of label pairs): value})
+    """
+    assert text.endswith("\n")
+    described, samples = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, help_text = line[len("# HELP "):].split(" ", 1)
+            described[name] = (help_text, None)
+        elif line.startswith("# TYPE "):
+            name, type_name = line[len("# TYPE "):].split(" ")
+            described[name] = (described[name][0], type_name)
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"not a sample line: {line!r}"
+            name, labels, value = match.groups()
+            pairs = LABEL.findall(labels or "")
+            # Every label was matched: nothing but the pairs and their separators
+            assert ",".join(f'{k}="{v}"' for k, v in pairs) == (labels or "")
+            samples[(name, frozenset(pairs))] = float(value)
+    return described, samples
+
+
+def test_exposition_parses_back_to_the_recorded_values():
+    registry = Registry()
+    counter = registry.register(Counter("test_events_total", "Events seen", ("kind",)))
+    histogram = registry.register(Histogram("test_latency_seconds", "Latency", ("stage",), buckets=(0.1, 1)))
+    counter.inc(kind="a")
+    counter.inc(2, kind='say "hi"\n\\')
+    for seconds in (0.05, 0.5, 0.5, 5):
+        histogram.observe(seconds, stage="download")
+
+    described, samples = parse(registry.render())
+    assert described == {"test_events_total": ("Events seen", "counter"),
+                         "test_latency_seconds": ("Latency", "histogram")}
+    assert samples[("test_events_total", frozenset({("kind", "a")}))] == 1
+    # Quotes, newlines and backslashes in label values are escaped
+    assert samples[("test_events_total", frozenset({("kind", 'say \\"hi\\"\\n\\\\')}))] == 2
+
+    def bucket(le):
+        return samples[("test_latency_seconds_bucket", frozenset({("stage", "download"), ("le", le)}))]
+
+    # Buckets are cumulative, ending with +Inf
+    assert (bucket("0.1"), bucket("1"), bucket("+Inf")) == (1, 3, 4)
+    assert samples[("test_latency_seconds_sum", frozenset({("stage", "download")}))] == 6.05
+    assert samples[("test_latency_seconds_count", frozenset({("stage", "download")}))] == 4
+
+
+def test_metrics_without_samples_are_still_described():
+    registry = Registry()
+    registry.register(Counter("test_unused_total", "Never incremented"))
+    described, samples = parse(registry.render())
+    assert described == {"test_unused_total": ("Never incremented", "counter")}
+    assert samples == {}
+
+
+def test_timed_counts_failures():
+    stage = "test_stage"
+    before = metrics.STAGE_TOTAL.value(stage=stage), metrics.STAGE_FAILURES.value(stage=stage)
+    with metrics.timed(stage):
+        pass
+    with metrics.timed(stage) as record:
+        record.mark_failed()
+    with pytest.raises(RuntimeError), metrics.timed(stage):
+        raise RuntimeError("stage failed")
+
+    assert metrics.STAGE_TOTAL.value(stage=stage) == before[0] + 3
+    assert metrics.STAGE_FAILURES.value(stage=stage) == before[1] + 2
+
+
+def test_textfile_is_replaced_in_one_step(monkeypatch, tmp_path):
+    registry = Registry()
+    registry.register(Counter("test_events_total", "Events seen", ("kind",))).inc(kind="a")
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    path = tmp_path / "textfile" / "mp3dl.prom"
+    path.parent.mkdir()
+    path.write_text("previous\n")
+    replaced = []
+    replace = os.replace
+
+    def checked_replace(source, destination):
+        # Up to the rename the collector still reads the previous file whole
+        assert path.read_text() == "previous\n"
+        assert open(source, encoding="utf-8").read() == registry.render()
+        replaced.append((source, destination))
+        replace(source, destination)
+
+    monkeypatch.setattr(os, "replace", checked_replace)
+    metrics.write_textfile(str(path))
+
+    assert [destination for _, destination in replaced] == [str(path)]
+    assert path.read_text() == registry.render()
+    # No temporary file is left behind
+    assert os.listdir(path.parent) == ["mp3dl.prom"]
@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+from prefetch import Prefetcher
+
+
+class Lookup:
+    """A lookup that counts its calls and, while blocked, waits before answering"""
+
+    def __init__(self, blocked=False):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not blocked:
+            self.release.set()
+
+    def __call__(self, key):
+        self.calls.append(key)
+        self.started.set()
+        self.release.wait(5)
+        return f"result {key}"
+
+
+@pytest.fixture
+def prefetcher():
+    prefetcher = Prefetcher(workers=1, max_entries=2)
+    yield prefetcher
+    prefetcher.close()
+
+
+def test_finished_lookup_is_reused(prefetcher):
+    lookup = Lookup()
+    future = prefetcher.submit("a", lookup, "a")
+    future.result(5)
+
+    assert prefetcher.submit("a", lookup, "a") is future
+    assert prefetcher.get("a", lookup, "a") == "result a"
+    assert lookup.calls == ["a"]
+
+
+def test_lookup_in_flight_is_waited_for_instead_of_repeated(prefetcher):
+    lookup = Lookup(blocked=True)
+    prefetcher.submit("a", lookup, "a")
+    threading.Timer(0.1, lookup.release.set).start()
+
+    assert prefetcher.get("a", lookup, "a") == "result a"
+    assert lookup.calls == ["a"]
+
+
+def test_failed_lookup_is_repeated_in_the_menu(prefetcher):
+    def failing(key):
+        raise ConnectionError(key)
+
+    prefetcher.submit("a", failing, "a").exception(5)
+    lookup = Lookup()
+    assert prefetcher.get("a", lookup, "a") == "result a"
+    assert lookup.calls == ["a"]
+
+
+def test_least_recently_used_lookup_is_evicted(prefetcher):
+    lookup = Lookup()
+    for key in ("a", "b"):
+        prefetcher.submit(key, lookup, key).result(5)
+    # a is used again, so b is the least recently used when c comes in
+    prefetcher.get("a", lookup, "a")
+    prefetcher.submit("c", lookup, "c").result(5)
+
+    assert prefetcher.get("a", lookup, "a") == "result a"
+    assert prefetcher.get("b", lookup, "b") == "result b"
+    # Only b, evicted, was looked up twice
+    assert lookup.calls == ["a", "b", "c", "b"]
+
+
+def test_evicted_lookup_not_started_yet_is_cancelled(prefetcher):
+    running = Lookup(blocked=True)
+    prefetcher.submit("a", running, "a")
+    assert running.started.wait(5)
+    pending = prefetcher.submit("b", Lookup(), "b")
+    prefetcher.submit("c", Lookup(), "c")
+    # The single worker is still on a, so b has not started when d evicts it
+    prefetcher.submit("d", Lookup(), "d")
+    running.release.set()
+
+    assert pending.cancelled()
+
+
+def test_cancel_drops_pending_lookups_and_their_follow_ups(prefetcher):
+    listing = Lookup(blocked=True)
+    follow_ups = []
+    future = prefetcher.submit("albums", listing, "albums")
+    assert listing.started.wait(5)
+    pending = prefetcher.submit("tracks", Lookup(), "tracks")
+    prefetcher.then(future, follow_ups.append)
+
+    # The user moved on while the listing was still running
+    prefetcher.cancel()
+    listing.release.set()
+    assert future.result(5) == "result albums"
+
+    assert pending.cancelled()
+    assert follow_ups == []
+    # The finished listing stays cached
+    assert prefetcher.get("albums", listing, "albums") == "result albums"
+    assert listing.calls == ["albums"]
+
+
+def test_follow_ups_of_the_current_generation_run(prefetcher):
+    done = threading.Event()
+    follow_ups = []
+
+    def follow_up(result):
+        follow_ups.append(result)
+        done.set()
+
+    prefetcher.then(prefetcher.submit("albums", Lookup(), "albums"), follow_up)
+    assert done.wait(5)
+    assert follow_ups == ["result albums"]
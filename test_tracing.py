@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture(autouse=True)
+def tracing_enabled(monkeypatch):
+    # Switched off again after each test, so other tests do not record spans
+    monkeypatch.setattr(tracing, "_enabled", False)
+    tracing.enable()
+
+
+def record_spans(count):
+    for i in range(count):
+        now = time.perf_counter()
+        tracing.add_span("stage", now, now, index=i)
+
+
+def test_spans_beyond_the_buffer_are_flushed_and_written(monkeypatch, tmp_path):
+    monkeypatch.setattr(tracing, "TRACE_BUFFER_EVENTS", 10)
+    record_spans(35)
+    assert len(tracing._events) < 10
+
+    path = tmp_path / "trace.json"
+    assert tracing.write(str(path)) == 35
+    record_spans(5)
+    assert tracing.write(str(path)) == 40
+
+    events = json.loads(path.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    assert [span["args"]["index"] for span in spans] == list(range(35)) + list(range(5))
+
+
+def test_each_thread_gets_its_own_tid(tmp_path):
+    threads = [threading.Thread(target=record_spans, args=(1,), name=f"worker-{i}") for i in range(5)]
+    # Run one after another, so finished threads' idents are free to be reused
+    for thread in threads:
+        thread.start()
+        thread.join()
+
+    path = tmp_path / "trace.json"
+    tracing.write(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    names = {event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"}
+    assert sorted(names.values()) == [f"worker-{i}" for i in range(5)]
+    assert sorted(event["tid"] for event in events if event["ph"] == "X") == sorted(names)
+
+
+def spans_written(tmp_path):
+    path = tmp_path / "trace.json"
+    tracing.write(str(path))
+    return [event for event in json.loads(path.read_text())["traceEvents"] if event["ph"] == "X"]
+
+
+def test_nothing_is_recorded_while_disabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(tracing, "_enabled", False)
+    record_spans(3)
+    with tracing.span("stage"):
+        pass
+    assert tracing._events == []
+    assert spans_written(tmp_path) == []
+
+
+def test_spans_in_a_track_context_are_labelled_with_the_track(tmp_path):
+    with tracing.track_context("Artist - Song", "track_download"):
+        with tracing.span("download"):
+            pass
+    with tracing.span("after"):
+        pass
+
+    spans = {span["name"]: span for span in spans_written(tmp_path)}
+    assert spans["download"]["args"] == {"track": "Artist - Song"}
+    # The whole block is one span, enclosing the ones recorded inside it
+    outer = spans["track_download"]
+    assert outer["args"] == {"track": "Artist - Song"}
+    assert outer["ts"] <= spans["download"]["ts"]
+    assert spans["download"]["ts"] + spans["download"]["dur"] <= outer["ts"] + outer["dur"] + 0.2
+    assert spans["after"]["args"] == {}
@@ -0,0 +1,91 @@
+"""
+Shared title and filename normalization
+Precompiled patterns with memoized results, used for file naming, matching
+downloaded files and de-duplicating song lists. The same strings are normalized
+many times per track, so repeated calls are served from the cache.
+"""
+
+import re
+from functools import lru_cache
+
+CACHE_SIZE = 65536
+
+# One pass is enough for filenames: every character the old "invalid characters"
+# pass removed (<>:"/\|?*) is also outside the set of characters that are kept
+_FILENAME_DISALLOWED = re.compile(r'[^\w\s\-_\.]')
+
+# YouTube title noise, applied in order. These stay separate passes because
+# merging them changes the result for titles with several bracket groups.
+# Each pass is skipped when the literal it needs is not in the title.
+_TITLE_PASSES = (
+    ('[', re.compile(r'\[.*?\]')),                 # [Official Video], [Lyrics], etc.
+    ('(', re.compile(r'\(.*?[Oo]fficial.*?\)')),   # (Official Video), etc.
+    ('(', re.compile(r'\(.*?[Vv]ideo.*?\)')),      # (Video), (Music Video), etc.
+    ('(', re.compile(r'\(.*?[Ll]yrics.*?\)')),     # (Lyrics), (With Lyrics), etc.
+    ('(', re.compile(r'\(.*?[Aa]udio.*?\)')),      # (Audio), (Official Audio), etc.
+    ('|', re.compile(r'\|.*')),                    # Everything after |
+    ('-', re.compile(r'-.*[Yy]ou[Tt]ube.*')),      # "- YouTube" and similar
+    (None, re.compile(r'HD$|4K$')),                # HD, 4K suffixes
+)
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def clean_filename(filename):
+    """Clean filename to remove invalid characters"""
+    # Keep only alphanumeric, spaces, hyphens, underscores, dots
+    return _FILENAME_DISALLOWED.sub('', filename).strip()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def match_key(name):
+    """
+    Key for comparing names: two names with the same key produce the same file
+    (also on case-insensitive filesystems)
+    """
+    return clean_filename(name).lower()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def clean_video_title(title):
+    """
+    Clean up a YouTube video title to make it suitable as a song name
+
+    Args:
+        title (str): Original video title
+
+    Returns:
+        str: Cleaned song name
+    """
+    for anchor, pattern in _TITLE_PASSES:
+        if anchor is None or anchor in title:
+            title = pattern.sub('', title)
+    title = _WHITESPACE.sub(' ', title)  # Normalize whitespace
+    title = title.strip(' -')  # Remove leading/trailing spaces and dashes
+
+    return title if title else "Unknown Title"
+
+
+def _batch(function, values):
+    # Normalize each distinct value once, then map the whole list through the results
+    results = {value: function(value) for value in dict.fromkeys(values)}
+    return [results[value] for value in values]
+
+
+def clean_video_titles(titles):
+    """Batch version of clean_video_title; repeated titles are only normalized once"""
+    return _batch(clean_video_title, titles)
+
+
+def clean_filenames(names):
+    """Batch version of clean_filename; repeated names are only normalized once"""
+    return _batch(clean_filename, names)
+
+
+def cache_info():
+    """Hit/miss statistics of the normalization caches"""
+    return {
+        "clean_filename": clean_filename.cache_info(),
+        "match_key": match_key.cache_info(),
+        "clean_video_title": clean_video_title.cache_info(),
+    }
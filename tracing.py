@@ -0,0 +1,163 @@
+"""
+Per-track trace profiling (--trace)
+Records a span for every pipeline stage of every track, tagged with the thread
+(worker) it ran on, and writes them as Chrome Trace Event JSON for Perfetto
+(https://ui.perfetto.dev) or chrome://tracing.
+
+At most TRACE_BUFFER_EVENTS spans are kept in memory; older ones are flushed
+to a temporary file, so a job service traced for days does not grow without
+bound. write copies them into the trace file.
+"""
+
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from config import TRACE_BUFFER_EVENTS
+except ImportError:
+    TRACE_BUFFER_EVENTS = 10000
+
+_lock = threading.Lock()
+_events = []
+_spill = None
+_span_count = 0
+_generation = 0
+_thread_counter = itertools.count(1)
+_enabled = False
+_origin = time.perf_counter()
+_context = threading.local()
+
+
+def enable():
+    """Start recording spans (off by default so normal runs pay nothing)"""
+    global _enabled, _origin, _spill, _span_count, _generation, _thread_counter
+    with _lock:
+        _events.clear()
+        if _spill is not None:
+            _spill.close()
+        _spill = None
+        _span_count = 0
+        # Threads number themselves again from 1 on their next span
+        _generation += 1
+        _thread_counter = itertools.count(1)
+        _origin = time.perf_counter()
+        _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def _thread_id():
+    # Called with _lock held; Perfetto wants small integer tids plus a name record.
+    # Kept per thread rather than by thread.ident, which a new thread can reuse
+    if getattr(_context, "generation", None) != _generation:
+        _context.generation = _generation
+        _context.tid = next(_thread_counter)
+        _events.append({
+            "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": _context.tid,
+            "args": {"name": threading.current_thread().name},
+        })
+    return _context.tid
+
+
+def _flush():
+    # Called with _lock held: move the buffered events to the spill file, one JSON object per line
+    global _spill
+    if _spill is None:
+        _spill = tempfile.TemporaryFile("w+", encoding="utf-8", prefix="trace-")
+    _spill.writelines(json.dumps(event) + "\n" for event in _events)
+    _events.clear()
+
+
+def add_span(name, start, end, **args):
+    """
+    Record a finished span
+
+    Args:
+        name (str): Stage name
+        start (float): time.perf_counter() at the start of the stage
+        end (float): time.perf_counter() at the end of the stage
+        **args: Extra fields shown in the trace viewer
+    """
+    if not _enabled:
+        return
+    track = getattr(_context, "track", None)
+    if track and "track" not in args:
+        args["track"] = track
+    global _span_count
+    with _lock:
+        _events.append({
+            "name": name,
+            "cat": "pipeline",
+            "ph": "X",
+            "ts": round((start - _origin) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": _thread_id(),
+            "args": args,
+        })
+        _span_count += 1
+        if len(_events) >= TRACE_BUFFER_EVENTS:
+            _flush()
+
+
+@contextmanager
+def span(name, **args):
+    """Record the enclosed block as a span"""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, start, time.perf_counter(), **args)
+
+
+@contextmanager
+def track_context(track_name, span_name="track"):
+    """
+    Label every span recorded by this thread inside the block with a track name,
+    and record the whole block as one span (e.g. 'track_search', 'track_download').
+    """
+    previous = getattr(_context, "track", None)
+    _context.track = track_name
+    try:
+        with span(span_name):
+            yield
+    finally:
+        _context.track = previous
+
+
+def write(path):
+    """
+    Write all recorded spans as Chrome Trace Event JSON (in the order they
+    finished; trace viewers sort them by time)
+
+    Returns:
+        int: Number of spans written
+    """
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    with _lock, open(path, "w", encoding="utf-8") as f:
+        f.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        first = True
+        if _spill is not None:
+            _spill.seek(0)
+            for line in _spill:
+                f.write(("" if first else ",\n") + line.rstrip("\n"))
+                first = False
+            # Later spans are appended after the ones just copied
+            _spill.seek(0, os.SEEK_END)
+        for event in _events:
+            f.write(("" if first else ",\n") + json.dumps(event))
+            first = False
+        f.write("\n]}\n")
+        return _span_count
@@ -0,0 +1,232 @@
+"""
+Output profiles and single-decode transcoding
+A profile is a format + quality + destination root, e.g. a 320K archive copy
+next to a 128K mobile copy. With more than one profile the source audio is
+downloaded once, without yt-dlp's own conversion, and a single ffmpeg run
+decodes it once and encodes it for every profile.
+
+A profile's quality may be "auto": the bitrate is then chosen per download
+from the source stream yt-dlp selected (its abr and codec from the extraction
+info), as the lowest standard bitrate that keeps the source's quality, within
+AUTO_QUALITY_FLOOR..AUTO_QUALITY_CEILING. Upsampling a 128 kbps Opus stream to
+320 kbps MP3 costs CPU and disk without any audible gain.
+"""
+
+import os
+import re
+import shlex
+
+try:
+    from config import AUDIO_QUALITY
+except ImportError:
+    AUDIO_QUALITY = "192K"
+
+try:
+    from config import AUTO_QUALITY_FLOOR, AUTO_QUALITY_CEILING
+except ImportError:
+    AUTO_QUALITY_FLOOR = "128K"
+    AUTO_QUALITY_CEILING = "320K"
+
+try:
+    from config import OUTPUT_PROFILES, FFMPEG_COMMAND
+except ImportError:
+    OUTPUT_PROFILES = None
+    FFMPEG_COMMAND = None
+
+# Environment variable takes precedence (used by the offline benchmarks)
+FFMPEG_COMMAND = os.getenv("FFMPEG_COMMAND") or FFMPEG_COMMAND
+
+try:
+    import mutagen
+    from mutagen.easyid3 import EasyID3
+    from mutagen.id3 import ID3
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+# ffmpeg encoder per output format
+CODECS = {"mp3": "libmp3lame", "m4a": "aac", "opus": "libopus", "ogg": "libvorbis", "flac": "flac"}
+
+# Bitrates "auto" quality chooses from
+AUTO_BITRATES_KBPS = (96, 112, 128, 160, 192, 224, 256, 320)
+
+# Bitrate an MP3 needs for the quality of one kbps of each codec (by yt-dlp acodec
+# prefix or output format): Opus and AAC sound as good as MP3 at lower bitrates
+CODEC_EFFICIENCY = {"opus": 1.25, "mp4a": 1.1, "aac": 1.1, "m4a": 1.1, "vorbis": 1.1, "ogg": 1.1, "mp3": 1.0}
+
+# Extraction info of the selected source, written by yt-dlp next to the download
+SOURCE_FORMAT_TEMPLATE = "%(abr)s %(acodec)s"
+
+
+def load_profiles(profiles=None):
+    """
+    Validated output profiles, primary first
+
+    Args:
+        profiles (list, optional): Dicts with "name", "format", "quality" and "root"
+            (default: OUTPUT_PROFILES, or a single MP3 profile at AUDIO_QUALITY)
+
+    Returns:
+        list: Profile dicts with every key set. The primary profile is the library:
+            it is always MP3 and written to the download folder (its root is ignored)
+
+    Raises:
+        ValueError: For an unknown format, a non-MP3 primary profile, a missing root or duplicate names
+    """
+    profiles = profiles if profiles is not None else OUTPUT_PROFILES
+    if not profiles:
+        return [{"name": "default", "format": "mp3", "quality": AUDIO_QUALITY, "root": None}]
+
+    loaded = []
+    for index, profile in enumerate(profiles):
+        audio_format = profile.get("format", "mp3").lower()
+        name = profile.get("name") or f"{audio_format}-{profile.get('quality', AUDIO_QUALITY)}"
+        name = re.sub(r'[^0-9A-Za-z_.-]', '_', name)
+        if audio_format not in CODECS:
+            raise ValueError(f"Output profile {name}: unsupported format {audio_format!r} "
+                             f"(use one of {', '.join(CODECS)})")
+        if index == 0 and audio_format != "mp3":
+            raise ValueError(f"Output profile {name}: the first (library) profile must be mp3")
+        root = profile.get("root")
+        if index and not root:
+            raise ValueError(f"Output profile {name}: a root folder is required for every profile but the first")
+        if any(other["name"] == name for other in loaded):
+            raise ValueError(f"Output profile {name}: duplicate name")
+        loaded.append({
+            "name": name,
+            "format": audio_format,
+            "quality": str(profile.get("quality", AUDIO_QUALITY)),
+            "root": os.path.expanduser(root) if root and index else None,
+        })
+    return loaded
+
+
+def is_auto(quality):
+    return str(quality).strip().lower() == "auto"
+
+
+def has_auto(profiles):
+    """Whether any profile's bitrate is chosen per download from the source"""
+    return any(is_auto(profile["quality"]) for profile in profiles)
+
+
+def _kbps(quality):
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*[kK]?\s*', str(quality))
+    if not match:
+        raise ValueError(f"Not a bitrate: {quality!r} (use e.g. 128K)")
+    return float(match.group(1))
+
+
+def _efficiency(codec):
+    codec = (codec or "").lower()
+    return next((value for prefix, value in CODEC_EFFICIENCY.items() if codec.startswith(prefix)), 1.0)
+
+
+def parse_source_format(text):
+    """
+    (abr in kbit/s, acodec) of the source from SOURCE_FORMAT_TEMPLATE output; either
+    is None when yt-dlp doesn't know it ("NA")
+    """
+    parts = (text or "").split()
+    try:
+        abr = float(parts[0]) or None
+    except (IndexError, ValueError):
+        abr = None
+    codec = parts[1] if len(parts) > 1 and parts[1] not in ("NA", "none") else None
+    return abr, codec
+
+
+def auto_quality(source_kbps, source_codec=None, audio_format="mp3",
+                 floor=AUTO_QUALITY_FLOOR, ceiling=AUTO_QUALITY_CEILING):
+    """
+    Lowest bitrate of AUTO_BITRATES_KBPS that does not drop below the source's quality
+
+    Args:
+        source_kbps (float): Source bitrate, or None if unknown (the ceiling is used)
+        source_codec (str, optional): Source codec as yt-dlp reports it (e.g. "opus", "mp4a.40.2")
+        audio_format (str): Output format
+
+    Returns:
+        str: Quality such as "160K", within floor..ceiling
+    """
+    floor_kbps, ceiling_kbps = _kbps(floor), _kbps(ceiling)
+    if not source_kbps:
+        return f"{ceiling_kbps:g}K"
+    needed = source_kbps * _efficiency(source_codec) / _efficiency(audio_format)
+    target = next((rate for rate in AUTO_BITRATES_KBPS if rate >= needed), ceiling_kbps)
+    return f"{min(max(target, floor_kbps), ceiling_kbps):g}K"
+
+
+def resolve_auto(profiles, source_kbps, source_codec=None):
+    """
+    Profiles with "auto" qualities replaced by the bitrate chosen for this source;
+    those carry "auto": True
+    """
+    return [
+        dict(profile, quality=auto_quality(source_kbps, source_codec, profile["format"]), auto=True)
+        if is_auto(profile["quality"]) else profile
+        for profile in profiles
+    ]
+
+
+def auto_saved_bytes(profile, output_bytes):
+    """Disk an output encoded at an auto bitrate saved compared to AUTO_QUALITY_CEILING"""
+    if not profile.get("auto") or profile["format"] == "flac":
+        return 0
+    kbps = _kbps(profile["quality"])
+    return int(output_bytes * (_kbps(AUTO_QUALITY_CEILING) - kbps) / kbps)
+
+
+def ffmpeg_command():
+    """ffmpeg invocation (configurable so a stand-in can be swapped in)"""
+    return shlex.split(FFMPEG_COMMAND) if FFMPEG_COMMAND else ["ffmpeg"]
+
+
+def quality_args(profile):
+    """ffmpeg options for a profile's quality: "320K" -> -b:a 320k, VBR level "2" -> -q:a 2"""
+    if profile["format"] == "flac":
+        return []
+    quality = profile["quality"].strip()
+    if re.fullmatch(r'\d', quality):
+        return ["-q:a", quality]
+    return ["-b:a", quality.lower()]
+
+
+def encode_command(source, outputs):
+    """
+    ffmpeg command that decodes source once and encodes it into every output
+
+    Args:
+        source (str): Downloaded source audio
+        outputs (list): (profile, path) pairs
+
+    Returns:
+        list: Command line
+    """
+    cmd = ffmpeg_command() + ["-hide_banner", "-nostdin", "-y", "-i", source]
+    for profile, path in outputs:
+        cmd += ["-map", "0:a:0", "-map_metadata", "-1", "-c:a", CODECS[profile["format"]]]
+        cmd += quality_args(profile) + [path]
+    return cmd
+
+
+def copy_tags(tagged_mp3, destination):
+    """
+    Give another output of the same track the tags of a tagged MP3: every ID3
+    frame for MP3s, the common text tags (artist, title, album...) for other formats
+    """
+    if not MUTAGEN_AVAILABLE:
+        return
+    if destination.lower().endswith(".mp3"):
+        ID3(tagged_mp3).save(destination)
+        return
+    tags = EasyID3(tagged_mp3)
+    audio = mutagen.File(destination, easy=True)
+    if audio is None:
+        return
+    if audio.tags is None:
+        audio.add_tags()
+    for key in ("artist", "title", "album", "albumartist", "date", "genre", "tracknumber"):
+        if key in tags:
+            audio[key] = tags[key]
+    audio.save()